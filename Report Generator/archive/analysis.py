@@ -1,22 +1,123 @@
-import re
 from collections import defaultdict
 from pathlib import Path
-from typing import Dict, List, Tuple
-from files_utils import find_java_files
-from parser import parse_files
+from typing import Dict, Iterable, Iterator, List, Tuple
+from matcher import AhoCorasick
+from parser import SQL_ARGUMENT_METHODS, assemble_sql, find_create_table
+from scan import FileScan
+from sql_tokenizer import analyze_sql, canonical_sql, fingerprint
+from symbols import SymbolTable
+
+
+def build_symbol_table(scans: List[FileScan]) -> SymbolTable:
+    symbols = SymbolTable()
+    for scan in scans:
+        symbols.add_file(str(scan.path), scan.package, scan.constants)
+    return symbols
 
 
 def find_create_table_statements(
-    project_dir: Path,
+    scans: Iterable[FileScan],
+    symbols: SymbolTable,
 ) -> Tuple[Dict[str, Tuple[Path, int]], Dict[str, List[str]]]:
-    java_files = find_java_files(project_dir)
-    return parse_files(java_files)
+    results_dict = {}
+    tables_columns = {}
+    for scan in scans:
+        file = str(scan.path)
+        for class_path, parts, fallback_line in scan.sql_calls:
+            context = (file, scan.package, class_path)
+            sql, line = assemble_sql(
+                parts, fallback_line, lambda name: symbols.resolve(context, name)
+            )
+            found = find_create_table(sql) if sql else None
+            if found:
+                table, columns = found
+                results_dict[table] = (scan.path, line if line is not None else 1)
+                tables_columns[table] = columns
+    print(f"Found {len(results_dict)} tables")
+    return results_dict, tables_columns
+
+
+def iter_query_references(
+    scans: Iterable[FileScan],
+    tables: List[str],
+    symbols: SymbolTable,
+    table_columns: Dict[str, List[str]],
+) -> Iterator[Tuple[Dict, List[Tuple[str, List[str]]]]]:
+    """
+    Every DB call of the scans as a query, with the tables it uses and for
+    each of them the columns it uses, one call at a time.
+
+    A query is {'type': str, 'file': Path, 'line': int, 'snippet': str,
+    'complexity': int, 'statement': str, 'fingerprint': str}, statement
+    being the canonical SQL of the call (its line without SQL) and
+    fingerprint the same for every query with the same statement.
+    """
+    # A line uses a table or a column if its name is in the line, or in the
+    # value of a constant used by the line (e.g. a whole SQL statement). The
+    # names are all found in one pass over a text, and the constants are
+    # resolved in their class by the symbol table.
+    patterns = set(tables)
+    for t in tables:
+        patterns.update(table_columns.get(t, []))
+    matcher = AhoCorasick(patterns)
+    names_in_value = {}
+
+    for scan in scans:
+        file_path = scan.path
+        file = str(file_path)
+        # The DB calls were already found by the scan of the file
+        for line_number, stripped_line, method, class_path, parts in scan.db_calls:
+            # Classify the query from its SQL when the call has one, the
+            # line itself otherwise. A statement built from the arguments
+            # of the call is only known with the name of its table.
+            context = (file, scan.package, class_path)
+            sql, _ = assemble_sql(
+                parts, line_number, lambda name: symbols.resolve(context, name)
+            )
+            info = analyze_sql(sql) if sql else None
+            if (
+                info is not None
+                and info.type is not None
+                and (info.tables or method in SQL_ARGUMENT_METHODS)
+            ):
+                query_type, complexity = info.type, info.complexity
+                # Call sites running the same statement share it
+                statement = canonical_sql(sql)
+            else:
+                query_type = classify_query_type(stripped_line, method)
+                complexity = compute_query_complexity(stripped_line)
+                statement = stripped_line
+            query = {
+                "type": query_type,
+                "file": file_path,
+                "line": line_number,
+                "snippet": stripped_line,
+                "complexity": complexity,
+                "statement": statement,
+                "fingerprint": fingerprint(statement),
+            }
+
+            # Every table and column name occurring in the line or in the
+            # constants it uses
+            found = matcher.find_all(stripped_line)
+            for value in symbols.values_in(context, stripped_line):
+                if value not in names_in_value:
+                    names_in_value[value] = matcher.find_all(value)
+                found |= names_in_value[value]
+
+            # Tables used directly or via constants, and their columns
+            used = [
+                (table, [col for col in table_columns.get(table, []) if col in found])
+                for table in tables
+                if table in found
+            ]
+            yield query, used
 
 
 def find_table_references(
-    project_dir: Path,
+    scans: Iterable[FileScan],
     tables: List[str],
-    constants_map: Dict[str, str],
+    symbols: SymbolTable,
     table_columns: Dict[str, List[str]],
 ) -> Tuple[
     Dict[str, List[Tuple[Path, int, str]]],
@@ -36,101 +137,34 @@ def find_table_references(
       queries: A list of dictionaries with info about each query:
                {'type': str, 'file': Path, 'line': int, 'snippet': str, 'complexity': int}
     """
-    java_methods = [
-        "execSQL",
-        "rawQuery",
-        "query",
-        "insert",
-        "update",
-        "delete",
-        "replace",
-        "compileStatement",
-        "execute",
-        "prepareStatement",
-        "executeQuery",
-    ]
-    create_pattern = re.compile(r"CREATE\s+TABLE", re.IGNORECASE)
-    table_references = defaultdict(list)
-    column_references = {t: defaultdict(list) for t in tables}
+    return collect_references(
+        iter_query_references(scans, tables, symbols, table_columns), tables
+    )
 
-    # Precompute column map
-    # column_map is not needed now because we do direct checks per table
-    # We'll rely on scanning line for column references after table is found.
 
+def collect_references(
+    query_references: Iterable[Tuple[Dict, List[Tuple[str, List[str]]]]],
+    tables: List[str],
+) -> Tuple[
+    Dict[str, List[Tuple[Path, int, str]]],
+    Dict[str, Dict[str, List[Tuple[Path, int, str]]]],
+    List[Dict],
+]:
+    """
+    Table and column references and queries, as returned by
+    find_table_references, of the results of iter_query_references.
+    """
+    table_references = defaultdict(list)
+    column_references = {t: defaultdict(list) for t in tables}
     queries = []
 
-    for file_path in project_dir.rglob("*.java"):
-        try:
-            lines = file_path.read_text(encoding="utf-8").splitlines()
-            for i, line in enumerate(lines):
-                stripped_line = line.strip()
-
-                # Skip comment lines
-                if (
-                    stripped_line.startswith("//")
-                    or stripped_line.startswith("/*")
-                    or stripped_line.startswith("*/")
-                    or stripped_line.startswith("*")
-                ):
-                    continue
-
-                # Skip lines that define the table (not a usage)
-                if create_pattern.search(stripped_line):
-                    continue
-
-                # Check if line calls a known DB method
-                called_methods = [m for m in java_methods if m in stripped_line]
-                if called_methods:
-                    # Consider the first matched method as indicative of query type
-                    # (Heuristic: usually only one DB method call per line)
-                    method = called_methods[0]
-                    # Classify query
-                    qtype = classify_query_type(stripped_line, method)
-                    complexity = compute_query_complexity(stripped_line)
-                    queries.append(
-                        {
-                            "type": qtype,
-                            "file": file_path,
-                            "line": i + 1,
-                            "snippet": stripped_line,
-                            "complexity": complexity,
-                        }
-                    )
-
-                    # Check table usage
-                    for table in tables:
-                        # Check table name or any constant referencing it
-                        table_used = False
-                        if (table in stripped_line) or any(
-                            (
-                                const in stripped_line
-                                for const, literal in constants_map.items()
-                                if literal == table
-                            )
-                        ):
-                            table_references[table].append(
-                                (file_path, i + 1, stripped_line)
-                            )
-                            table_used = True
-
-                        if table_used:
-                            # Check columns usage
-                            for col in table_columns.get(table, []):
-                                # Direct column usage or via constants?
-                                if col in stripped_line:
-                                    column_references[table][col].append(
-                                        (file_path, i + 1, stripped_line)
-                                    )
-                                else:
-                                    # Check constants for columns
-                                    for const, literal in constants_map.items():
-                                        if literal == col and const in stripped_line:
-                                            column_references[table][col].append(
-                                                (file_path, i + 1, stripped_line)
-                                            )
-                                            break
-        except UnicodeDecodeError:
-            pass  # skip files that cannot be decoded
+    for query, used in query_references:
+        queries.append(query)
+        reference = (query["file"], query["line"], query["snippet"])
+        for table, cols in used:
+            table_references[table].append(reference)
+            for col in cols:
+                column_references[table][col].append(reference)
 
     return table_references, column_references, queries
 
@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html import escape
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+MAIN_SCRIPT = Path(__file__).parent.resolve() / "main.py"
+
+
+def repo_name(repo: str) -> str:
+    # Last part of a path or URL, without .git
+    name = re.split(r"[/\\:]", repo.rstrip("/\\"))[-1]
+    if name.endswith(".git"):
+        name = name[: -len(".git")]
+    return re.sub(r"[^\w.-]", "_", name) or "repo"
+
+
+def read_repo_list(path: Path) -> List[str]:
+    """
+    Repositories listed in a file, one per line. Empty lines and lines
+    starting with # are ignored.
+    """
+    with path.open("r", encoding="utf-8") as f:
+        return [
+            line.strip()
+            for line in f
+            if line.strip() and not line.strip().startswith("#")
+        ]
+
+
+def _kill(process: subprocess.Popen) -> None:
+    if hasattr(os, "killpg"):
+        os.killpg(process.pid, signal.SIGKILL)
+    else:
+        process.kill()
+    process.wait()
+
+
+def analyze_repository(
+    repo: str,
+    output_dir: Path,
+    timeout: Optional[float],
+    main_args: List[str],
+    paged: bool,
+) -> Dict:
+    """
+    Run main.py on one repository in its own process, with its output, its
+    clone and its log in output_dir.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report = output_dir / ("report" if paged else "report.html")
+    summary_path = output_dir / "summary.json"
+    summary_path.unlink(missing_ok=True)
+    command = [
+        sys.executable,
+        str(MAIN_SCRIPT),
+        "--repo",
+        repo,
+        "--clone-path",
+        str(output_dir / "repo_clone"),
+        "--output",
+        str(report),
+        "--summary",
+        str(summary_path),
+        *main_args,
+    ]
+    result = {"repo": repo, "output_dir": str(output_dir)}
+    start = time.perf_counter()
+    with (output_dir / "log.txt").open("w", encoding="utf-8") as log:
+        # In its own session, so a timeout also stops the scan processes
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        try:
+            returncode = process.wait(timeout=timeout)
+            result["status"] = "ok" if returncode == 0 else "failed"
+        except subprocess.TimeoutExpired:
+            _kill(process)
+            result["status"] = "timeout"
+    result["seconds"] = round(time.perf_counter() - start, 2)
+    if result["status"] == "ok" and summary_path.exists():
+        with summary_path.open("r", encoding="utf-8") as f:
+            result.update(json.load(f))
+        result["repo"] = repo
+    return result
+
+
+def write_index(output_dir: Path, results: List[Dict]) -> None:
+    with (output_dir / "summary.json").open("w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    with (output_dir / "index.html").open("w", encoding="utf-8") as f:
+        f.write("<html><head><meta charset='utf-8'>")
+        f.write("<title>Database Usage Reports</title></head><body>")
+        f.write("<h1>Database Usage Reports</h1>")
+        ok = sum(1 for r in results if r["status"] == "ok")
+        f.write(f"<p>{ok} of {len(results)} repositories analyzed.</p>")
+        f.write(
+            "<table border='1'><tr><th>Repository</th><th>Status</th>"
+            "<th>Time (s)</th><th>Files</th><th>Tables</th><th>Unused tables</th>"
+            "<th>Unused columns</th><th>Queries</th><th>Log</th></tr>"
+        )
+        for r in results:
+            relative_dir = Path(r["output_dir"]).relative_to(output_dir).as_posix()
+            repo_text = escape(r["repo"])
+            if "report" in r:
+                report = Path(r["report"])
+                if report.is_dir():
+                    report = report / "index.html"
+                href = quote(report.relative_to(output_dir).as_posix())
+                repo_text = f"<a href='{href}'>{repo_text}</a>"
+            f.write(f"<tr><td>{repo_text}</td><td>{r['status']}</td>")
+            f.write(f"<td>{r['seconds']}</td>")
+            for key in ("files", "tables", "unused_tables", "unused_columns"):
+                f.write(f"<td>{r.get(key, '')}</td>")
+            f.write(f"<td>{r.get('queries', '')}</td>")
+            f.write(f"<td><a href='{quote(relative_dir)}/log.txt'>log</a></td></tr>")
+        f.write("</table></body></html>")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Database usage reports of many repositories"
+    )
+    arg_parser.add_argument(
+        "repos",
+        nargs="*",
+        help="URLs of repositories to clone or paths of local checkouts",
+    )
+    arg_parser.add_argument(
+        "--repo-list",
+        type=Path,
+        help="file listing more repositories, one per line",
+    )
+    arg_parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=Path("database_usage_reports"),
+        help="one subdirectory per repository and a summary index "
+        "(default: database_usage_reports)",
+    )
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="number of repositories analyzed at the same time (default: 2)",
+    )
+    arg_parser.add_argument(
+        "--timeout",
+        type=float,
+        help="seconds after which the analysis of a repository is stopped",
+    )
+    arg_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="scan processes per repository (default: 1)",
+    )
+    arg_parser.add_argument(
+        "--cache",
+        type=Path,
+        help="directory of the scan and blame caches, one subdirectory per "
+        "repository",
+    )
+    arg_parser.add_argument(
+        "--filter",
+        help="partial clone filter of the cloned repositories, e.g. blob:none",
+    )
+    arg_parser.add_argument(
+        "--sparse-java",
+        action="store_true",
+        help="only check out the Java files of the cloned repositories",
+    )
+    arg_parser.add_argument("--paged", action="store_true")
+    args = arg_parser.parse_args()
+
+    repos = list(args.repos)
+    if args.repo_list:
+        repos += read_repo_list(args.repo_list)
+    if not repos:
+        arg_parser.error("no repository given")
+
+    output_dir = args.output_dir.resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Every repository gets its own directory, even with the same name
+    names = []
+    for repo in repos:
+        base = name = repo_name(repo)
+        suffix = 1
+        while name in names:
+            suffix += 1
+            name = f"{base}-{suffix}"
+        names.append(name)
+
+    def main_args(name: str) -> List[str]:
+        extra = ["--jobs", str(args.jobs)]
+        if args.paged:
+            extra.append("--paged")
+        if args.filter:
+            extra += ["--filter", args.filter]
+        if args.sparse_java:
+            extra.append("--sparse-java")
+        if args.cache:
+            cache_dir = str(args.cache.resolve() / name)
+            extra += ["--cache", cache_dir, "--blame-cache", cache_dir]
+        return extra
+
+    # A slow repository only holds its own worker, the others keep taking
+    # repositories from the queue
+    results = [None] * len(repos)
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {
+            executor.submit(
+                analyze_repository,
+                repo,
+                output_dir / name,
+                args.timeout,
+                main_args(name),
+                args.paged,
+            ): i
+            for i, (repo, name) in enumerate(zip(repos, names))
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            print(
+                f"{results[i]['status']}: {repos[i]} ({results[i]['seconds']}s)"
+            )
+
+    write_index(output_dir, results)
+    print(f"Summary written to {output_dir / 'index.html'}")
+    failed = [r for r in results if r["status"] != "ok"]
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+from analysis import (
+    build_symbol_table,
+    find_create_table_statements,
+    find_table_references,
+    find_unused_columns,
+    find_unused_tables,
+)
+from corpus import load_source_file
+from files_utils import find_java_files
+from git_operations import BlameService
+from paged_report import generate_paged_report
+from parser import Parser
+from profiling import peak_rss_kb, resource
+from report_generator import generate_html_report
+from scan import CALL_MATCHER, FileScan, locate_db_calls
+from symbols import class_scopes, extract_constant_definitions, read_package
+from synthetic_corpus import add_corpus_arguments, generate_corpus
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+ANALYSE_CODE = SCRIPT_DIR.parents[1] / "analyseCode.py"
+
+
+class PhaseTimer:
+    """
+    Wall time, throughput and peak RSS of the successive phases of a run.
+
+    The peak RSS of a phase is the peak of the process at the end of the
+    phase, so it only grows from one phase to the next.
+    """
+
+    def __init__(self, files: int, lines: int):
+        self.files = files
+        self.lines = lines
+        self.phases: Dict[str, Dict] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        print(f"Running {name}...")
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        self.phases[name] = {
+            "seconds": round(seconds, 4),
+            "files_per_second": round(self.files / seconds, 1) if seconds else None,
+            "lines_per_second": round(self.lines / seconds, 1) if seconds else None,
+            "peak_rss_kb": peak_rss_kb(),
+        }
+
+
+def run_phases(root: Path, report_dir: Path) -> Dict:
+    """
+    Run the analysis of main.py on the Java files under root, one phase
+    after the other, and time every phase.
+    """
+    paths = [Path(p) for p in find_java_files(root)]
+    sources = [s for s in (load_source_file(p) for p in paths) if s is not None]
+    lines = sum(len(s.lines) for s in sources)
+    timer = PhaseTimer(len(sources), lines)
+
+    with timer.phase("lexing"):
+        tokens = [s.tokens for s in sources]
+
+    with timer.phase("constants"):
+        packages = [read_package(t) for t in tokens]
+        constants = [
+            extract_constant_definitions(t, class_scopes(t)) for t in tokens
+        ]
+        symbols = build_symbol_table(
+            [
+                FileScan(s.path, package, definitions, [], [])
+                for s, package, definitions in zip(sources, packages, constants)
+            ]
+        )
+        for qualified in symbols.definitions:
+            symbols.value(qualified)
+
+    with timer.phase("calls"):
+        # One pass per file finds the execSQL calls and the queries
+        calls = [CALL_MATCHER.find_calls(t) for t in tokens]
+
+    with timer.phase("create_table"):
+        parsers = [Parser(t) for t in tokens]
+        for parser, file_calls in zip(parsers, calls):
+            parser.parse(file_calls["execSQL"])
+        scans = [
+            FileScan(s.path, package, definitions, parser.sql_calls, [])
+            for s, package, definitions, parser in zip(
+                sources, packages, constants, parsers
+            )
+        ]
+        create_table_statements, table_columns = find_create_table_statements(
+            scans, symbols
+        )
+
+    with timer.phase("references"):
+        for scan, source, file_calls, parser in zip(scans, sources, calls, parsers):
+            scan.db_calls = locate_db_calls(
+                source.lines, file_calls["query"], parser.scopes
+            )
+        table_references, column_references, queries = find_table_references(
+            scans, list(create_table_statements.keys()), symbols, table_columns
+        )
+        unused_tables = find_unused_tables(create_table_statements, table_references)
+        unused_columns = find_unused_columns(table_columns, column_references)
+
+    report_args = (
+        create_table_statements,
+        table_references,
+        unused_tables,
+        table_columns,
+        column_references,
+        unused_columns,
+        queries,
+    )
+    blame = BlameService(root)
+    with timer.phase("report"):
+        generate_html_report(
+            *report_args,
+            report_dir / "database_usage_report.html",
+            "https://example.com/synthetic",
+            root,
+            blame=blame,
+        )
+
+    with timer.phase("paged_report"):
+        generate_paged_report(
+            *report_args,
+            report_dir / "database_usage_report",
+            "https://example.com/synthetic",
+            root,
+            blame=blame,
+        )
+
+    return {
+        "files": len(sources),
+        "lines": lines,
+        "bytes": sum(p.stat().st_size for p in paths),
+        "constants": len(symbols),
+        "tables": len(create_table_statements),
+        "queries": len(queries),
+        "phases": timer.phases,
+    }
+
+
+def run_analyse_code(root: Path, work_dir: Path) -> Dict:
+    """
+    Time analyseCode.py in a child process, writing its output in work_dir.
+    """
+    print("Running analyseCode.py...")
+    start = time.perf_counter()
+    subprocess.run(
+        [
+            sys.executable,
+            str(ANALYSE_CODE),
+            str(root),
+            "--output",
+            str(work_dir / "output"),
+        ],
+        cwd=work_dir,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": round(seconds, 4),
+        "peak_rss_kb": peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+
+def current_commit() -> Optional[str]:
+    result = subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def load_results(results_path: Path) -> List[Dict]:
+    if not results_path.exists():
+        return []
+    with results_path.open("r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def print_comparison(result: Dict, previous: Dict) -> None:
+    print(
+        f"\nCompared to the run of {previous['date']} "
+        f"(commit {(previous.get('commit') or 'unknown')[:10]}):"
+    )
+    for name, phase in result["phases"].items():
+        before = previous["phases"].get(name)
+        if not before or not before["seconds"]:
+            print(f"  {name}: {phase['seconds']:.3f}s (new phase)")
+            continue
+        ratio = phase["seconds"] / before["seconds"]
+        print(
+            f"  {name}: {before['seconds']:.3f}s -> {phase['seconds']:.3f}s "
+            f"(x{ratio:.2f})"
+        )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark the database usage analysis on a synthetic corpus"
+    )
+    add_corpus_arguments(arg_parser)
+    arg_parser.add_argument(
+        "--corpus",
+        type=Path,
+        help="directory of the synthetic corpus, generated if it does not exist "
+        "and kept afterwards (default: a temporary directory)",
+    )
+    arg_parser.add_argument(
+        "--results",
+        type=Path,
+        default=SCRIPT_DIR / "benchmark_results.jsonl",
+        help="file the results are appended to, one JSON object per run",
+    )
+    arg_parser.add_argument(
+        "--analyse-code",
+        action="store_true",
+        help="also time analyseCode.py on the corpus",
+    )
+    args = arg_parser.parse_args()
+
+    corpus_args = {
+        "files": args.files,
+        "constants": args.constants,
+        "db_calls": args.db_calls,
+        "tables": args.tables,
+        "columns": args.columns,
+        "seed": args.seed,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        root = args.corpus or tmp_dir / "corpus"
+        if root.exists():
+            print(f"Using the corpus in {root}")
+        else:
+            print(f"Generating a corpus of {args.files} files in {root}...")
+            generate_corpus(
+                root,
+                args.files,
+                args.constants,
+                args.db_calls,
+                args.tables,
+                args.columns,
+                args.seed,
+            )
+
+        report_dir = tmp_dir / "report"
+        report_dir.mkdir()
+        result = {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": current_commit(),
+            "python": platform.python_version(),
+            "corpus": corpus_args,
+        }
+        result.update(run_phases(root, report_dir))
+        if args.analyse_code:
+            analyse_dir = tmp_dir / "analyse_code"
+            analyse_dir.mkdir()
+            result["analyse_code"] = run_analyse_code(root, analyse_dir)
+
+    print(
+        f"\n{result['files']} files, {result['lines']} lines, "
+        f"{result['tables']} tables, {result['queries']} queries"
+    )
+    for name, phase in result["phases"].items():
+        print(
+            f"  {name}: {phase['seconds']:.3f}s, "
+            f"{phase['files_per_second']} files/s, peak RSS {phase['peak_rss_kb']} KiB"
+        )
+    if "analyse_code" in result:
+        print(f"  analyseCode.py: {result['analyse_code']['seconds']:.3f}s")
+
+    # Only runs on the same corpus can be compared
+    previous = [r for r in load_results(args.results) if r["corpus"] == corpus_args]
+    if previous:
+        print_comparison(result, previous[-1])
+
+    with args.results.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+    print(f"\nResults appended to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import hashlib
+from pathlib import Path
+from typing import List, Optional
+from lexer import lex_text
+
+
+class SourceFile:
+    """
+    A Java file loaded once from disk.
+
+    The text is read eagerly, the lines and the token list are computed on
+    first access and then kept, so every analysis stage shares the same copy.
+    """
+
+    def __init__(self, path: Path, text: str):
+        self.path = path
+        self.text = text
+        self._lines = None
+        self._tokens = None
+
+    @property
+    def lines(self) -> List[str]:
+        if self._lines is None:
+            # Split on "\n" only, like the lexer counts the lines, so that
+            # lines[n - 1] is line n of a token
+            self._lines = self.text.split("\n")
+            if self._lines[-1] == "":
+                self._lines.pop()
+        return self._lines
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = lex_text(self.text)
+        return self._tokens
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha1(self.text.encode("utf-8")).hexdigest()
+
+    def release(self) -> None:
+        # Drop the derived data, the text is kept
+        self._lines = None
+        self._tokens = None
+
+    def __repr__(self):
+        return f"SourceFile({self.path})"
+
+
+def load_source_file(path: Path) -> Optional[SourceFile]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return SourceFile(path, f.read())
+    except UnicodeDecodeError:
+        return None  # skip files that cannot be decoded
+
+
+def source_from_bytes(path: Path, data: bytes) -> Optional[SourceFile]:
+    """
+    A source file from raw content, e.g. a git blob, read the same way as
+    load_source_file reads a file (universal newlines).
+    """
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    return SourceFile(path, text.replace("\r\n", "\n").replace("\r", "\n"))
+
@@ -1,37 +1,499 @@
+import json
 import subprocess
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 
-def get_line_creation_date(
-    repo_path: Path, file_path: Path, line_number: int
-) -> Optional[str]:
+# Sparse checkout patterns (non-cone mode) keeping only the Java sources
+JAVA_SPARSE_PATTERNS = ["*.java"]
+
+
+def _git(args: List[str], cwd: Optional[Path] = None, profiler=None) -> None:
+    if profiler is not None:
+        profiler.count("git_processes")
+    subprocess.run(["git", *args], cwd=cwd, check=True)
+
+
+def _is_git_checkout(path: Path) -> bool:
+    result = subprocess.run(
+        ["git", "rev-parse", "--is-inside-work-tree"],
+        cwd=path,
+        capture_output=True,
+        text=True,
+    )
+    return result.returncode == 0 and result.stdout.strip() == "true"
+
+
+def _git_output(args: List[str], cwd: Path, profiler=None) -> Optional[str]:
+    """
+    Output of a git command, None if it failed.
+    """
+    if profiler is not None:
+        profiler.count("git_processes")
+    result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def _normalize_remote(url: str) -> str:
+    if Path(url).is_dir():
+        return Path(url).resolve().as_posix()
+    url = url.rstrip("/")
+    return url[: -len(".git")] if url.endswith(".git") else url
+
+
+def _update_clone(
+    repo_url: str, clone_path: Path, profiler=None, sparse_java: bool = False
+) -> None:
+    """
+    Fast-forward an existing clone of repo_url to the latest commit of the
+    upstream of its branch. Nothing is discarded: the update is refused when
+    the clone has local changes, has no upstream (detached HEAD, branch
+    created locally) or has diverged from it.
+    """
+    origin = _git_output(["remote", "get-url", "origin"], clone_path, profiler)
+    if origin is None or _normalize_remote(origin) != _normalize_remote(repo_url):
+        raise RuntimeError(
+            f"{clone_path} is a clone of {origin or 'no origin'}, not of "
+            f"{repo_url}, use another clone path"
+        )
+    status = ["status", "--porcelain", "--untracked-files=no"]
+    if _git_output(status, clone_path, profiler):
+        raise RuntimeError(
+            f"{clone_path} has local changes, commit or discard them before "
+            "updating the clone"
+        )
+    upstream = ["rev-parse", "--abbrev-ref", "--symbolic-full-name", "@{upstream}"]
+    if not _git_output(upstream, clone_path, profiler):
+        raise RuntimeError(
+            f"The checkout of {clone_path} has no upstream branch, check out a "
+            "branch tracking origin"
+        )
+    if sparse_java:
+        _sparse_checkout_java(clone_path, profiler)
+    try:
+        _git(["fetch", "--prune", "origin"], clone_path, profiler)
+    except subprocess.CalledProcessError:
+        raise RuntimeError(f"Cannot fetch {origin} into {clone_path}") from None
     try:
-        relative_path = file_path.relative_to(repo_path).as_posix()
-        result = subprocess.run(
-            [
-                "git",
-                "blame",
-                "--date=iso",
-                "-L",
-                f"{line_number},{line_number}",
-                relative_path,
-            ],
+        _git(["merge", "--ff-only", "@{upstream}"], clone_path, profiler)
+    except subprocess.CalledProcessError:
+        raise RuntimeError(
+            f"The branch of {clone_path} has diverged from its upstream, "
+            "merge or rebase it before updating the clone"
+        ) from None
+
+
+def clone_repository(
+    repo_url: str,
+    clone_path: Path,
+    profiler=None,
+    reference: Optional[Path] = None,
+    shared: bool = False,
+    blob_filter: Optional[str] = None,
+    sparse_java: bool = False,
+) -> None:
+    """
+    Clone the repository, or update an existing clone in place.
+
+    - reference: a local clone or mirror of the same repository whose
+      objects are borrowed instead of copied (if it exists)
+    - shared: borrow the objects of repo_url itself, a local repository
+    - blob_filter: partial clone filter, e.g. "blob:none", file contents
+      are then only fetched for the checked out files and, by blame, for
+      the history of the files defining tables
+    - sparse_java: only check out the *.java files
+    """
+    if clone_path.exists():
+        if not _is_git_checkout(clone_path):
+            return  # not a clone, analyzed as is
+        print(f"Updating the existing clone in {clone_path}...")
+        _update_clone(repo_url, clone_path, profiler, sparse_java)
+        return
+
+    args = ["clone"]
+    if reference is not None:
+        args += ["--reference-if-able", str(reference)]
+    if shared:
+        args.append("--shared")
+    if blob_filter:
+        args.append(f"--filter={blob_filter}")
+    if sparse_java:
+        # Check out once the sparse patterns are set, so that with a filter
+        # only the blobs of Java files are fetched
+        args.append("--no-checkout")
+    _git([*args, repo_url, str(clone_path)], profiler=profiler)
+    if sparse_java:
+        _sparse_checkout_java(clone_path, profiler)
+        _git(["checkout"], clone_path, profiler)
+
+
+def _sparse_checkout_java(clone_path: Path, profiler=None) -> None:
+    _git(
+        ["sparse-checkout", "set", "--no-cone", *JAVA_SPARSE_PATTERNS],
+        clone_path,
+        profiler,
+    )
+
+
+def resolve_revision(repo_path: Path, revision: str) -> str:
+    """
+    Full SHA of the commit a revision (branch, tag, SHA, HEAD~3...) names.
+    """
+    result = subprocess.run(
+        ["git", "rev-parse", "--verify", f"{revision}^{{commit}}"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+def list_tags(repo_path: Path) -> List[str]:
+    """
+    Tags of the repository, oldest first.
+    """
+    result = subprocess.run(
+        [
+            "git",
+            "for-each-ref",
+            "--sort=creatordate",
+            "--format=%(refname:short)",
+            "refs/tags",
+        ],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.split()
+
+
+def list_commits(
+    repo_path: Path, rev_range: str, max_count: Optional[int] = None
+) -> List[str]:
+    """
+    Commits of a range (e.g. v1.0..master) following the first parents,
+    oldest first. With max_count, only the most recent ones.
+    """
+    args = ["git", "rev-list", "--first-parent", "--reverse"]
+    if max_count:
+        args.append(f"--max-count={max_count}")
+    result = subprocess.run(
+        [*args, rev_range, "--"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.split()
+
+
+def commit_info(repo_path: Path, revisions: List[str]) -> List[Tuple[str, str]]:
+    """
+    (commit SHA, ISO committer date) of every revision, in the same order.
+    """
+    if not revisions:
+        return []
+    result = subprocess.run(
+        ["git", "rev-parse", *(f"{revision}^{{commit}}" for revision in revisions)],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    shas = result.stdout.split()
+    # git log lists every commit once, even if several revisions name it
+    result = subprocess.run(
+        ["git", "log", "--no-walk", "--format=%H %cI", *set(shas), "--"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    dates = dict(line.split(" ", 1) for line in result.stdout.splitlines())
+    return [(sha, dates[sha]) for sha in shas]
+
+
+def list_java_blobs(repo_path: Path, revision: str) -> List[Tuple[str, str]]:
+    """
+    (path, blob SHA) of every .java file of a revision, paths being relative
+    to the root of the repository, in the order of `git ls-tree`.
+    """
+    result = subprocess.run(
+        ["git", "ls-tree", "-r", "-z", revision],
+        cwd=repo_path,
+        capture_output=True,
+        check=True,
+    )
+    blobs = []
+    for entry in result.stdout.decode("utf-8", errors="surrogateescape").split(
+        "\0"
+    ):
+        if not entry:
+            continue
+        # <mode> SP <type> SP <object> TAB <path>
+        info, _, path = entry.partition("\t")
+        _, object_type, sha = info.split(" ")
+        if object_type == "blob" and path.endswith(".java"):
+            blobs.append((path, sha))
+    return blobs
+
+
+class CatFileBatch:
+    """
+    A single `git cat-file --batch` process, reading any number of objects
+    one after the other without starting a git process per object.
+    """
+
+    def __init__(self, repo_path: Path, profiler=None):
+        if profiler is not None:
+            profiler.count("git_processes")
+        self.process = subprocess.Popen(
+            ["git", "cat-file", "--batch"],
             cwd=repo_path,
-            capture_output=True,
-            text=True,
-            check=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
         )
-        output = result.stdout.strip()
-        match = re.search(r"(\d{4}-\d{2}-\d{2})", output)
+
+    def read(self, sha: str) -> Optional[bytes]:
+        """
+        Content of an object, None if it does not exist.
+        """
+        self.process.stdin.write(sha.encode("ascii") + b"\n")
+        self.process.stdin.flush()
+        # <sha> SP <type> SP <size> LF <contents> LF, or <sha> SP missing LF
+        header = self.process.stdout.readline().split()
+        if len(header) != 3:
+            if not header:
+                raise RuntimeError("git cat-file --batch stopped")
+            return None
+        data = self.process.stdout.read(int(header[2]))
+        self.process.stdout.read(1)
+        return data
+
+    def close(self) -> None:
+        self.process.stdin.close()
+        self.process.wait()
+        self.process.stdout.close()
+
+    def __enter__(self) -> "CatFileBatch":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+_PORCELAIN_HEADER = re.compile(r"^([0-9a-f]{40}) \d+ (\d+)")
+
+
+def _format_author_date(author_time: int, author_tz: str) -> str:
+    # Same day as `git blame --date=iso`, i.e. in the author's time zone
+    sign = -1 if author_tz.startswith("-") else 1
+    offset = timedelta(hours=int(author_tz[1:3]), minutes=int(author_tz[3:5]))
+    tz = timezone(sign * offset)
+    return datetime.fromtimestamp(author_time, tz).strftime("%Y-%m-%d")
+
+
+def parse_blame_porcelain(output: str) -> Dict[int, str]:
+    """
+    Map every line number of a `git blame --porcelain` output to the date
+    of the commit that created the line.
+    """
+    commits = {}
+    dates = {}
+    sha = None
+    line_number = None
+    for line in output.splitlines():
+        if line.startswith("\t"):
+            commit = commits.get(sha, {})
+            if "author-time" in commit:
+                dates[line_number] = _format_author_date(
+                    commit["author-time"], commit.get("author-tz", "+0000")
+                )
+            continue
+        match = _PORCELAIN_HEADER.match(line)
         if match:
-            return match.group(1)
-    except subprocess.CalledProcessError:
-        pass
-    return None
+            sha = match.group(1)
+            line_number = int(match.group(2))
+            commits.setdefault(sha, {})
+        elif line.startswith("author-time "):
+            commits[sha]["author-time"] = int(line[len("author-time ") :])
+        elif line.startswith("author-tz "):
+            commits[sha]["author-tz"] = line[len("author-tz ") :]
+    return dates
+
+
+class BlameService:
+    """
+    Creation dates of lines, with at most one `git blame` per file.
+
+    The dates of a whole file are kept in memory once blamed. With a
+    cache_dir they are also stored on disk for the current HEAD commit, so
+    a later run on the same commit does not run git at all. The dates of
+    files that differ from HEAD in the working tree are neither stored
+    nor read from the disk cache, they change with every edit.
+
+    With a revision, the lines are blamed as of that commit instead of
+    HEAD, whatever is checked out. With a Profiler, every git process is
+    counted and the time of every blamed file is recorded in the "blame"
+    phase.
+    """
+
+    def __init__(
+        self,
+        repo_path: Path,
+        cache_dir: Optional[Path] = None,
+        workers: int = 1,
+        profiler=None,
+        revision: Optional[str] = None,
+    ):
+        self.repo_path = repo_path
+        self.workers = max(1, workers)
+        self.profiler = profiler
+        self.revision = revision
+        self.files: Dict[str, Dict[int, str]] = {}
+        self.cache_file = None
+        self._dirty = False
+        if cache_dir is not None:
+            head = revision or self._head_commit()
+            if head:
+                self.cache_file = Path(cache_dir) / f"blame-{head}.json"
+                self._load()
+
+    def _head_commit(self) -> Optional[str]:
+        if self.profiler is not None:
+            self.profiler.count("git_processes")
+        try:
+            result = subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                cwd=self.repo_path,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            return result.stdout.strip()
+        except (subprocess.CalledProcessError, OSError):
+            return None
+
+    def _git_paths(self, args: List[str]) -> List[str]:
+        if self.profiler is not None:
+            self.profiler.count("git_processes")
+        try:
+            result = subprocess.run(
+                ["git", *args, "-z"],
+                cwd=self.repo_path,
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                check=True,
+            )
+        except (subprocess.CalledProcessError, OSError):
+            return []
+        return [path for path in result.stdout.split("\0") if path]
+
+    def _uncommitted_files(self) -> Set[str]:
+        """
+        Files of the working tree whose blame is not that of HEAD: edited,
+        staged or untracked, relative to repo_path. Empty with a revision,
+        its blame does not depend on the working tree.
+        """
+        if self.revision:
+            return set()
+        changed = self._git_paths(["diff", "--name-only", "--relative", "HEAD"])
+        untracked = self._git_paths(["ls-files", "--others", "--exclude-standard"])
+        return set(changed) | set(untracked)
+
+    def _load(self) -> None:
+        if not self.cache_file.exists():
+            return
+        with self.cache_file.open("r", encoding="utf-8") as f:
+            files = json.load(f)
+        uncommitted = self._uncommitted_files()
+        for relative_path, dates in files.items():
+            if relative_path not in uncommitted:
+                self.files[relative_path] = {int(n): d for n, d in dates.items()}
+
+    def save(self) -> None:
+        if self.cache_file is None or not self._dirty:
+            return
+        uncommitted = self._uncommitted_files()
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with self.cache_file.open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    relative_path: dates
+                    for relative_path, dates in self.files.items()
+                    if relative_path not in uncommitted
+                },
+                f,
+            )
+        self._dirty = False
+
+    def _relative_path(self, file_path: Path) -> str:
+        return Path(file_path).relative_to(self.repo_path).as_posix()
+
+    def _blame(self, relative_path: str) -> Dict[int, str]:
+        start = time.perf_counter()
+        revision = [self.revision] if self.revision else []
+        try:
+            result = subprocess.run(
+                ["git", "blame", "--porcelain", *revision, "--", relative_path],
+                cwd=self.repo_path,
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                check=True,
+            )
+        except subprocess.CalledProcessError:
+            return {}
+        finally:
+            if self.profiler is not None:
+                self.profiler.count("git_processes")
+                self.profiler.file_time(
+                    "blame", relative_path, start, time.perf_counter() - start
+                )
+        return parse_blame_porcelain(result.stdout)
+
+    def prefetch(self, file_paths: Iterable[Path]) -> None:
+        """
+        Blame all the given files that are not known yet, with up to
+        `workers` git processes at the same time.
+        """
+        missing = []
+        for file_path in file_paths:
+            relative_path = self._relative_path(file_path)
+            if relative_path not in self.files and relative_path not in missing:
+                missing.append(relative_path)
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(self._blame, missing)
+            for relative_path, dates in zip(missing, results):
+                self.files[relative_path] = dates
+        self._dirty = True
 
+    def forget(self, file_paths: Iterable[Path]) -> None:
+        """
+        Drop the dates of files edited since they were blamed, they are
+        blamed again when next asked for.
+        """
+        for file_path in file_paths:
+            if self.files.pop(self._relative_path(file_path), None) is not None:
+                self._dirty = True
 
-def clone_repository(repo_url: str, clone_path: Path) -> None:
-    if not clone_path.exists():
-        subprocess.run(["git", "clone", repo_url, str(clone_path)], check=True)
+    def get_line_creation_date(
+        self, file_path: Path, line_number: int
+    ) -> Optional[str]:
+        relative_path = self._relative_path(file_path)
+        dates = self.files.get(relative_path)
+        if dates is None:
+            dates = self.files[relative_path] = self._blame(relative_path)
+            self._dirty = True
+        return dates.get(line_number)
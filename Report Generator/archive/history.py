@@ -0,0 +1,208 @@
+import argparse
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from analysis import (
+    build_symbol_table,
+    find_create_table_statements,
+    find_table_references,
+)
+from git_operations import clone_repository, commit_info, list_commits, list_tags
+from scan import scan_revision
+from scan_cache import BlobScanCache
+
+
+def analyze_revision(
+    repo_path: Path, revision: str, cache: BlobScanCache, jobs: int = 1
+) -> Dict:
+    """
+    Table and column reference counts of a revision, and the set of its
+    queries (their source lines).
+    """
+    scans = scan_revision(repo_path, revision, jobs, cache=cache)
+    symbols = build_symbol_table(scans)
+    create_table_statements, table_columns = find_create_table_statements(
+        scans, symbols
+    )
+    table_references, column_references, queries = find_table_references(
+        scans, list(create_table_statements.keys()), symbols, table_columns
+    )
+    return {
+        "files": len(scans),
+        "tables": {
+            table: len(table_references.get(table, []))
+            for table in create_table_statements
+        },
+        "columns": {
+            table: {
+                col: len(column_references[table].get(col, [])) for col in cols
+            }
+            for table, cols in table_columns.items()
+        },
+        "queries": {q["snippet"] for q in queries},
+    }
+
+
+def _seen(appearances: Dict[str, Dict], key: str, revision: str) -> None:
+    appearance = appearances.setdefault(key, {"first": revision})
+    appearance["last"] = revision
+
+
+def build_history(
+    repo_path: Path,
+    revisions: List[str],
+    cache: BlobScanCache,
+    jobs: int = 1,
+) -> Dict:
+    """
+    Analyze the revisions in order, oldest first. Returns the reference
+    counts of every revision and the first and last revision each table,
+    column and query appears in.
+    """
+    series = []
+    appearances = {"tables": {}, "columns": {}, "queries": {}}
+    for revision, (commit, date) in zip(revisions, commit_info(repo_path, revisions)):
+        print(f"Analyzing {revision} ({commit[:10]}, {date})...")
+        start = time.perf_counter()
+        hits, misses = cache.hits, cache.misses
+        result = analyze_revision(repo_path, commit, cache, jobs)
+        print(
+            f"{result['files']} files, {cache.misses - misses} scanned and "
+            f"{cache.hits - hits} reused, in {time.perf_counter() - start:.2f}s"
+        )
+
+        for table in result["tables"]:
+            _seen(appearances["tables"], table, revision)
+        for table, cols in result["columns"].items():
+            for col in cols:
+                _seen(appearances["columns"], f"{table}.{col}", revision)
+        for query in result["queries"]:
+            _seen(appearances["queries"], query, revision)
+
+        series.append(
+            {
+                "revision": revision,
+                "commit": commit,
+                "date": date,
+                "files": result["files"],
+                "queries": len(result["queries"]),
+                "tables": result["tables"],
+                "columns": result["columns"],
+            }
+        )
+    return {"revisions": series, **appearances}
+
+
+def write_usage_csv(path: Path, history: Dict) -> None:
+    """
+    One row per revision and table (column empty) or table column, with
+    its reference count, ready to be plotted as a time series.
+    """
+    with path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["revision", "commit", "date", "table", "column", "references"])
+        for entry in history["revisions"]:
+            prefix = [entry["revision"], entry["commit"], entry["date"]]
+            for table, count in entry["tables"].items():
+                writer.writerow([*prefix, table, "", count])
+                for col, col_count in entry["columns"].get(table, {}).items():
+                    writer.writerow([*prefix, table, col, col_count])
+
+
+def select_revisions(
+    repo_path: Path,
+    revisions: List[str],
+    tags: bool,
+    rev_range: Optional[str],
+    max_count: Optional[int],
+) -> List[str]:
+    selected = list(revisions)
+    if tags:
+        selected += list_tags(repo_path)
+    if rev_range:
+        selected += list_commits(repo_path, rev_range, max_count)
+    return selected
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Table and column usage across the revisions of a repository"
+    )
+    arg_parser.add_argument(
+        "repo", help="path of a local clone (bare or not), or URL to clone"
+    )
+    arg_parser.add_argument(
+        "--revisions",
+        nargs="*",
+        default=[],
+        help="revisions to analyze, oldest first",
+    )
+    arg_parser.add_argument(
+        "--tags", action="store_true", help="analyze every tag, oldest first"
+    )
+    arg_parser.add_argument(
+        "--range",
+        dest="rev_range",
+        help="analyze the commits of a range, e.g. v1.0..master",
+    )
+    arg_parser.add_argument(
+        "--max",
+        type=int,
+        help="only the most recent commits of --range",
+    )
+    arg_parser.add_argument(
+        "--clone-path",
+        type=Path,
+        default=Path("repo_clone"),
+        help="where a repository given by URL is cloned (default: repo_clone)",
+    )
+    arg_parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=Path("database_usage_history"),
+        help="where history.json and usage.csv are written "
+        "(default: database_usage_history)",
+    )
+    arg_parser.add_argument(
+        "--cache",
+        type=Path,
+        help="directory where the scans of the blobs are kept between runs",
+    )
+    arg_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes used to scan the Java files (default: 1)",
+    )
+    args = arg_parser.parse_args()
+
+    if Path(args.repo).is_dir():
+        repo_path = Path(args.repo).resolve()
+    else:
+        repo_path = args.clone_path.resolve()
+        clone_repository(args.repo, repo_path)
+
+    revisions = select_revisions(
+        repo_path, args.revisions, args.tags, args.rev_range, args.max
+    )
+    if not revisions:
+        arg_parser.error("no revision given, use --revisions, --tags or --range")
+
+    cache = BlobScanCache(args.cache)
+    history = build_history(repo_path, revisions, cache, args.jobs)
+    cache.save()
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    with (args.output_dir / "history.json").open("w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+    write_usage_csv(args.output_dir / "usage.csv", history)
+    print(
+        f"History of {len(revisions)} revisions written to {args.output_dir} "
+        f"({cache.misses} files scanned, {cache.hits} reused)"
+    )
+
+
+if __name__ == "__main__":
+    main()
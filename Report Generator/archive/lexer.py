@@ -1,3 +1,7 @@
+import gc
+import re
+
+
 class TokenType:
     IDENTIFIER = "IDENTIFIER"
     DOT = "DOT"
@@ -10,6 +14,8 @@ class TokenType:
 
 
 class Token:
+    __slots__ = ("type", "value", "line")
+
     def __init__(self, ttype, value, line):
         self.type = ttype
         self.value = value
@@ -19,112 +25,87 @@ class Token:
         return f"Token({self.type}, {self.value}, line={self.line})"
 
 
+# Every token is one match of this pattern: a newline (only used to count
+# lines), an identifier, a string literal or any other single non blank
+# character. Other whitespace is skipped by findall(). A backslash escapes
+# the next character in a string and an unterminated string runs until the
+# end of the text.
+_TOKEN_PATTERN = re.compile(
+    r"""\n|[^\W\d]\w*|"[^"\\]*(?:\\.[^"\\]*)*(?:"|\\)?|\S""", re.DOTALL
+)
+_STRING_BODY_PATTERN = re.compile(r'"([^"\\]*(?:\\.[^"\\]*)*)', re.DOTALL)
+_ESCAPE_PATTERN = re.compile(r"\\(.)", re.DOTALL)
+_PUNCTUATION = {
+    ".": TokenType.DOT,
+    "(": TokenType.LPAREN,
+    ")": TokenType.RPAREN,
+    ";": TokenType.SEMI,
+}
+
+
 class Lexer:
+    """
+    Split Java source text into tokens.
+
+    The text is cut into raw tokens by a single compiled pattern, the loop
+    below only has to classify them and keep track of the line number.
+    """
+
     def __init__(self, text):
         self.text = text
-        self.pos = 0
-        self.length = len(text)
-        self.line = 1
-
-    def peek_char(self):
-        if self.pos < self.length:
-            return self.text[self.pos]
-        return None
-
-    def get_char(self):
-        if self.pos < self.length:
-            ch = self.text[self.pos]
-            self.pos += 1
-            if ch == "\n":
-                self.line += 1
-            return ch
-        return None
-
-    def skip_whitespace(self):
-        while True:
-            ch = self.peek_char()
-            if ch is not None and ch.isspace():
-                self.get_char()
-            else:
-                break
-
-    def is_identifier_start(self, ch):
-        return ch is not None and (ch.isalpha() or ch == "_")
-
-    def is_identifier_part(self, ch):
-        return ch is not None and (ch.isalnum() or ch == "_")
-
-    def get_identifier(self):
-        result = []
-        start_line = self.line
-        result.append(self.get_char())
-        while True:
-            ch = self.peek_char()
-            if self.is_identifier_part(ch):
-                result.append(self.get_char())
-            else:
-                break
-        return "".join(result), start_line
-
-    def get_string(self):
-        # consume the opening quote
-        start_line = self.line
-        self.get_char()
-        result = []
-        while True:
-            ch = self.get_char()
-            if ch is None:
-                # unexpected EOF in string
-                break
-            if ch == "\\":
-                next_ch = self.get_char()
-                if next_ch is not None:
-                    result.append(next_ch)
-            elif ch == '"':
-                # end of string
-                break
+
+    def tokens(self):
+        # The loop allocates one object per token and none of them can be part
+        # of a cycle, running the cyclic garbage collector meanwhile is wasted
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._tokens()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _tokens(self):
+        identifier = TokenType.IDENTIFIER
+        other = TokenType.OTHER
+        punctuation = _PUNCTUATION.get
+        tokens = []
+        append = tokens.append
+        line = 1
+        for raw in _TOKEN_PATTERN.findall(self.text):
+            if raw == "\n":
+                line += 1
+                continue
+            ttype = punctuation(raw)
+            if ttype is not None:
+                append(Token(ttype, raw, line))
+                continue
+            first = raw[0]
+            if first.isalpha() or first == "_":
+                append(Token(identifier, raw, line))
+            elif first == '"':
+                value = _STRING_BODY_PATTERN.match(raw).group(1)
+                if "\\" in value:
+                    value = _ESCAPE_PATTERN.sub(r"\1", value)
+                append(Token(TokenType.STRING, value, line))
+                line += raw.count("\n")
             else:
-                result.append(ch)
-        return "".join(result), start_line
-
-    def get_next_token(self):
-        self.skip_whitespace()
-        start_line = self.line
-        ch = self.peek_char()
-        if ch is None:
-            return Token(TokenType.EOF, None, self.line)
-        if self.is_identifier_start(ch):
-            ident, l = self.get_identifier()
-            return Token(TokenType.IDENTIFIER, ident, l)
-        if ch == '"':
-            s, l = self.get_string()
-            return Token(TokenType.STRING, s, l)
-        if ch == ".":
-            self.get_char()
-            return Token(TokenType.DOT, ".", start_line)
-        if ch == "(":
-            self.get_char()
-            return Token(TokenType.LPAREN, "(", start_line)
-        if ch == ")":
-            self.get_char()
-            return Token(TokenType.RPAREN, ")", start_line)
-        if ch == ";":
-            self.get_char()
-            return Token(TokenType.SEMI, ";", start_line)
-
-        # For other single chars
-        val = self.get_char()
-        return Token(TokenType.OTHER, val, start_line)
+                # \w also matches digits that are not decimals (e.g. "²"),
+                # those are single OTHER tokens and may not start an identifier
+                while raw and not (raw[0].isalpha() or raw[0] == "_"):
+                    append(Token(other, raw[0], line))
+                    raw = raw[1:]
+                if raw:
+                    append(Token(identifier, raw, line))
+        append(Token(TokenType.EOF, None, line))
+        return tokens
 
 
 def lex_file(path):
     with open(path, "r", encoding="utf-8") as f:
         text = f.read()
-    lexer = Lexer(text)
-    tokens = []
-    while True:
-        tok = lexer.get_next_token()
-        tokens.append(tok)
-        if tok.type == TokenType.EOF:
-            break
-    return tokens
+    return lex_text(text)
+
+
+def lex_text(text):
+    return Lexer(text).tokens()
@@ -1,48 +1,253 @@
+import argparse
+import json
 from pathlib import Path
-from git_operations import clone_repository
+from git_operations import BlameService, clone_repository, resolve_revision
 from analysis import (
+    build_symbol_table,
     find_create_table_statements,
     find_table_references,
     find_unused_tables,
     find_unused_columns,
+    iter_query_references,
+)
+from paged_report import generate_paged_report
+from profiling import Profiler
+from report_data import (
+    build_usage_data,
+    compute_query_statistics,
+    data_path,
+    write_usage_data,
 )
-from files_utils import find_java_files
-from lexer import lex_file
-from parser import extract_constants
 from report_generator import generate_html_report
+from results_store import ResultsStore
+from scan import scan_project, scan_revision
+from scan_cache import BlobScanCache, ScanCache
+from sql_tokenizer import sql_cache_info
 
 
 def main():
-    repo_url = input("Enter the repository URL: ").strip()
+    arg_parser = argparse.ArgumentParser(description="Database usage report")
+    arg_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes used to scan the Java files (default: 1)",
+    )
+    arg_parser.add_argument(
+        "--blame-workers",
+        type=int,
+        default=4,
+        help="number of git blame processes run at the same time (default: 4)",
+    )
+    arg_parser.add_argument(
+        "--blame-cache",
+        type=Path,
+        help="directory where the blame results are kept between runs",
+    )
+    arg_parser.add_argument(
+        "--cache",
+        type=Path,
+        help="directory where the per-file results are kept between runs",
+    )
+    arg_parser.add_argument(
+        "--paged",
+        action="store_true",
+        help="write an index page and one set of pages per table instead of "
+        "a single HTML page",
+    )
+    arg_parser.add_argument(
+        "--page-size",
+        type=int,
+        default=100,
+        help="references per page of a table in the paged report (default: 100)",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        type=Path,
+        help="write the time of every phase, the slowest files, counters and "
+        "peak memory to this JSON file",
+    )
+    arg_parser.add_argument(
+        "--trace",
+        type=Path,
+        help="write the phases and files as trace events (chrome://tracing, "
+        "Perfetto) to this JSON file",
+    )
+    arg_parser.add_argument(
+        "--repo",
+        help="URL of the repository to clone, or path of a local checkout "
+        "analyzed in place (default: asked on the standard input)",
+    )
+    arg_parser.add_argument(
+        "--clone-path",
+        type=Path,
+        help="where the repository is cloned (default: repo_clone next to "
+        "this script)",
+    )
+    arg_parser.add_argument(
+        "--reference",
+        type=Path,
+        help="local clone or mirror of the repository whose objects are "
+        "reused instead of downloaded again",
+    )
+    arg_parser.add_argument(
+        "--shared",
+        action="store_true",
+        help="share the objects of a local repository instead of copying them",
+    )
+    arg_parser.add_argument(
+        "--filter",
+        help="partial clone filter, e.g. blob:none to only download the "
+        "contents of the checked out files",
+    )
+    arg_parser.add_argument(
+        "--sparse-java",
+        action="store_true",
+        help="only check out the Java files",
+    )
+    arg_parser.add_argument(
+        "--revision",
+        help="analyze this branch, tag or commit straight from the git objects "
+        "instead of the checked out files",
+    )
+    arg_parser.add_argument(
+        "--output",
+        type=Path,
+        help="report file, or directory with --paged (default: next to this "
+        "script)",
+    )
+    arg_parser.add_argument(
+        "--store",
+        type=Path,
+        help="keep the references and queries in this SQLite database instead "
+        "of in memory, it can be queried after the run",
+    )
+    arg_parser.add_argument(
+        "--summary",
+        type=Path,
+        help="write the counts of the analysis to this JSON file",
+    )
+    args = arg_parser.parse_args()
+    profiler = Profiler()
+
+    if args.repo:
+        repo_url = args.repo
+    else:
+        repo_url = input("Enter the repository URL: ").strip()
     script_dir = Path(__file__).parent.resolve()
-    clone_path = script_dir / "repo_clone"
-    output_path = script_dir / "database_usage_report.html"
+    if args.output:
+        output_path = args.output
+    elif args.paged:
+        output_path = script_dir / "database_usage_report"
+    else:
+        output_path = script_dir / "database_usage_report.html"
 
-    print("Cloning repository...")
-    clone_repository(repo_url, clone_path)
+    if Path(repo_url).is_dir():
+        # A local checkout is analyzed where it is
+        clone_path = Path(repo_url).resolve()
+    else:
+        clone_path = (args.clone_path or script_dir / "repo_clone").resolve()
+        print("Cloning repository...")
+        with profiler.phase("clone"):
+            clone_repository(
+                repo_url,
+                clone_path,
+                profiler,
+                reference=args.reference,
+                shared=args.shared,
+                blob_filter=args.filter,
+                sparse_java=args.sparse_java,
+            )
 
-    print("Finding CREATE TABLE statements...")
-    create_table_statements, table_columns = find_create_table_statements(clone_path)
-    print(f"Found {len(create_table_statements)} tables.")
+    # Report links point at the analyzed commit with --revision
+    revision = None
+    link_revision = "master"
+    print("Scanning Java sources...")
+    with profiler.phase("scan"):
+        if args.revision:
+            revision = link_revision = resolve_revision(clone_path, args.revision)
+            print(f"Reading {args.revision} ({revision}) from the git objects...")
+            cache = BlobScanCache(args.cache) if args.cache else None
+            scans = scan_revision(clone_path, revision, args.jobs, profiler, cache)
+            if cache is not None:
+                cache.save()
+        else:
+            cache = ScanCache(args.cache, clone_path) if args.cache else None
+            scans = scan_project(clone_path, args.jobs, cache, profiler)
+    print(f"Scanned {len(scans)} files.")
+    profiler.count("files", len(scans))
+    profiler.count("db_calls", sum(len(scan.db_calls) for scan in scans))
+    profiler.count("sql_calls", sum(len(scan.sql_calls) for scan in scans))
+    if cache is not None:
+        print(f"Reused {cache.hits} cached results, scanned {cache.misses} files.")
+        profiler.count("cache_hits", cache.hits)
 
     print("Extracting constants...")
-    java_files = find_java_files(clone_path)
-    constants_map = {}
-    for jf in java_files:
-        tokens = lex_file(jf)
-        constants_map.update(extract_constants(tokens))
-    print(f"Extracted {len(constants_map)} constants.")
+    with profiler.phase("symbols"):
+        symbols = build_symbol_table(scans)
+    print(f"Extracted {len(symbols)} constants.")
+    profiler.count("constants", len(symbols))
+
+    def scan_name(scan):
+        return str(scan.path)
+
+    print("Finding CREATE TABLE statements...")
+    with profiler.phase("create_table"):
+        create_table_statements, table_columns = find_create_table_statements(
+            profiler.each("create_table", scans, scan_name), symbols
+        )
+    print(f"Found {len(create_table_statements)} tables.")
 
     print("Finding table and column references and collecting query stats...")
-    table_references, column_references, queries = find_table_references(
-        clone_path, list(create_table_statements.keys()), constants_map, table_columns
-    )
+    store = None
+    with profiler.phase("references"):
+        if args.store:
+            # Written while they are found, the reports read them back table
+            # by table
+            args.store.parent.mkdir(parents=True, exist_ok=True)
+            store = ResultsStore(args.store)
+            store.clear()
+            store.add_tables(create_table_statements, table_columns)
+            query_count = store.add_queries(
+                iter_query_references(
+                    profiler.each("references", scans, scan_name),
+                    list(create_table_statements.keys()),
+                    symbols,
+                    table_columns,
+                )
+            )
+            table_references = store.table_references()
+            column_references = store.column_references()
+            queries = store.queries()
+        else:
+            table_references, column_references, queries = find_table_references(
+                profiler.each("references", scans, scan_name),
+                list(create_table_statements.keys()),
+                symbols,
+                table_columns,
+            )
+            query_count = len(queries)
+    # Statements analyzed once, the other queries reuse their analysis
+    profiler.count("sql_statements", sql_cache_info().misses)
+    profiler.count("sql_cache_hits", sql_cache_info().hits)
 
-    print("Identifying unused tables...")
-    unused_tables = find_unused_tables(create_table_statements, table_references)
+    with profiler.phase("unused"):
+        if store is not None:
+            print("Identifying unused tables...")
+            unused_tables = store.unused_tables()
 
-    print("Identifying unused columns...")
-    unused_columns = find_unused_columns(table_columns, column_references)
+            print("Identifying unused columns...")
+            unused_columns = store.unused_columns()
+            query_statistics = store.query_statistics(clone_path)
+        else:
+            print("Identifying unused tables...")
+            unused_tables = find_unused_tables(
+                create_table_statements, table_references
+            )
+
+            print("Identifying unused columns...")
+            unused_columns = find_unused_columns(table_columns, column_references)
+            query_statistics = compute_query_statistics(queries, clone_path)
 
     if unused_tables:
         print("\nUnused tables:")
@@ -58,20 +263,90 @@ def main():
     else:
         print("\nNo unused columns found.")
 
+    with profiler.phase("blame"):
+        blame = BlameService(
+            clone_path, args.blame_cache, args.blame_workers, profiler, revision
+        )
+        blame.prefetch(path for path, _ in create_table_statements.values())
+
     print("\nGenerating HTML report...")
-    generate_html_report(
-        create_table_statements,
-        table_references,
-        unused_tables,
-        table_columns,
-        column_references,
-        unused_columns,
-        queries,
-        output_path,
-        repo_url,
-        clone_path,
-    )
+    with profiler.phase("report"):
+        if args.paged:
+            generate_paged_report(
+                create_table_statements,
+                table_references,
+                unused_tables,
+                table_columns,
+                column_references,
+                unused_columns,
+                queries,
+                output_path,
+                repo_url,
+                clone_path,
+                branch=link_revision,
+                blame=blame,
+                page_size=args.page_size,
+                query_statistics=query_statistics,
+            )
+        else:
+            generate_html_report(
+                create_table_statements,
+                table_references,
+                unused_tables,
+                table_columns,
+                column_references,
+                unused_columns,
+                queries,
+                output_path,
+                repo_url,
+                clone_path,
+                branch=link_revision,
+                blame=blame,
+                query_statistics=query_statistics,
+            )
+        # The counts of the report, for the plots
+        usage_data_path = data_path(output_path)
+        write_usage_data(
+            usage_data_path,
+            build_usage_data(
+                create_table_statements,
+                table_references,
+                table_columns,
+                unused_columns,
+                query_statistics,
+            ),
+        )
     print(f"Report generated at {output_path}")
+    print(f"Counts written to {usage_data_path}")
+    if store is not None:
+        store.close()
+        print(f"Results kept in {args.store}")
+
+    if args.profile or args.trace:
+        print("\nTime per phase:")
+        profiler.print_summary()
+    if args.profile:
+        profiler.write(args.profile)
+        print(f"Profile written to {args.profile}")
+    if args.trace:
+        profiler.write_trace(args.trace)
+        print(f"Trace written to {args.trace}")
+    if args.summary:
+        summary = {
+            "repo": repo_url,
+            "revision": revision,
+            "report": str(output_path),
+            "data": str(usage_data_path),
+            "files": len(scans),
+            "constants": len(symbols),
+            "tables": len(create_table_statements),
+            "unused_tables": len(unused_tables),
+            "unused_columns": sum(len(cols) for cols in unused_columns.values()),
+            "queries": query_count,
+            "statements": query_statistics["statements"],
+        }
+        with args.summary.open("w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
 
 
 if __name__ == "__main__":
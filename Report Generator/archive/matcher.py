@@ -0,0 +1,61 @@
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over a fixed set of patterns.
+
+    find_all() reads the text once and returns every pattern that occurs in
+    it as a substring, whatever the number of patterns.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Set[str]] = [set()]
+        # The empty string occurs in every text
+        self.always: Set[str] = set()
+
+        for pattern in patterns:
+            if not pattern:
+                self.always.add(pattern)
+                continue
+            state = 0
+            for ch in pattern:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][ch] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                state = next_state
+            self.output[state].add(pattern)
+
+        # Breadth first, so the failure state of a node is always done first
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(ch, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+
+    def find_all(self, text: str) -> Set[str]:
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        found = set(self.always)
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
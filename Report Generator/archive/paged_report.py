@@ -0,0 +1,347 @@
+import json
+from html import escape
+from pathlib import Path
+from urllib.parse import quote
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from git_operations import BlameService
+from report_data import compute_query_statistics
+
+PAGE_HEADER = (
+    "<html><head><meta charset='utf-8'><title>{title}</title></head><body>"
+)
+PAGE_FOOTER = "</body></html>"
+
+
+def _source_link(
+    repo_url: str, branch: str, relative_path: str, line: int, text: str
+) -> str:
+    return (
+        f"<a href='{repo_url}/blob/{branch}/{quote(relative_path)}#L{line}'>"
+        f"{escape(text)}</a>"
+    )
+
+
+def _write_page(path: Path, chunks: Iterable[str]) -> None:
+    # Pages are written chunk by chunk, they are never built in memory
+    with path.open("w", encoding="utf-8") as f:
+        f.writelines(chunks)
+
+
+def _page_name(table: str, page: int) -> str:
+    return f"{table}.html" if page == 1 else f"{table}-{page}.html"
+
+
+def remove_table_pages(output_dir: Path, tables: Iterable[str]) -> None:
+    """
+    Delete the pages and the sidecar of tables no longer in the report.
+    """
+    tables_dir = output_dir / "tables"
+    for table in tables:
+        (tables_dir / f"{table}.json").unlink(missing_ok=True)
+        _remove_pages_from(tables_dir, table, 1)
+
+
+def _remove_pages_from(tables_dir: Path, table: str, first_page: int) -> None:
+    page = first_page
+    while (tables_dir / _page_name(table, page)).exists():
+        (tables_dir / _page_name(table, page)).unlink()
+        page += 1
+
+
+def _pager(table: str, page: int, page_count: int) -> str:
+    links = []
+    if page > 1:
+        links.append(f"<a href='{quote(_page_name(table, page - 1))}'>Previous</a>")
+    links.append(f"Page {page} of {page_count}")
+    if page < page_count:
+        links.append(f"<a href='{quote(_page_name(table, page + 1))}'>Next</a>")
+    return f"<p>{' | '.join(links)}</p>"
+
+
+def _render_table_page(
+    table: str,
+    page: int,
+    page_count: int,
+    references: List[Tuple[Path, int, str]],
+    total_references: int,
+    creation_text: str,
+    columns: List[Tuple[str, int]],
+    clone_path: Path,
+    repo_url: str,
+    branch: str,
+) -> Iterator[str]:
+    yield PAGE_HEADER.format(title=f"{escape(table)} - Database Table Usage")
+    yield "<p><a href='../index.html'>Back to the summary</a></p>"
+    yield f"<h1>{escape(table)}</h1>"
+    yield creation_text
+
+    if page == 1:
+        yield "<h2>Columns</h2><ul>"
+        for col, count in columns:
+            if count:
+                yield f"<li>{escape(col)} - used {count} times</li>"
+            else:
+                yield f"<li>{escape(col)} - <strong>UNUSED</strong></li>"
+        yield "</ul>"
+
+    yield f"<h2>References ({total_references})</h2>"
+    if not references:
+        yield "<p>No references found for this table.</p>"
+    else:
+        yield _pager(table, page, page_count)
+        yield "<ul>"
+        for file_path, position, snippet in references:
+            relative_path = file_path.relative_to(clone_path).as_posix()
+            link = _source_link(
+                repo_url,
+                branch,
+                relative_path,
+                position,
+                f"{relative_path}, Line: {position}",
+            )
+            yield f"<li>File: {link}, Snippet: {escape(snippet[:50])}</li>"
+        yield "</ul>"
+        yield _pager(table, page, page_count)
+    yield (
+        f"<p>All the references and column references are listed in "
+        f"<a href='{quote(table)}.json'>{escape(table)}.json</a>.</p>"
+    )
+    yield PAGE_FOOTER
+
+
+def _write_table_sidecar(
+    path: Path,
+    references: List[Tuple[Path, int, str]],
+    column_references: Dict[str, List[Tuple[Path, int, str]]],
+    clone_path: Path,
+) -> None:
+    """
+    Every reference of the table as compact JSON: the files are listed once
+    and references point to them by index.
+    """
+    files = []
+    file_index = {}
+
+    def index_of(file_path: Path) -> int:
+        if file_path not in file_index:
+            file_index[file_path] = len(files)
+            files.append(file_path.relative_to(clone_path).as_posix())
+        return file_index[file_path]
+
+    references_data = [
+        [index_of(file_path), position, snippet]
+        for file_path, position, snippet in references
+    ]
+    columns_data = {
+        col: [[index_of(file_path), position] for file_path, position, _ in refs]
+        for col, refs in column_references.items()
+    }
+    data = {"files": files, "references": references_data, "columns": columns_data}
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+
+
+def generate_paged_report(
+    create_table_statements: Dict[str, Tuple[Path, int]],
+    table_references: Dict[str, List[Tuple[Path, int, str]]],
+    unused_tables: List[Tuple[str, Path]],
+    table_columns: Dict[str, List[str]],
+    column_references: Dict[str, Dict[str, List[Tuple[Path, int, str]]]],
+    unused_columns: Dict[str, List[str]],
+    queries: Iterable[Dict],
+    output_dir: Path,
+    repo_url: str,
+    clone_path: Path,
+    branch: str = "master",
+    blame: Optional[BlameService] = None,
+    page_size: int = 100,
+    max_references: int = 1000,
+    max_files: int = 50,
+    query_statistics: Optional[Dict] = None,
+    tables: Optional[Set[str]] = None,
+) -> None:
+    """
+    Write the report as an index page plus one set of pages per table.
+    Given `tables`, only the pages of these tables are written again with
+    the index, the other ones being up to date.
+
+    The references of a table are split in pages of `page_size` and at most
+    `max_references` of them are rendered as HTML, all of them are in the
+    JSON sidecar of the table. Only the `max_files` files with the most
+    queries are listed on the index page.
+    """
+    if query_statistics is None:
+        query_statistics = compute_query_statistics(queries, clone_path, examples=0)
+    if blame is None:
+        blame = BlameService(clone_path)
+    blame.prefetch(path for path, _ in create_table_statements.values())
+
+    tables_dir = output_dir / "tables"
+    tables_dir.mkdir(parents=True, exist_ok=True)
+
+    def creation_text(table: str) -> str:
+        creation_data = create_table_statements.get(table)
+        if not creation_data:
+            return "<p>Definition file unknown.</p>"
+        creation_file, creation_line = creation_data
+        relative_path = creation_file.relative_to(clone_path).as_posix()
+        creation_date = blame.get_line_creation_date(creation_file, creation_line)
+        creation_date_text = f" (Created on: {creation_date})" if creation_date else ""
+        link = _source_link(
+            repo_url,
+            branch,
+            relative_path,
+            creation_line,
+            f"{relative_path}, Line: {creation_line}",
+        )
+        return f"<p>Defined in: {link}{creation_date_text}</p>"
+
+    # One table at a time, only its own pages are rendered at any moment
+    table_pages = {}
+    for table, references in table_references.items():
+        if tables is not None and table not in tables:
+            table_pages[table] = len(references)
+            continue
+        table_column_references = column_references.get(table, {})
+        columns = [
+            (col, len(table_column_references.get(col, [])))
+            for col in table_columns.get(table, [])
+        ]
+        shown = references[:max_references]
+        page_count = max(1, -(-len(shown) // page_size))
+        text = creation_text(table)
+        # Pages of an earlier generation with more references
+        _remove_pages_from(tables_dir, table, page_count + 1)
+        for page in range(1, page_count + 1):
+            _write_page(
+                tables_dir / _page_name(table, page),
+                _render_table_page(
+                    table,
+                    page,
+                    page_count,
+                    shown[(page - 1) * page_size : page * page_size],
+                    len(references),
+                    text,
+                    columns,
+                    clone_path,
+                    repo_url,
+                    branch,
+                ),
+            )
+        _write_table_sidecar(
+            tables_dir / f"{table}.json",
+            references,
+            table_column_references,
+            clone_path,
+        )
+        table_pages[table] = len(references)
+
+    _write_page(
+        output_dir / "index.html",
+        _render_index(
+            create_table_statements,
+            table_pages,
+            unused_tables,
+            unused_columns,
+            query_statistics,
+            clone_path,
+            repo_url,
+            branch,
+            max_files,
+        ),
+    )
+    blame.save()
+
+
+def _render_index(
+    create_table_statements: Dict[str, Tuple[Path, int]],
+    table_pages: Dict[str, int],
+    unused_tables: List[Tuple[str, Path]],
+    unused_columns: Dict[str, List[str]],
+    query_statistics: Dict,
+    clone_path: Path,
+    repo_url: str,
+    branch: str,
+    max_files: int,
+) -> Iterator[str]:
+    yield PAGE_HEADER.format(title="Database Table Usage Report")
+    yield "<h1>Database Table Usage Report</h1>"
+
+    yield "<h2>Summary</h2>"
+    yield f"<p>Total tables: {len(create_table_statements)}</p>"
+    yield f"<p>Unused tables: {len(unused_tables)}</p>"
+    if unused_tables:
+        yield "<ul>"
+        for table, creation_file in unused_tables:
+            creation_line = create_table_statements[table][1]
+            relative_path = creation_file.relative_to(clone_path).as_posix()
+            link = _source_link(repo_url, branch, relative_path, creation_line, table)
+            yield (
+                f"<li>{link} (Defined in: {escape(relative_path)}, "
+                f"Line: {creation_line})</li>"
+            )
+        yield "</ul>"
+
+    total_unused_columns = sum(len(cols) for cols in unused_columns.values())
+    yield f"<p>Unused columns: {total_unused_columns}</p>"
+    if total_unused_columns > 0:
+        yield "<ul>"
+        for table, cols in unused_columns.items():
+            columns_text = escape(", ".join(cols))
+            yield f"<li><strong>{escape(table)}</strong>: {columns_text}</li>"
+        yield "</ul>"
+
+    yield "<h2>Tables</h2><ul>"
+    for table, reference_count in table_pages.items():
+        yield (
+            f"<li><a href='tables/{quote(table)}.html'>{escape(table)}</a>: "
+            f"{reference_count} references</li>"
+        )
+    yield "</ul>"
+
+    yield "<h2>Query Statistics</h2>"
+    yield (
+        "<table border='1'><tr><th>Query Type</th><th>Count</th>"
+        "<th>Average Complexity</th></tr>"
+    )
+    for qtype, count, avg_complexity in query_statistics["types"]:
+        yield f"<tr><td>{qtype}</td><td>{count}</td><td>{avg_complexity:.2f}</td></tr>"
+    yield "</table>"
+
+    yield "<h3>Distribution Over Code Base</h3>"
+    queries_by_file = query_statistics["files"]
+    if queries_by_file:
+        yield f"<p>Files with the most queries (at most {max_files}):</p><ol>"
+        for filepath, qcount in queries_by_file[:max_files]:
+            yield f"<li>{escape(filepath)}: {qcount} queries</li>"
+        yield "</ol>"
+        hidden = len(queries_by_file) - max_files
+        if hidden > 0:
+            yield f"<p>{hidden} more files contain queries.</p>"
+    else:
+        yield "<p>No queries found.</p>"
+
+    yield "<h3>Repeated Statements</h3>"
+    repeated = [group for group in query_statistics["groups"] if group["count"] > 1]
+    yield (
+        f"<p>{query_statistics['statements']} distinct statements, "
+        f"{query_statistics['repeated']} of them at "
+        f"several call sites (at most {max_files}):</p>"
+    )
+    if repeated:
+        yield (
+            "<table border='1'><tr><th>Statement</th><th>Type</th>"
+            "<th>Call Sites</th><th>Files</th><th>First Call</th></tr>"
+        )
+        for group in repeated[:max_files]:
+            relative_path, line = group["sites"][0]
+            link = _source_link(
+                repo_url, branch, relative_path, line, f"{relative_path}:{line}"
+            )
+            yield (
+                f"<tr><td><code>{escape(group['statement'][:200])}</code></td>"
+                f"<td>{group['type']}</td><td>{group['count']}</td>"
+                f"<td>{group['files']}</td><td>{link}</td></tr>"
+            )
+        yield "</table>"
+    yield PAGE_FOOTER
@@ -1,27 +1,21 @@
 import re
 
-from pathlib import Path
-
-from typing import Dict, List, Tuple
-from lexer import lex_file, Token, TokenType
-
-
-def parse_files(
-    java_files: List[str],
-) -> Tuple[Dict[str, Tuple[Path, int]], Dict[str, List[str]]]:
-    results_dict = {}
-    tables_columns = {}
-    for jf in java_files:
-        tokens = lex_file(jf)
-        constants_map = extract_constants(tokens)
-        parser = Parser(tokens, constants_map)
-        parser.parse()
-        for t, line in parser.tables_with_lines:
-            results_dict[t] = (Path(jf), line if line is not None else 1)
-        for t in parser.tables_columns:
-            tables_columns[t] = parser.tables_columns[t]
-    print(f"Found {len(results_dict)} tables")
-    return results_dict, tables_columns
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from lexer import Token, TokenType
+from symbols import (
+    SymbolTable,
+    class_scopes,
+    extract_constant_definitions,
+    read_name,
+    read_package,
+    scope_at,
+    skip_comment,
+)
+
+CREATE_TABLE_PATTERN = re.compile(
+    r"CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?([A-Za-z0-9_]+)\s*\((.*?)\)",
+    re.IGNORECASE | re.DOTALL,
+)
 
 
 def extract_constants(tokens):
@@ -29,173 +23,327 @@ def extract_constants(tokens):
     Extract constants of forms like:
     static final String IDENT = "VALUE";
 
-    Also handle concatenation of strings and constants.
+    Also handle concatenation of strings and constants, in any order and
+    across the classes of the file. Constants of other files are not known
+    here, see SymbolTable for the whole project.
+    """
+    symbols = SymbolTable()
+    symbols.add_file("", read_package(tokens), extract_constant_definitions(tokens))
+    return {
+        qualified.rpartition(".")[2]: symbols.value(qualified)
+        for qualified in symbols.definitions
+    }
+
+
+def assemble_sql(
+    parts: List, fallback_line: int, resolve: Callable[[str], str]
+) -> Tuple[str, int]:
+    """
+    Build the SQL string of parts read by read_arguments, with the line of
+    its first string or resolved constant.
+    """
+    sql_parts = []
+    min_line = None
+    for kind, text, line in parts:
+        if kind == "r":
+            text = resolve(text)
+            if not text:
+                continue
+        sql_parts.append(text)
+        if min_line is None or line < min_line:
+            min_line = line
+    return "".join(sql_parts), min_line if min_line is not None else fallback_line
+
+
+# Names in arguments that are not constants, "new" being followed by the
+# type created
+_NOT_CONSTANTS = {"null", "true", "false", "new"}
+
+
+def read_arguments(tokens: List[Token], pos: int) -> Tuple[List[List], int, int]:
+    """
+    Strings and (dotted) names of the constants of every argument of a
+    call, from the token after its '(' up to the matching ')'. Each
+    argument is a list of parts, ["s", string, line] for a string and
+    ["r", name, line] for a name to resolve. The elements of an array
+    initializer are separated by a ", " string. Returns the arguments, the
+    line after the call and the position after the ')'.
     """
-    constants_map = {}
     length = len(tokens)
-    i = 0
-    while i < length:
-        # Look for pattern: static final String <NAME> = ...
-        if (
-            i < length
-            and tokens[i].type == TokenType.IDENTIFIER
-            and tokens[i].value == "static"
-        ):
-            # Check if next tokens are 'final String'
-            if (
-                i + 1 < length
-                and tokens[i + 1].type == TokenType.IDENTIFIER
-                and tokens[i + 1].value == "final"
-                and i + 2 < length
-                and tokens[i + 2].type == TokenType.IDENTIFIER
-                and tokens[i + 2].value == "String"
-                and i + 3 < length
-                and tokens[i + 3].type == TokenType.IDENTIFIER
-            ):
-                name = tokens[i + 3].value
-                # Next should be '='
+    arguments = [[]]
+    openers = []  # '(', '[' and '{' opened in the arguments
+    if pos < length and tokens[pos].type == TokenType.RPAREN:
+        arguments = []
+    while pos < length:
+        current = tokens[pos]
+        if current.type == TokenType.EOF:
+            break
+        if current.type == TokenType.RPAREN:
+            pos += 1
+            if not openers:
+                break
+            openers.pop()
+        elif current.type == TokenType.LPAREN:
+            openers.append("(")
+            pos += 1
+        elif current.type == TokenType.STRING:
+            arguments[-1].append(["s", current.value, current.line])
+            pos += 1
+        elif current.type == TokenType.IDENTIFIER:
+            if current.value in _NOT_CONSTANTS:
+                pos += 1
                 if (
-                    i + 4 < length
-                    and tokens[i + 4].type == TokenType.OTHER
-                    and tokens[i + 4].value == "="
+                    current.value == "new"
+                    and pos < length
+                    and tokens[pos].type == TokenType.IDENTIFIER
                 ):
-                    # Collect right hand side until SEMI
-                    j = i + 5
-                    rhs_tokens = []
-                    while (
-                        j < length
-                        and tokens[j].type != TokenType.SEMI
-                        and tokens[j].type != TokenType.EOF
-                    ):
-                        rhs_tokens.append(tokens[j])
-                        j += 1
-                    if j < length and tokens[j].type == TokenType.SEMI:
-                        # Evaluate rhs_tokens
-                        buffer_str = ""
-                        for rt in rhs_tokens:
-                            if rt.type == TokenType.STRING:
-                                buffer_str += rt.value
-                            elif rt.type == TokenType.IDENTIFIER:
-                                # Substitute if we already have this constant
-                                buffer_str += constants_map.get(rt.value, "")
-                            # Ignore '+' and other tokens
-                        constants_map[name] = buffer_str
-                        i = j + 1
-                        continue
-        i += 1
-    return constants_map
+                    _, pos = read_name(tokens, pos)
+                continue
+            name, pos = read_name(tokens, pos)
+            arguments[-1].append(["r", name, current.line])
+        else:
+            value = current.value
+            if value in ("[", "{"):
+                openers.append(value)
+            elif value in ("]", "}"):
+                if openers:
+                    openers.pop()
+            elif value == ",":
+                if not openers:
+                    arguments.append([])
+                elif openers[-1] == "{":
+                    arguments[-1].append(["s", ", ", current.line])
+            pos += 1
 
+    line = tokens[pos].line if pos < length else 0
+    return arguments, line or 0, pos
 
-class Parser:
-    def __init__(self, tokens, constants_map=None):
-        self.tokens = tokens
-        self.pos = 0
-        self.length = len(tokens)
-        self.tables_with_lines = []
-        self.tables_columns = {}  # table_name -> list of columns
-        self.constants_map = constants_map if constants_map else {}
-
-    def peek(self):
-        if self.pos < self.length:
-            return self.tokens[self.pos]
-        return Token(TokenType.EOF, None, 0)
-
-    def advance(self):
-        if self.pos < self.length:
-            self.pos += 1
-
-    def parse(self):
-        # Look for pattern: db '.' execSQL '(' ... ')'
-        while self.peek().type != TokenType.EOF:
-            t = self.peek()
-            if t.type == TokenType.IDENTIFIER and t.value == "db":
-                self.advance()
-                if self.peek().type == TokenType.DOT:
-                    self.advance()
-                    if (
-                        self.peek().type == TokenType.IDENTIFIER
-                        and self.peek().value == "execSQL"
-                    ):
-                        self.advance()
-                        if self.peek().type == TokenType.LPAREN:
-                            self.advance()
-                            sql, line = self.extractFullSQL()  # parse the argument
-                            if sql:
-                                self.extract_tables(sql, line)
-            else:
-                self.advance()
-
-    def extractFullSQL(self):
-        # Parse until matching closing parenthesis
-        paren_depth = 1
-        sql_parts = []
-        min_line = None
-        while True:
-            current = self.peek()
-            if current.type == TokenType.EOF:
-                break
-            if current.type == TokenType.RPAREN:
-                paren_depth -= 1
-                self.advance()
-                if paren_depth == 0:
-                    break
-            elif current.type == TokenType.STRING:
-                sql_parts.append(current.value)
-                if min_line is None or current.line < min_line:
-                    min_line = current.line
-                self.advance()
-            elif current.type == TokenType.IDENTIFIER:
-                resolved = self.constants_map.get(current.value, "")
-                if resolved and (min_line is None or current.line < min_line):
-                    min_line = current.line
-                sql_parts.append(resolved)
-                self.advance()
-            elif current.type == TokenType.OTHER and current.value == "+":
-                self.advance()
-            elif current.type == TokenType.LPAREN:
-                paren_depth += 1
-                self.advance()
+
+# DB methods whose first argument is the SQL statement run
+SQL_ARGUMENT_METHODS = {
+    "execSQL",
+    "rawQuery",
+    "compileStatement",
+    "execute",
+    "prepareStatement",
+    "executeQuery",
+}
+
+# The statement run by the other DB methods, built from their arguments:
+# method -> [(numbers of arguments, clauses)], a clause being (SQL text,
+# index of the argument following it, text used when the argument is
+# missing or None to leave the clause out). The number of arguments tells
+# the overloads apart, and other methods of the same name (e.g.
+# String.replace) from the ones of SQLiteDatabase.
+STATEMENT_TEMPLATES = {
+    "query": [
+        (
+            (7, 8),
+            [
+                ("SELECT ", 1, "*"),
+                (" FROM ", 0, ""),
+                (" WHERE ", 2, None),
+                (" GROUP BY ", 4, None),
+                (" HAVING ", 5, None),
+                (" ORDER BY ", 6, None),
+                (" LIMIT ", 7, None),
+            ],
+        ),
+        (
+            # query(distinct, table, ...)
+            (9, 10),
+            [
+                ("SELECT ", 2, "*"),
+                (" FROM ", 1, ""),
+                (" WHERE ", 3, None),
+                (" GROUP BY ", 5, None),
+                (" HAVING ", 6, None),
+                (" ORDER BY ", 7, None),
+                (" LIMIT ", 8, None),
+            ],
+        ),
+    ],
+    "insert": [((3,), [("INSERT INTO ", 0, "")])],
+    "replace": [((3,), [("REPLACE INTO ", 0, "")])],
+    "update": [
+        ((4,), [("UPDATE ", 0, ""), (" SET ?", None, ""), (" WHERE ", 2, None)])
+    ],
+    "delete": [((3,), [("DELETE FROM ", 0, ""), (" WHERE ", 1, None)])],
+}
+
+
+def statement_parts(method: str, arguments: List[List], line: int) -> List:
+    """
+    Unresolved parts (see read_arguments) of the SQL statement run by a DB
+    call: its first argument for SQL_ARGUMENT_METHODS, the statement of
+    STATEMENT_TEMPLATES for the others, none if the call matches neither.
+    """
+    if method in SQL_ARGUMENT_METHODS:
+        return arguments[0] if arguments else []
+    for counts, clauses in STATEMENT_TEMPLATES.get(method, []):
+        if len(arguments) not in counts:
+            continue
+        parts = []
+        for text, index, default in clauses:
+            argument = (
+                arguments[index]
+                if index is not None and index < len(arguments)
+                else []
+            )
+            if argument:
+                parts.append(["s", text, line])
+                parts.extend(argument)
+            elif default is not None:
+                parts.append(["s", text + default, line])
+        return parts
+    return []
+
+
+class Call(NamedTuple):
+    """
+    A call <receiver>.<method>(args) found by CallMatcher. The receiver is
+    the name before the dot, "" when it is not a name (e.g. the result of
+    another call).
+    """
+
+    method: str
+    receiver: str
+    position: int  # index of the method name in the tokens
+    line: int
+    arguments: List[List]  # unresolved parts of each one, see read_arguments
+    end_line: int  # line after the call
+
+
+class CallMatcher:
+    """
+    Find the calls <receiver>.<method>(args) of a file in one pass over its
+    tokens, for a table of the kinds of calls looked for:
+
+        {kind: (method names, receiver names, None for any receiver)}
+
+    A call is found under every kind it matches. Its arguments are read up
+    to the matching ')', over several lines if need be. Calls in comments
+    are skipped.
+    """
+
+    def __init__(
+        self, kinds: Dict[str, Tuple[Iterable[str], Optional[Iterable[str]]]]
+    ):
+        self.kinds = list(kinds)
+        # method name -> [(kind, receiver names or None)]
+        self.methods = {}
+        for kind, (methods, receivers) in kinds.items():
+            if receivers is not None:
+                receivers = frozenset(receivers)
+            for method in methods:
+                self.methods.setdefault(method, []).append((kind, receivers))
+
+    def find_calls(self, tokens: List[Token]) -> Dict[str, List[Call]]:
+        calls = {kind: [] for kind in self.kinds}
+        methods = self.methods
+        identifier = TokenType.IDENTIFIER
+        skip_to = 0
+        for i, tok in enumerate(tokens):
+            if i < skip_to:
+                continue
+            value = tok.value
+            if value == "/":
+                if tok.type == TokenType.OTHER:
+                    skip_to = skip_comment(tokens, i)
+                continue
+            if (
+                value not in methods
+                or tok.type != identifier
+                or tokens[i - 1].type != TokenType.DOT
+                or tokens[i + 1].type != TokenType.LPAREN
+            ):
+                continue
+            before = tokens[i - 2] if i >= 2 else None
+            if before is not None and before.type == identifier:
+                receiver = before.value
             else:
-                self.advance()
+                receiver = ""
+            arguments = None
+            for kind, receivers in methods[value]:
+                if receivers is None or receiver in receivers:
+                    if arguments is None:
+                        arguments, end_line, _ = read_arguments(tokens, i + 2)
+                    calls[kind].append(
+                        Call(value, receiver, i, tok.line, arguments, end_line)
+                    )
+        return calls
+
+
+# The db.execSQL calls, whose SQL may create the tables
+EXEC_SQL_CALLS = {"execSQL": (["execSQL"], ["db"])}
+_EXEC_SQL_MATCHER = CallMatcher(EXEC_SQL_CALLS)
 
-        return "".join(sql_parts), (
-            min_line
-            if min_line is not None
-            else (self.peek().line if self.peek().line else 0)
-        )
 
-    def extract_tables(self, sql, line):
-        # Look for CREATE TABLE statements and extract table name and columns
-        pattern = re.compile(
-            r"CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?([A-Za-z0-9_]+)\s*\((.*?)\)",
-            re.IGNORECASE | re.DOTALL,
+def exec_sql_calls(
+    calls: List[Call], scopes: List[Tuple[int, str]]
+) -> List[Tuple[str, List, int]]:
+    # (class path, unresolved parts, fallback line) of db.execSQL calls
+    return [
+        (
+            scope_at(scopes, c.position),
+            statement_parts(c.method, c.arguments, c.line),
+            c.end_line,
         )
-        match = pattern.search(sql)
-        if match:
-            table_name = match.group(2)
-            cols_str = match.group(3)
-            columns = self.parse_columns(cols_str)
-            self.tables_with_lines.append((table_name, line))
-            self.tables_columns[table_name] = columns
-
-    def parse_columns(self, cols_str: str) -> List[str]:
-        # Simple column parsing
-        cols_str = cols_str.strip().rstrip(");")
-        col_defs = [c.strip() for c in cols_str.split(",")]
-
-        constraint_keywords = {
-            "PRIMARY",
-            "FOREIGN",
-            "UNIQUE",
-            "CHECK",
-            "CONSTRAINT",
-            "KEY",
-        }
-        columns = []
-        for cdef in col_defs:
-            parts = cdef.split()
-            if len(parts) > 0:
-                first = parts[0].strip('"`[]')
-                if first.upper() not in constraint_keywords:
-                    columns.append(first)
-        return columns
+        for c in calls
+    ]
+
+
+def find_create_table(sql: str) -> Optional[Tuple[str, List[str]]]:
+    # Look for CREATE TABLE statements and extract table name and columns
+    match = CREATE_TABLE_PATTERN.search(sql)
+    if match:
+        return match.group(2), parse_columns(match.group(3))
+    return None
+
+
+def parse_columns(cols_str: str) -> List[str]:
+    # Simple column parsing
+    cols_str = cols_str.strip().rstrip(");")
+    col_defs = [c.strip() for c in cols_str.split(",")]
+
+    constraint_keywords = {
+        "PRIMARY",
+        "FOREIGN",
+        "UNIQUE",
+        "CHECK",
+        "CONSTRAINT",
+        "KEY",
+    }
+    columns = []
+    for cdef in col_defs:
+        parts = cdef.split()
+        if len(parts) > 0:
+            first = parts[0].strip('"`[]')
+            if first.upper() not in constraint_keywords:
+                columns.append(first)
+    return columns
+
+
+class Parser:
+    """
+    Find the db.execSQL(...) calls of a file, see EXEC_SQL_CALLS.
+
+    The SQL argument of every call is kept unresolved in sql_calls as
+    (class path, parts, fallback line), the CREATE TABLE statements are
+    extracted once the constants of the project are known, see
+    analysis.find_create_table_statements.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.sql_calls = []
+        self.scopes = class_scopes(tokens)
+
+    def parse(self, calls: Optional[List[Call]] = None):
+        """
+        Collect the db.execSQL calls, the ones given if the tokens were
+        already searched by a CallMatcher with EXEC_SQL_CALLS.
+        """
+        if calls is None:
+            calls = _EXEC_SQL_MATCHER.find_calls(self.tokens)["execSQL"]
+        self.sql_calls.extend(exec_sql_calls(calls, self.scopes))
@@ -0,0 +1,187 @@
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+T = TypeVar("T")
+
+
+def peak_rss_kb(who: Optional[int] = None) -> Optional[int]:
+    """
+    Peak resident set size of this process (or of its finished children
+    with resource.RUSAGE_CHILDREN) in KiB, None where it is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in KiB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _children_cpu_seconds() -> float:
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Profiler:
+    """
+    Wall and CPU time of the phases of a run, the slowest files of every
+    phase, counters and peak memory.
+
+    profile() gives everything as a JSON friendly dict, trace_events() as
+    Chrome trace events (chrome://tracing, Perfetto). Files may be reported
+    from threads and, with their own start time and pid, from other
+    processes.
+    """
+
+    def __init__(self, slowest: int = 10):
+        self.slowest = slowest
+        self.phases: List[Dict] = []
+        self.counters: Counter = Counter()
+        self._files: Dict[str, List] = defaultdict(list)  # min-heaps
+        self._events: List[Dict] = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def _ts(self, perf_time: float) -> float:
+        # Trace events are in microseconds from the start of the run
+        return round((perf_time - self._origin) * 1e6, 1)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        children_start = _children_cpu_seconds()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            phase = {
+                "name": name,
+                "wall_seconds": round(end - start, 4),
+                "cpu_seconds": round(time.process_time() - cpu_start, 4),
+                "children_cpu_seconds": round(
+                    _children_cpu_seconds() - children_start, 4
+                ),
+                "peak_rss_kb": peak_rss_kb(),
+            }
+            self.phases.append(phase)
+            with self._lock:
+                self._events.append(
+                    {
+                        "name": name,
+                        "cat": "phase",
+                        "ph": "X",
+                        "ts": self._ts(start),
+                        "dur": round((end - start) * 1e6, 1),
+                        "pid": self._pid,
+                        "tid": 0,
+                    }
+                )
+                if phase["peak_rss_kb"] is not None:
+                    self._events.append(
+                        {
+                            "name": "peak_rss_kb",
+                            "ph": "C",
+                            "ts": self._ts(end),
+                            "pid": self._pid,
+                            "args": {"peak_rss_kb": phase["peak_rss_kb"]},
+                        }
+                    )
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def file_time(
+        self,
+        phase: str,
+        path: str,
+        start: float,
+        seconds: float,
+        pid: Optional[int] = None,
+        tid: Optional[int] = None,
+    ) -> None:
+        """
+        Record the time spent on one file, start being a time.perf_counter()
+        value of this or of another process on the same machine.
+        """
+        with self._lock:
+            slowest = self._files[phase]
+            if len(slowest) < self.slowest:
+                heapq.heappush(slowest, (seconds, path))
+            else:
+                heapq.heappushpop(slowest, (seconds, path))
+            self._events.append(
+                {
+                    "name": Path(path).name,
+                    "cat": phase,
+                    "ph": "X",
+                    "ts": self._ts(start),
+                    "dur": round(seconds * 1e6, 1),
+                    "pid": pid if pid is not None else self._pid,
+                    "tid": tid if tid is not None else threading.get_ident(),
+                    "args": {"path": path},
+                }
+            )
+
+    def each(
+        self, phase: str, items: Iterable[T], name: Callable[[T], str]
+    ) -> Iterator[T]:
+        """
+        Yield the items, timing the work done on each one by the consumer
+        until it asks for the next one.
+        """
+        for item in items:
+            start = time.perf_counter()
+            yield item
+            self.file_time(phase, name(item), start, time.perf_counter() - start)
+
+    def profile(self) -> Dict:
+        return {
+            "phases": self.phases,
+            "counters": dict(self.counters),
+            "slowest_files": {
+                phase: [
+                    {"path": path, "seconds": round(seconds, 6)}
+                    for seconds, path in sorted(slowest, reverse=True)
+                ]
+                for phase, slowest in self._files.items()
+            },
+            "peak_rss_kb": peak_rss_kb(),
+            "children_peak_rss_kb": (
+                peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None
+            ),
+        }
+
+    def trace_events(self) -> Dict:
+        return {"traceEvents": self._events, "displayTimeUnit": "ms"}
+
+    def write(self, path: Path) -> None:
+        with Path(path).open("w", encoding="utf-8") as f:
+            json.dump(self.profile(), f, indent=2)
+
+    def write_trace(self, path: Path) -> None:
+        with Path(path).open("w", encoding="utf-8") as f:
+            json.dump(self.trace_events(), f)
+
+    def print_summary(self) -> None:
+        for phase in self.phases:
+            print(
+                f"  {phase['name']}: {phase['wall_seconds']:.3f}s wall, "
+                f"{phase['cpu_seconds'] + phase['children_cpu_seconds']:.3f}s CPU"
+            )
@@ -0,0 +1,153 @@
+import json
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+DATA_VERSION = 1
+
+# Types of the "Reference Summary" of a table, in this order
+REFERENCE_TYPES = ["SELECT", "INSERT", "UPDATE", "DELETE", "CREATE", "UNKNOWN"]
+
+
+def classify_reference(snippet: str) -> str:
+    """
+    Type of a reference to a table, the first SQL keyword of
+    REFERENCE_TYPES found in its line.
+    """
+    upper = snippet.upper()
+    for reference_type in REFERENCE_TYPES[:-1]:
+        if reference_type in upper:
+            return reference_type
+    return "UNKNOWN"
+
+
+def add_to_group(groups: Dict[str, Dict], query: Dict, relative_path: str) -> bool:
+    """
+    Add a call site to the group of its statement, see group_queries.
+    Returns True if it is the first call site of the statement.
+    """
+    group = groups.get(query["fingerprint"])
+    first = group is None
+    if first:
+        group = groups[query["fingerprint"]] = {
+            "fingerprint": query["fingerprint"],
+            "statement": query["statement"],
+            "type": query["type"],
+            "complexity": query["complexity"],
+            "count": 0,
+            "sites": [],
+        }
+    group["count"] += 1
+    group["sites"].append((relative_path, query["line"]))
+    return first
+
+
+def sorted_groups(groups: Dict[str, Dict]) -> List[Dict]:
+    # Most call sites first, then in order of appearance
+    for group in groups.values():
+        group["files"] = len({path for path, _ in group["sites"]})
+    return sorted(groups.values(), key=lambda group: -group["count"])
+
+
+def group_queries(queries: Iterable[Dict], clone_path: Path) -> List[Dict]:
+    """
+    The queries grouped by statement fingerprint, most call sites first:
+    {'fingerprint', 'statement', 'type', 'complexity', 'count', 'files',
+    'sites'}, sites being the (relative path, line) of every call and files
+    the number of files they are in.
+    """
+    groups = {}
+    for q in queries:
+        add_to_group(groups, q, q["file"].relative_to(clone_path).as_posix())
+    return sorted_groups(groups)
+
+
+def compute_query_statistics(
+    queries: Iterable[Dict], clone_path: Path, examples: int = 5
+) -> Dict:
+    """
+    Statistics of the queries, iterated once:
+    - "types": (type, count, average complexity), in order of appearance
+    - "files": (relative path, count), most queries first
+    - "examples": the first `examples` distinct statements of every type
+    - "groups": the queries grouped by statement, see group_queries
+    - "statements": the number of distinct statements
+    - "repeated": the number of them run at several call sites
+    """
+    counts = {}
+    files = Counter()
+    groups = {}
+    type_examples = defaultdict(list)
+    for q in queries:
+        count = counts.setdefault(q["type"], [0, 0])
+        count[0] += 1
+        count[1] += q["complexity"]
+        relative_path = q["file"].relative_to(clone_path).as_posix()
+        files[relative_path] += 1
+        first = add_to_group(groups, q, relative_path)
+        if first and len(type_examples[q["type"]]) < examples:
+            type_examples[q["type"]].append(q)
+    return {
+        "types": [
+            (qtype, count, complexity / count)
+            for qtype, (count, complexity) in counts.items()
+        ],
+        "files": files.most_common(),
+        "examples": dict(type_examples),
+        "groups": sorted_groups(groups),
+        "statements": len(groups),
+        "repeated": sum(1 for group in groups.values() if group["count"] > 1),
+    }
+
+
+def data_path(report_path: Path) -> Path:
+    """
+    Sidecar of a report: usage.json in a paged report directory, or
+    <name>.usage.json next to a single page report.
+    """
+    if report_path.suffix == ".html":
+        return report_path.with_suffix(".usage.json")
+    return report_path / "usage.json"
+
+
+def build_usage_data(
+    create_table_statements: Dict[str, Tuple[Path, int]],
+    table_references: Dict[str, List[Tuple[Path, int, str]]],
+    table_columns: Dict[str, List[str]],
+    unused_columns: Dict[str, List[str]],
+    query_statistics: Dict,
+) -> Dict:
+    """
+    Counts of a report, column by column: one entry per table in "tables",
+    the reference counts as a table x type matrix, the count and average
+    complexity of the queries of every type, and the number of distinct
+    statements.
+    """
+    tables = list(create_table_statements)
+    reference_counts = []
+    for table in tables:
+        counts = Counter(
+            classify_reference(snippet)
+            for _, _, snippet in table_references.get(table, [])
+        )
+        reference_counts.append([counts[t] for t in REFERENCE_TYPES])
+
+    query_types = sorted(query_statistics["types"])
+
+    return {
+        "version": DATA_VERSION,
+        "tables": tables,
+        "columns": [len(table_columns.get(table, [])) for table in tables],
+        "unused_columns": [len(unused_columns.get(table, [])) for table in tables],
+        "reference_types": REFERENCE_TYPES,
+        "reference_counts": reference_counts,
+        "query_types": [qtype for qtype, _, _ in query_types],
+        "query_counts": [count for _, count, _ in query_types],
+        "query_complexity": [round(average, 2) for _, _, average in query_types],
+        "statements": query_statistics["statements"],
+    }
+
+
+def write_usage_data(path: Path, data: Dict) -> None:
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
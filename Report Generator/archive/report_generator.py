@@ -1,8 +1,9 @@
-from collections import defaultdict
+from html import escape
 from pathlib import Path
 from urllib.parse import quote
-from typing import Dict, List, Tuple
-from git_operations import get_line_creation_date
+from typing import Dict, List, Optional, Tuple
+from git_operations import BlameService
+from report_data import compute_query_statistics
 
 
 def generate_html_report(
@@ -17,7 +18,22 @@ def generate_html_report(
     repo_url: str,
     clone_path: Path,
     branch: str = "master",
+    blame: Optional[BlameService] = None,
+    query_statistics: Optional[Dict] = None,
+    max_statements: int = 50,
 ) -> None:
+    """
+    Write the report as a single HTML page. Like the paged report, only
+    the `max_statements` repeated statements with the most call sites are
+    listed.
+    """
+    if query_statistics is None:
+        query_statistics = compute_query_statistics(queries, clone_path)
+    if blame is None:
+        blame = BlameService(clone_path)
+    # Blame every file defining a table up front, one git process per file
+    blame.prefetch(path for path, _ in create_table_statements.values())
+
     with output_path.open("w", encoding="utf-8") as f:
         f.write("<html><head><title>Database Table Usage Report</title></head><body>")
         f.write("<h1>Database Table Usage Report</h1>")
@@ -31,8 +47,8 @@ def generate_html_report(
             for table, creation_file in unused_tables:
                 creation_line = create_table_statements[table][1]
                 relative_path = creation_file.relative_to(clone_path).as_posix()
-                creation_date = get_line_creation_date(
-                    clone_path, creation_file, creation_line
+                creation_date = blame.get_line_creation_date(
+                    creation_file, creation_line
                 )
                 creation_date_text = (
                     f" (Created on: {creation_date})" if creation_date else ""
@@ -66,8 +82,8 @@ def generate_html_report(
             if creation_data:
                 creation_file, creation_line = creation_data
                 relative_path = creation_file.relative_to(clone_path).as_posix()
-                creation_date = get_line_creation_date(
-                    clone_path, creation_file, creation_line
+                creation_date = blame.get_line_creation_date(
+                    creation_file, creation_line
                 )
                 creation_date_text = (
                     f" (Created on: {creation_date})" if creation_date else ""
@@ -122,42 +138,34 @@ def generate_html_report(
                     f.write("<p>No references found for this column.</p>")
 
         # Add Query Statistics Section
-        generate_query_statistics_section(f, queries, clone_path, repo_url, branch)
+        generate_query_statistics_section(
+            f, query_statistics, clone_path, repo_url, branch, max_statements
+        )
 
         f.write("</body></html>")
 
+    blame.save()
+
 
 def generate_query_statistics_section(
-    f, queries: List[Dict], clone_path: Path, repo_url: str, branch: str
+    f,
+    query_statistics: Dict,
+    clone_path: Path,
+    repo_url: str,
+    branch: str,
+    max_statements: int = 50,
 ):
     """
     Generate an HTML section with detailed, commented statistics about the database queries:
     - Their type (SELECT, DELETE, INSERT, UPDATE, CREATE, etc.)
     - Their complexity (based on a simple heuristic)
     - Their distribution over the code base (which files contain the most queries)
-    """
-
-    # Compute queries by type
-    queries_by_type = defaultdict(list)
-    for q in queries:
-        queries_by_type[q["type"]].append(q)
+    - The statements run at several call sites, the `max_statements` most run
 
-    # Compute complexity statistics
-    # For each type, what is the average complexity?
-    complexity_stats = {}
-    for qtype, qlist in queries_by_type.items():
-        complexities = [q["complexity"] for q in qlist]
-        avg_complexity = sum(complexities) / len(complexities) if complexities else 0
-        complexity_stats[qtype] = (len(qlist), avg_complexity)
-
-    # Distribution by file: count queries per file
-    queries_by_file = defaultdict(int)
-    for q in queries:
-        relative_path = q["file"].relative_to(clone_path).as_posix()
-        queries_by_file[relative_path] += 1
-
-    # Sort files by number of queries descending
-    files_sorted = sorted(queries_by_file.items(), key=lambda x: x[1], reverse=True)
+    The statistics are computed by compute_query_statistics, or by a query
+    of the results store.
+    """
+    files_sorted = query_statistics["files"]
 
     f.write("<h2>Query Statistics</h2>")
     f.write("<p>Below are detailed statistics about the queries found in the code:</p>")
@@ -165,8 +173,7 @@ def generate_query_statistics_section(
     # Queries by type
     f.write("<h3>Queries by Type</h3>")
     f.write("<ul>")
-    for qtype, qlist in queries_by_type.items():
-        count = len(qlist)
+    for qtype, count, _ in query_statistics["types"]:
         f.write(f"<li>{qtype}: {count} queries</li>")
     f.write("</ul>")
 
@@ -176,7 +183,7 @@ def generate_query_statistics_section(
     f.write(
         "<table border='1'><tr><th>Query Type</th><th>Count</th><th>Average Complexity</th></tr>"
     )
-    for qtype, (count, avg_complexity) in complexity_stats.items():
+    for qtype, count, avg_complexity in query_statistics["types"]:
         f.write(
             f"<tr><td>{qtype}</td><td>{count}</td><td>{avg_complexity:.2f}</td></tr>"
         )
@@ -193,12 +200,36 @@ def generate_query_statistics_section(
     else:
         f.write("<p>No queries found.</p>")
 
+    # Statements run at several call sites
+    f.write("<h3>Repeated Statements</h3>")
+    repeated = [group for group in query_statistics["groups"] if group["count"] > 1]
+    f.write(
+        f"<p>{query_statistics['statements']} distinct statements, "
+        f"{query_statistics['repeated']} of them at "
+        f"several call sites (at most {max_statements}):</p>"
+    )
+    if repeated:
+        f.write(
+            "<table border='1'><tr><th>Statement</th><th>Type</th>"
+            "<th>Call Sites</th><th>Files</th><th>First Call</th></tr>"
+        )
+        for group in repeated[:max_statements]:
+            relative_path, line = group["sites"][0]
+            f.write(
+                f"<tr><td><code>{escape(group['statement'][:200])}</code></td>"
+                f"<td>{group['type']}</td><td>{group['count']}</td>"
+                f"<td>{group['files']}</td>"
+                f"<td><a href='{repo_url}/blob/{branch}/{quote(relative_path)}"
+                f"#L{line}'>{relative_path}:{line}</a></td></tr>"
+            )
+        f.write("</table>")
+
     # Also, we can show a few example queries for each type
     f.write("<h3>Example Queries</h3>")
-    for qtype, qlist in queries_by_type.items():
+    for qtype, _, _ in query_statistics["types"]:
         f.write(f"<h4>{qtype}</h4>")
-        # Show first 5 queries of this type
-        examples = qlist[:5]
+        # Show the first 5 distinct statements of this type
+        examples = query_statistics["examples"].get(qtype, [])
         if examples:
             f.write("<ul>")
             for ex in examples:
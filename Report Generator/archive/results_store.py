@@ -0,0 +1,450 @@
+import sqlite3
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# Rows kept in memory before an executemany
+BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tables (
+    name TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS table_columns (
+    table_name TEXT NOT NULL,
+    column_name TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS statements (
+    fingerprint TEXT PRIMARY KEY,
+    statement TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    file TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    snippet TEXT NOT NULL,
+    complexity INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL REFERENCES statements (fingerprint)
+);
+CREATE TABLE IF NOT EXISTS table_references (
+    query_id INTEGER NOT NULL REFERENCES queries (id),
+    table_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS column_references (
+    query_id INTEGER NOT NULL REFERENCES queries (id),
+    table_name TEXT NOT NULL,
+    column_name TEXT NOT NULL
+);
+"""
+
+# Created once the rows are in, one index build instead of an update per row
+INDEXES = """
+CREATE INDEX IF NOT EXISTS table_references_table
+    ON table_references (table_name, query_id);
+CREATE INDEX IF NOT EXISTS column_references_column
+    ON column_references (table_name, column_name, query_id);
+CREATE INDEX IF NOT EXISTS queries_type ON queries (type, id);
+CREATE INDEX IF NOT EXISTS queries_file ON queries (file);
+CREATE INDEX IF NOT EXISTS queries_fingerprint ON queries (fingerprint, id);
+"""
+
+GROUP_QUERY = """
+SELECT g.fingerprint, s.statement, q.type, q.complexity, g.count, g.files
+FROM (
+    SELECT fingerprint, COUNT(*) AS count, COUNT(DISTINCT file) AS files,
+        MIN(id) AS first
+    FROM queries GROUP BY fingerprint
+) AS g
+JOIN queries AS q ON q.id = g.first
+JOIN statements AS s ON s.fingerprint = g.fingerprint
+ORDER BY g.count DESC, g.first LIMIT ?
+"""
+
+REFERENCE_QUERY = """
+SELECT q.file, q.line, q.snippet FROM {table} AS r
+JOIN queries AS q ON q.id = r.query_id
+WHERE {where} ORDER BY r.query_id
+"""
+
+
+class ResultsStore:
+    """
+    Results of an analysis in a SQLite database: the tables and their
+    columns, every query and the tables and columns each one uses. The
+    statements of the queries are stored once, by fingerprint.
+
+    The references are written in batches while the analysis runs and read
+    back one table at a time by the reports, so they are never all in
+    memory. The database stays after the run to be queried.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def clear(self) -> None:
+        with self.connection:
+            for table in (
+                "column_references",
+                "table_references",
+                "queries",
+                "statements",
+                "table_columns",
+                "tables",
+            ):
+                self.connection.execute(f"DELETE FROM {table}")
+
+    def add_tables(
+        self,
+        create_table_statements: Dict[str, Tuple[Path, int]],
+        table_columns: Dict[str, List[str]],
+    ) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO tables VALUES (?, ?, ?, ?)",
+                (
+                    (table, str(file), line, position)
+                    for position, (table, (file, line)) in enumerate(
+                        create_table_statements.items()
+                    )
+                ),
+            )
+            self.connection.executemany(
+                "INSERT INTO table_columns VALUES (?, ?, ?)",
+                (
+                    (table, col, position)
+                    for table, cols in table_columns.items()
+                    for position, col in enumerate(cols)
+                ),
+            )
+
+    def add_queries(
+        self, query_references: Iterable[Tuple[Dict, List[Tuple[str, List[str]]]]]
+    ) -> int:
+        """
+        Write the queries with the tables and columns they use (as given by
+        analysis.iter_query_references) in batches. Returns the number of
+        queries.
+        """
+        queries = []
+        statements = {}
+        table_rows = []
+        column_rows = []
+
+        def flush():
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO statements VALUES (?, ?)", statements.items()
+            )
+            self.connection.executemany(
+                "INSERT INTO queries VALUES (?, ?, ?, ?, ?, ?, ?)", queries
+            )
+            self.connection.executemany(
+                "INSERT INTO table_references VALUES (?, ?)", table_rows
+            )
+            self.connection.executemany(
+                "INSERT INTO column_references VALUES (?, ?, ?)", column_rows
+            )
+            queries.clear()
+            statements.clear()
+            table_rows.clear()
+            column_rows.clear()
+
+        count = 0
+        with self.connection:
+            for query_id, (query, used) in enumerate(query_references, start=1):
+                queries.append(
+                    (
+                        query_id,
+                        query["type"],
+                        str(query["file"]),
+                        query["line"],
+                        query["snippet"],
+                        query["complexity"],
+                        query["fingerprint"],
+                    )
+                )
+                statements[query["fingerprint"]] = query["statement"]
+                for table, cols in used:
+                    table_rows.append((query_id, table))
+                    column_rows.extend((query_id, table, col) for col in cols)
+                if len(queries) + len(table_rows) + len(column_rows) >= BATCH_SIZE:
+                    flush()
+                count = query_id
+            flush()
+            self.connection.executescript(INDEXES)
+        return count
+
+    def _rows(self, sql: str, *parameters) -> Iterator[Tuple]:
+        return self.connection.execute(sql, parameters)
+
+    def _references(self, table: str, where: str, *parameters) -> List:
+        return [
+            (Path(file), line, snippet)
+            for file, line, snippet in self._rows(
+                REFERENCE_QUERY.format(table=table, where=where), *parameters
+            )
+        ]
+
+    def create_table_statements(self) -> Dict[str, Tuple[Path, int]]:
+        return {
+            name: (Path(file), line)
+            for name, file, line in self._rows(
+                "SELECT name, file, line FROM tables ORDER BY position"
+            )
+        }
+
+    def table_columns(self) -> Dict[str, List[str]]:
+        columns = {}
+        for table, col in self._rows(
+            "SELECT c.table_name, c.column_name FROM table_columns AS c "
+            "JOIN tables AS t ON t.name = c.table_name "
+            "ORDER BY t.position, c.position"
+        ):
+            columns.setdefault(table, []).append(col)
+        return columns
+
+    def table_references(self) -> "TableReferences":
+        return TableReferences(self)
+
+    def column_references(self) -> "ColumnReferences":
+        return ColumnReferences(self)
+
+    def queries(self) -> Iterator[Dict]:
+        for row in self._rows(
+            "SELECT q.type, q.file, q.line, q.snippet, q.complexity, s.statement, "
+            "q.fingerprint FROM queries AS q "
+            "JOIN statements AS s ON s.fingerprint = q.fingerprint ORDER BY q.id"
+        ):
+            yield _query(*row)
+
+    def query_count(self) -> int:
+        return self._rows("SELECT COUNT(*) FROM queries").fetchone()[0]
+
+    def unused_tables(self) -> List[Tuple[str, Path]]:
+        return [
+            (name, Path(file))
+            for name, file in self._rows(
+                "SELECT name, file FROM tables AS t WHERE NOT EXISTS "
+                "(SELECT 1 FROM table_references WHERE table_name = t.name) "
+                "ORDER BY position"
+            )
+        ]
+
+    def unused_columns(self) -> Dict[str, List[str]]:
+        unused = {}
+        for table, col in self._rows(
+            "SELECT c.table_name, c.column_name FROM table_columns AS c "
+            "JOIN tables AS t ON t.name = c.table_name WHERE NOT EXISTS "
+            "(SELECT 1 FROM column_references "
+            "WHERE table_name = c.table_name AND column_name = c.column_name) "
+            "ORDER BY t.position, c.position"
+        ):
+            unused.setdefault(table, []).append(col)
+        return unused
+
+    def query_groups(
+        self, clone_path: Path, limit: int = 50, sites: int = 5
+    ) -> List[Dict]:
+        """
+        The `limit` statements with the most call sites, as given by
+        report_data.group_queries but with only their first `sites` call
+        sites. The grouping is done by SQLite.
+        """
+        groups = []
+        for fingerprint, statement, qtype, complexity, count, files in self._rows(
+            GROUP_QUERY, limit
+        ):
+            groups.append(
+                {
+                    "fingerprint": fingerprint,
+                    "statement": statement,
+                    "type": qtype,
+                    "complexity": complexity,
+                    "count": count,
+                    "files": files,
+                    "sites": [
+                        (Path(file).relative_to(clone_path).as_posix(), line)
+                        for file, line in self._rows(
+                            "SELECT file, line FROM queries WHERE fingerprint = ? "
+                            "ORDER BY id LIMIT ?",
+                            fingerprint,
+                            sites,
+                        )
+                    ],
+                }
+            )
+        return groups
+
+    def query_statistics(
+        self, clone_path: Path, examples: int = 5, groups: int = 50
+    ) -> Dict:
+        """
+        Same as report_data.compute_query_statistics, computed by SQLite.
+        Only the `groups` statements with the most call sites are in
+        "groups", see query_groups.
+        """
+        types = [
+            (qtype, count, average)
+            for qtype, count, average in self._rows(
+                "SELECT type, COUNT(*), AVG(complexity) FROM queries "
+                "GROUP BY type ORDER BY MIN(id)"
+            )
+        ]
+        files = [
+            (Path(file).relative_to(clone_path).as_posix(), count)
+            for file, count in self._rows(
+                "SELECT file, COUNT(*) FROM queries "
+                "GROUP BY file ORDER BY COUNT(*) DESC, MIN(id)"
+            )
+        ]
+        type_examples = {}
+        if examples:
+            # The first call site of the first distinct statements
+            for qtype, _, _ in types:
+                type_examples[qtype] = [
+                    _query(qtype, *row)
+                    for row in self._rows(
+                        "SELECT q.file, q.line, q.snippet, q.complexity, "
+                        "s.statement, q.fingerprint, MIN(q.id) FROM queries AS q "
+                        "JOIN statements AS s ON s.fingerprint = q.fingerprint "
+                        "WHERE q.type = ? GROUP BY q.fingerprint "
+                        "ORDER BY MIN(q.id) LIMIT ?",
+                        qtype,
+                        examples,
+                    )
+                ]
+        return {
+            "types": types,
+            "files": files,
+            "examples": type_examples,
+            "groups": self.query_groups(clone_path, groups),
+            "statements": self._rows(
+                "SELECT COUNT(*) FROM statements"
+            ).fetchone()[0],
+            "repeated": self._rows(
+                "SELECT COUNT(*) FROM (SELECT 1 FROM queries "
+                "GROUP BY fingerprint HAVING COUNT(*) > 1)"
+            ).fetchone()[0],
+        }
+
+
+def _query(qtype, file, line, snippet, complexity, statement, fingerprint, *_):
+    return {
+        "type": qtype,
+        "file": Path(file),
+        "line": line,
+        "snippet": snippet,
+        "complexity": complexity,
+        "statement": statement,
+        "fingerprint": fingerprint,
+    }
+
+
+class TableReferences(Mapping):
+    """
+    {table: [(file_path, line, snippet), ...]} of the tables with
+    references, read from the store when a table is looked up.
+    """
+
+    def __init__(self, store: ResultsStore):
+        self.store = store
+
+    def __getitem__(self, table: str) -> List[Tuple[Path, int, str]]:
+        references = self.store._references(
+            "table_references", "r.table_name = ?", table
+        )
+        if not references:
+            raise KeyError(table)
+        return references
+
+    def __iter__(self) -> Iterator[str]:
+        # In the order of their first reference, as the analysis finds them
+        for (table,) in self.store._rows(
+            "SELECT table_name FROM table_references "
+            "GROUP BY table_name ORDER BY MIN(rowid)"
+        ):
+            yield table
+
+    def __len__(self) -> int:
+        return self.store._rows(
+            "SELECT COUNT(DISTINCT table_name) FROM table_references"
+        ).fetchone()[0]
+
+    def __contains__(self, table: object) -> bool:
+        return (
+            self.store._rows(
+                "SELECT 1 FROM table_references WHERE table_name = ? LIMIT 1", table
+            ).fetchone()
+            is not None
+        )
+
+
+class ColumnReferences(Mapping):
+    """
+    {table: {column: [(file_path, line, snippet), ...]}} of every table,
+    the columns of a table being read from the store when looked up.
+    """
+
+    def __init__(self, store: ResultsStore):
+        self.store = store
+
+    def __getitem__(self, table: str) -> "TableColumnReferences":
+        if self.store._rows("SELECT 1 FROM tables WHERE name = ?", table).fetchone():
+            return TableColumnReferences(self.store, table)
+        raise KeyError(table)
+
+    def __iter__(self) -> Iterator[str]:
+        for (table,) in self.store._rows("SELECT name FROM tables ORDER BY position"):
+            yield table
+
+    def __len__(self) -> int:
+        return self.store._rows("SELECT COUNT(*) FROM tables").fetchone()[0]
+
+
+class TableColumnReferences(Mapping):
+    """
+    {column: [(file_path, line, snippet), ...]} of the columns of a table
+    with references.
+    """
+
+    def __init__(self, store: ResultsStore, table: str):
+        self.store = store
+        self.table = table
+
+    def __getitem__(self, column: str) -> List[Tuple[Path, int, str]]:
+        references = self.store._references(
+            "column_references",
+            "r.table_name = ? AND r.column_name = ?",
+            self.table,
+            column,
+        )
+        if not references:
+            raise KeyError(column)
+        return references
+
+    def __iter__(self) -> Iterator[str]:
+        # In the order of their first reference, as the analysis finds them
+        for (column,) in self.store._rows(
+            "SELECT column_name FROM column_references WHERE table_name = ? "
+            "GROUP BY column_name ORDER BY MIN(rowid)",
+            self.table,
+        ):
+            yield column
+
+    def __len__(self) -> int:
+        return self.store._rows(
+            "SELECT COUNT(DISTINCT column_name) FROM column_references "
+            "WHERE table_name = ?",
+            self.table,
+        ).fetchone()[0]
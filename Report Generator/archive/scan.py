@@ -0,0 +1,307 @@
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from corpus import SourceFile, load_source_file, source_from_bytes
+from files_utils import find_java_files
+from git_operations import CatFileBatch, list_java_blobs
+from parser import (
+    EXEC_SQL_CALLS,
+    Call,
+    CallMatcher,
+    exec_sql_calls,
+    statement_parts,
+)
+from symbols import class_scopes, extract_constant_definitions, read_package, scope_at
+
+DB_METHODS = [
+    "execSQL",
+    "rawQuery",
+    "query",
+    "insert",
+    "update",
+    "delete",
+    "replace",
+    "compileStatement",
+    "execute",
+    "prepareStatement",
+    "executeQuery",
+]
+CREATE_TABLE_PATTERN = re.compile(r"CREATE\s+TABLE", re.IGNORECASE)
+
+# The calls looked for in a file, all found in one pass over its tokens:
+# the db.execSQL calls that may create the tables, and the calls of a DB
+# method on any receiver, the queries
+DB_CALLS = {**EXEC_SQL_CALLS, "query": (DB_METHODS, None)}
+CALL_MATCHER = CallMatcher(DB_CALLS)
+
+# Blobs sent to a worker at once by scan_revision, and chunks per worker read
+# ahead of the scans: at most jobs * BLOB_CHUNKS_AHEAD * BLOB_CHUNK_SIZE blobs
+# are in memory whatever the size of the revision
+BLOB_CHUNK_SIZE = 32
+BLOB_CHUNKS_AHEAD = 2
+
+
+class FileScan:
+    """
+    Everything the analysis needs from a single Java file.
+
+    A scan only depends on the file itself, so files can be scanned in any
+    order or in other processes and merged afterwards. Constants are kept
+    unresolved, they are resolved for the whole project by a SymbolTable.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        package: str,
+        constants: List[Tuple[str, str, List]],
+        sql_calls: List[Tuple[str, List, int]],
+        db_calls: List[Tuple[int, str, str, str, List]],
+    ):
+        self.path = path
+        self.package = package
+        # (class path, constant name, unresolved parts), see SymbolTable
+        self.constants = constants
+        # (class path, unresolved parts, fallback line) of every db.execSQL
+        self.sql_calls = sql_calls
+        # (line number, stripped line, DB method, class path, unresolved parts
+        # of the statement run)
+        self.db_calls = db_calls
+
+    def to_dict(self) -> Dict:
+        return {
+            "package": self.package,
+            "constants": self.constants,
+            "sql_calls": self.sql_calls,
+            "db_calls": self.db_calls,
+        }
+
+    @classmethod
+    def from_dict(cls, path: Path, data: Dict) -> "FileScan":
+        return cls(
+            path,
+            data["package"],
+            [tuple(c) for c in data["constants"]],
+            [tuple(c) for c in data["sql_calls"]],
+            [tuple(c) for c in data["db_calls"]],
+        )
+
+    def __repr__(self):
+        return f"FileScan({self.path})"
+
+
+def locate_db_calls(
+    lines: List[str], calls: List[Call], scopes: List[Tuple[int, str]]
+) -> List[Tuple[int, str, str, str, List]]:
+    """
+    DB calls of a file with their line, class and the unresolved parts of
+    the statement they run (see statement_parts), from the calls found by
+    CALL_MATCHER. Only the
+    first call of a line is kept, and the lines defining a table are not
+    usages.
+    """
+    db_calls = []
+    previous_line = None
+    for call in calls:
+        if call.line == previous_line:
+            continue
+        previous_line = call.line
+        stripped_line = lines[call.line - 1].strip()
+        if CREATE_TABLE_PATTERN.search(stripped_line):
+            continue
+        db_calls.append(
+            (
+                call.line,
+                stripped_line,
+                call.method,
+                scope_at(scopes, call.position),
+                statement_parts(call.method, call.arguments, call.line),
+            )
+        )
+    return db_calls
+
+
+def scan_source(source: SourceFile) -> FileScan:
+    tokens = source.tokens
+    scopes = class_scopes(tokens)
+    calls = CALL_MATCHER.find_calls(tokens)
+    scan = FileScan(
+        source.path,
+        read_package(tokens),
+        extract_constant_definitions(tokens, scopes),
+        exec_sql_calls(calls["execSQL"], scopes),
+        locate_db_calls(source.lines, calls["query"], scopes),
+    )
+    source.release()
+    return scan
+
+
+def scan_file(
+    path: Path, known_digest: Optional[str] = None
+) -> Tuple[Optional[str], Optional[FileScan]]:
+    """
+    Scan a file unless its content still has the known digest.
+
+    Returns the digest of the content and the scan, which is None when the
+    content did not change. Both are None if the file cannot be decoded.
+    """
+    digest, scan, _ = _scan_file_with_stats(path, known_digest)
+    return digest, scan
+
+
+def _scan_file_with_stats(
+    path: Path, known_digest: Optional[str] = None
+) -> Tuple[Optional[str], Optional[FileScan], Optional[Tuple]]:
+    # Same as scan_file, plus (start, seconds, pid, tokens, lines) of the
+    # scan for the profiler when the file was scanned
+    start = time.perf_counter()
+    source = load_source_file(path)
+    if source is None:
+        return None, None, None
+    digest = source.digest
+    if digest == known_digest:
+        return digest, None, None
+    token_count = len(source.tokens)
+    line_count = len(source.lines)
+    scan = scan_source(source)
+    seconds = time.perf_counter() - start
+    return digest, scan, (start, seconds, os.getpid(), token_count, line_count)
+
+
+def _record_stats(profiler, path: Path, stats: Tuple) -> None:
+    start, seconds, pid, token_count, line_count = stats
+    profiler.file_time("scan", str(path), start, seconds, pid, pid)
+    profiler.count("files_scanned")
+    profiler.count("tokens", token_count)
+    profiler.count("lines", line_count)
+
+
+def scan_project(
+    root: Path, jobs: int = 1, cache=None, profiler=None
+) -> List[FileScan]:
+    """
+    Scan every Java file under root, with a pool of `jobs` processes if
+    jobs > 1. The scans are returned in the same order as a serial run.
+
+    With a ScanCache, only the files that changed since the cached run are
+    scanned again. With a Profiler, the time of every scanned file and the
+    number of tokens and lines are recorded in the "scan" phase.
+    """
+    paths = [Path(jf) for jf in find_java_files(root)]
+    scans = [cache.lookup(path) if cache is not None else None for path in paths]
+    pending = [i for i, scan in enumerate(scans) if scan is None]
+    pending_paths = [paths[i] for i in pending]
+    known_digests = [
+        cache.digest(path) if cache is not None else None for path in pending_paths
+    ]
+
+    if jobs <= 1:
+        results = map(_scan_file_with_stats, pending_paths, known_digests)
+    else:
+        chunksize = max(1, len(pending) // (jobs * 8))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # map() yields the results in the order of the input
+            results = list(
+                executor.map(
+                    _scan_file_with_stats,
+                    pending_paths,
+                    known_digests,
+                    chunksize=chunksize,
+                )
+            )
+
+    for i, (digest, scan, stats) in zip(pending, results):
+        if digest is None:
+            continue  # skip files that cannot be decoded
+        if profiler is not None and stats is not None:
+            _record_stats(profiler, paths[i], stats)
+        if cache is not None:
+            if scan is None:
+                # Only the modification time changed
+                scan = cache.reuse(paths[i])
+            else:
+                cache.store(paths[i], digest, scan)
+        scans[i] = scan
+
+    if cache is not None:
+        cache.prune(paths)
+        cache.save()
+    return [scan for scan in scans if scan is not None]
+
+
+def _scan_blob(
+    path: Path, data: Optional[bytes]
+) -> Tuple[Optional[FileScan], Optional[Tuple]]:
+    # scan_source of a blob, with the same stats as _scan_file_with_stats
+    start = time.perf_counter()
+    source = source_from_bytes(path, data) if data is not None else None
+    if source is None:
+        return None, None
+    token_count = len(source.tokens)
+    line_count = len(source.lines)
+    scan = scan_source(source)
+    seconds = time.perf_counter() - start
+    return scan, (start, seconds, os.getpid(), token_count, line_count)
+
+
+def _scan_blobs(
+    chunk: List[Tuple[Path, Optional[bytes]]],
+) -> List[Tuple[Optional[FileScan], Optional[Tuple]]]:
+    return [_scan_blob(path, data) for path, data in chunk]
+
+
+def scan_revision(
+    repo_path: Path, revision: str, jobs: int = 1, profiler=None, cache=None
+) -> List[FileScan]:
+    """
+    Scan every Java file of a revision straight from the object database,
+    without a checkout. The blobs are read by a single `git cat-file
+    --batch` process and the scans have the paths the files would have in
+    a checkout of repo_path.
+
+    With a BlobScanCache, blobs already scanned (in any revision) are not
+    read again. Saving the cache is left to the caller, which may scan
+    several revisions first.
+    """
+    blobs = list_java_blobs(repo_path, revision)
+    paths = [repo_path / path for path, _ in blobs]
+    scans = [
+        cache.lookup(sha, path) if cache is not None else None
+        for path, (_, sha) in zip(paths, blobs)
+    ]
+    pending = [i for i, scan in enumerate(scans) if scan is None]
+    pending_paths = [paths[i] for i in pending]
+
+    with CatFileBatch(repo_path, profiler) as batch:
+        contents = (batch.read(blobs[i][1]) for i in pending)
+        if jobs <= 1:
+            results = list(map(_scan_blob, pending_paths, contents))
+        else:
+            # executor.map would read every blob before the first scan ends,
+            # a chunk is only read once one of the chunks ahead is scanned
+            results = []
+            in_flight = deque()
+            items = zip(pending_paths, contents)
+            chunks = iter(lambda: list(islice(items, BLOB_CHUNK_SIZE)), [])
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                for chunk in chunks:
+                    if len(in_flight) == jobs * BLOB_CHUNKS_AHEAD:
+                        results.extend(in_flight.popleft().result())
+                    in_flight.append(executor.submit(_scan_blobs, chunk))
+                while in_flight:
+                    results.extend(in_flight.popleft().result())
+
+    for i, (scan, stats) in zip(pending, results):
+        if scan is None:
+            continue  # skip files that cannot be decoded
+        if profiler is not None:
+            _record_stats(profiler, paths[i], stats)
+        if cache is not None:
+            cache.store(blobs[i][1], scan)
+        scans[i] = scan
+    return [scan for scan in scans if scan is not None]
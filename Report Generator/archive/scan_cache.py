@@ -0,0 +1,170 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+from scan import FileScan
+
+# Bump whenever the content of a FileScan changes, older caches are dropped
+CACHE_VERSION = 6
+
+
+class ScanCache:
+    """
+    On disk cache of the FileScan of every Java file of a project.
+
+    An entry is reused as is while the size and modification time of the
+    file are unchanged, and after a content digest check otherwise.
+
+    A scan only depends on its own file. Everything crossing files (the
+    symbol table, CREATE TABLE statements, table references, unused tables
+    and columns) is always rebuilt from the scans, so a constant changed in
+    one file is seen by all the others without scanning them again.
+    """
+
+    def __init__(self, cache_dir: Path, root: Path):
+        self.cache_file = Path(cache_dir) / "scan-cache.json"
+        self.root = Path(root)
+        self.entries: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        if not self.cache_file.exists():
+            return
+        try:
+            with self.cache_file.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # a broken cache is the same as no cache
+        if data.get("version") != CACHE_VERSION:
+            return
+        if data.get("root") != self.root.as_posix():
+            return
+        self.entries = data["files"]
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix(".tmp")
+        with tmp_file.open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": CACHE_VERSION,
+                    "root": self.root.as_posix(),
+                    "files": self.entries,
+                },
+                f,
+            )
+        os.replace(tmp_file, self.cache_file)
+        self._dirty = False
+
+    def _key(self, path: Path) -> str:
+        return Path(path).relative_to(self.root).as_posix()
+
+    def lookup(self, path: Path) -> Optional[FileScan]:
+        """
+        The cached scan if the size and modification time did not change.
+        """
+        entry = self.entries.get(self._key(path))
+        if entry is not None:
+            stat = os.stat(path)
+            if (
+                entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns
+            ):
+                self.hits += 1
+                return FileScan.from_dict(path, entry["scan"])
+        return None
+
+    def digest(self, path: Path) -> Optional[str]:
+        entry = self.entries.get(self._key(path))
+        return entry["digest"] if entry is not None else None
+
+    def reuse(self, path: Path) -> FileScan:
+        """
+        The cached scan of a file whose content did not change.
+        """
+        entry = self.entries[self._key(path)]
+        stat = os.stat(path)
+        entry["size"] = stat.st_size
+        entry["mtime_ns"] = stat.st_mtime_ns
+        self.hits += 1
+        self._dirty = True
+        return FileScan.from_dict(path, entry["scan"])
+
+    def store(self, path: Path, digest: str, scan: FileScan) -> None:
+        stat = os.stat(path)
+        self.entries[self._key(path)] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": digest,
+            "scan": scan.to_dict(),
+        }
+        self.misses += 1
+        self._dirty = True
+
+    def prune(self, paths: List[Path]) -> None:
+        """
+        Forget the files that are not part of the project anymore.
+        """
+        keys = {self._key(path) for path in paths}
+        for key in list(self.entries):
+            if key not in keys:
+                del self.entries[key]
+                self._dirty = True
+
+
+class BlobScanCache:
+    """
+    FileScans by git blob SHA, for scan_revision.
+
+    A blob never changes, so an entry is valid for every revision and every
+    path the same content is found at and needs no check. The cache is kept
+    in memory and, with a cache_dir, on disk between runs.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        self.cache_file = (
+            Path(cache_dir) / "blob-scan-cache.json" if cache_dir else None
+        )
+        self.entries: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        if self.cache_file is None or not self.cache_file.exists():
+            return
+        try:
+            with self.cache_file.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == CACHE_VERSION:
+            self.entries = data["blobs"]
+
+    def save(self) -> None:
+        if self.cache_file is None or not self._dirty:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix(".tmp")
+        with tmp_file.open("w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "blobs": self.entries}, f)
+        os.replace(tmp_file, self.cache_file)
+        self._dirty = False
+
+    def lookup(self, sha: str, path: Path) -> Optional[FileScan]:
+        entry = self.entries.get(sha)
+        if entry is None:
+            return None
+        self.hits += 1
+        return FileScan.from_dict(path, entry)
+
+    def store(self, sha: str, scan: FileScan) -> None:
+        self.entries[sha] = scan.to_dict()
+        self.misses += 1
+        self._dirty = True
@@ -0,0 +1,314 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+# Distinct statements whose analysis is kept, the least recently used ones
+# are dropped first
+CACHE_SIZE = 4096
+
+
+class SQLTokenType:
+    KEYWORD = "KEYWORD"
+    IDENTIFIER = "IDENTIFIER"
+    STRING = "STRING"
+    NUMBER = "NUMBER"
+    PARAMETER = "PARAMETER"
+    PUNCTUATION = "PUNCTUATION"
+
+
+# Blanks and comments are matched to be skipped. An unterminated string,
+# quoted name or comment runs until the end of the text.
+_SQL_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<skip>\s+|--[^\n]*|/\*.*?(?:\*/|\Z))
+    |(?P<string>'(?:[^']|'')*'?)
+    |(?P<quoted>"(?:[^"]|"")*"?|`[^`]*`?|\[[^\]]*\]?)
+    |(?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<parameter>\?\d*|[:@$][^\W\d]\w*)
+    |(?P<word>[^\W\d]\w*)
+    |(?P<punctuation><>|!=|<=|>=|==|\|\||\S)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Dynamic part of a SQLInspect statement, e.g. {{na}}
+_PLACEHOLDER_PATTERN = re.compile(r"\{\{[^{}]*\}\}")
+_LITERAL_TYPES = {SQLTokenType.STRING, SQLTokenType.NUMBER, SQLTokenType.PARAMETER}
+
+KEYWORDS = {
+    "ADD", "ALL", "ALTER", "AND", "AS", "ASC", "AUTOINCREMENT", "BEGIN",
+    "BETWEEN", "BY", "CASCADE", "CASE", "CAST", "CHECK", "COLLATE", "COLUMN",
+    "COMMIT", "CONFLICT", "CONSTRAINT", "CREATE", "CROSS", "DEFAULT", "DELETE",
+    "DESC", "DISTINCT", "DROP", "ELSE", "END", "ESCAPE", "EXCEPT", "EXISTS",
+    "FOREIGN", "FROM", "FULL", "GLOB", "GROUP", "HAVING", "IF", "IGNORE", "IN",
+    "INDEX", "INNER", "INSERT", "INTERSECT", "INTO", "IS", "ISNULL", "JOIN",
+    "KEY", "LEFT", "LIKE", "LIMIT", "NATURAL", "NOT", "NOTNULL", "NULL",
+    "OFFSET", "ON", "OR", "ORDER", "OUTER", "PRAGMA", "PRIMARY", "REFERENCES",
+    "RENAME", "REPLACE", "RIGHT", "ROLLBACK", "SELECT", "SET", "TABLE", "TEMP",
+    "TEMPORARY", "THEN", "TO", "TRANSACTION", "TRIGGER", "UNION", "UNIQUE",
+    "UPDATE", "USING", "VALUES", "VIEW", "WHEN", "WHERE", "WITH",
+}  # fmt: skip
+
+# Keywords SQLite also accepts as names, they are names where a column
+# stands: after a name separator or a keyword introducing an expression,
+# and not before ( (a function such as REPLACE(...))
+NON_RESERVED_KEYWORDS = {
+    "BEGIN", "END", "IGNORE", "KEY", "OFFSET", "REPLACE", "TEMP", "TEMPORARY",
+}  # fmt: skip
+_BEFORE_NAME = {
+    "(", ",", ".", "=", "==", "!=", "<>", "<", "<=", ">", ">=", "+", "-", "*",
+    "/", "%", "||", "SELECT", "DISTINCT", "SET", "WHERE", "AND", "OR", "NOT",
+    "ON", "BY", "HAVING", "WHEN", "THEN", "ELSE",
+}  # fmt: skip
+
+# First keyword of a statement -> its type
+STATEMENT_TYPES = {
+    "SELECT": "SELECT",
+    "INSERT": "INSERT",
+    "REPLACE": "INSERT",
+    "UPDATE": "UPDATE",
+    "DELETE": "DELETE",
+    "CREATE": "CREATE",
+    "ALTER": "ALTER",
+    "DROP": "DROP",
+    "PRAGMA": "PRAGMA",
+}
+
+# Keywords followed by a table name
+_TABLE_KEYWORDS = {"FROM", "JOIN", "INTO", "UPDATE", "TABLE", "REFERENCES"}
+# Keywords ending the table list of a FROM
+_CLAUSE_KEYWORDS = {
+    "WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "SET", "VALUES", "ON",
+    "USING", "UNION", "EXCEPT", "INTERSECT", "SELECT",
+}  # fmt: skip
+# Clauses counted by the complexity, GROUP and ORDER only before BY
+_COMPLEX_KEYWORDS = {"JOIN", "WHERE", "HAVING", "UNION", "EXCEPT", "INTERSECT"}
+
+
+class SQLInfo(NamedTuple):
+    """
+    What a SQL statement does. nested_queries is the number of subqueries
+    and nesting_level the deepest one (0 without subquery), like the
+    "Nested Queries" and "Nesting Level" metrics of SQLInspect.
+    """
+
+    type: Optional[str]
+    tables: Tuple[str, ...]
+    columns: Tuple[str, ...]
+    joins: int
+    nested_queries: int
+    nesting_level: int
+    complexity: int
+
+
+def tokenize_sql(sql: str) -> List[Tuple[str, str]]:
+    """
+    (type, value) of every token of a SQL text. Keywords are upper cased
+    and quoted names unquoted, a non reserved keyword used as a column name
+    is a name.
+    """
+    tokens = []
+    non_reserved = {}  # index -> word of the non reserved keywords
+    for match in _SQL_TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "skip":
+            continue
+        if kind == "word":
+            upper = value.upper()
+            if upper in KEYWORDS:
+                if upper in NON_RESERVED_KEYWORDS:
+                    non_reserved[len(tokens)] = value
+                tokens.append((SQLTokenType.KEYWORD, upper))
+            else:
+                tokens.append((SQLTokenType.IDENTIFIER, value))
+        elif kind == "quoted":
+            name = value[1:-1] if len(value) > 1 else ""
+            tokens.append((SQLTokenType.IDENTIFIER, name))
+        else:
+            tokens.append((getattr(SQLTokenType, kind.upper()), value))
+    for i, word in non_reserved.items():
+        if _is_name(tokens, i):
+            tokens[i] = (SQLTokenType.IDENTIFIER, word)
+    return tokens
+
+
+def _is_name(tokens: List[Tuple[str, str]], i: int) -> bool:
+    previous = tokens[i - 1] if i else (None, None)
+    following = tokens[i + 1] if i + 1 < len(tokens) else (None, None)
+    if previous[0] == SQLTokenType.IDENTIFIER or previous[1] not in _BEFORE_NAME:
+        return False
+    if following[1] in ("(", "INTO"):
+        return False
+    # INSERT OR REPLACE INTO, UPDATE OR IGNORE table SET
+    return not (previous[1] == "OR" and following[0] == SQLTokenType.IDENTIFIER)
+
+
+def normalize_sql(sql: str) -> str:
+    # Same statement whatever its layout, the key of the cache
+    return " ".join(sql.split()).rstrip("; ")
+
+
+def analyze_sql(sql: str) -> SQLInfo:
+    """
+    Type, tables, columns and metrics of a SQL statement. Each distinct
+    statement is only analyzed once, see CACHE_SIZE.
+    """
+    return _analyze_normalized(normalize_sql(sql))
+
+
+def sql_cache_info():
+    return _analyze_normalized.cache_info()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def canonical_sql(sql: str) -> str:
+    """
+    Canonical form of a statement, the same for every call site running it
+    with other values: literals, parameters and placeholders become ?, and
+    an IN list of them a single ?. Keywords are upper cased, names lower
+    cased.
+    """
+    canonical = []
+    in_lists = []  # one entry per open parenthesis: is it an IN list
+    for kind, value in tokenize_sql(_PLACEHOLDER_PATTERN.sub("?", sql)):
+        if kind in _LITERAL_TYPES:
+            value = "?"
+        elif kind == SQLTokenType.IDENTIFIER:
+            value = value.lower()
+        elif value == "(":
+            in_lists.append(canonical[-1:] == ["IN"])
+        elif value == ")" and in_lists:
+            in_lists.pop()
+        if value == "?" and in_lists and in_lists[-1]:
+            if canonical[-2:] == ["?", ","]:
+                canonical.pop()  # IN (?, ?, ?) -> IN (?)
+                continue
+        canonical.append(value)
+    while canonical and canonical[-1] == ";":
+        canonical.pop()
+    return (
+        " ".join(canonical)
+        .replace(" . ", ".")
+        .replace(" ,", ",")
+        .replace("( ", "(")
+        .replace(" )", ")")
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def fingerprint(statement: str) -> str:
+    # Short stable id of a canonical statement
+    return hashlib.sha1(statement.encode("utf-8")).hexdigest()[:16]
+
+
+def _add(names: List[str], name: str) -> None:
+    if name and name not in names:
+        names.append(name)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _analyze_normalized(sql: str) -> SQLInfo:
+    tokens = tokenize_sql(sql)
+    count = len(tokens)
+    statement_type = None
+    tables, columns, aliases = [], [], set()
+    joins = nested_queries = nesting_level = complexity = 0
+
+    # One entry per open parenthesis: (is a subquery, FROM list state)
+    parens = []
+    depth = 0  # subqueries around the current token
+    expect_table = False  # a table name comes next
+    after_table = False  # an alias may come next
+    in_from = False  # in a FROM list, a comma is followed by a table
+    create = False  # column definitions of a CREATE or ALTER TABLE
+
+    for i, (kind, value) in enumerate(tokens):
+        following = tokens[i + 1] if i + 1 < count else (None, None)
+        previous = tokens[i - 1] if i else (None, None)
+
+        if kind == SQLTokenType.PUNCTUATION:
+            if value == "(":
+                subquery = following[1] in ("SELECT", "WITH")
+                parens.append((subquery, in_from))
+                if subquery:
+                    depth += 1
+                    nested_queries += 1
+                    nesting_level = max(nesting_level, depth)
+                    in_from = False
+                expect_table = after_table = False
+            elif value == ")":
+                if parens:
+                    subquery, in_from = parens.pop()
+                    if subquery:
+                        depth -= 1
+                        # FROM (SELECT ...) alias
+                        after_table = in_from
+            elif value == ",":
+                expect_table = in_from
+                after_table = False
+            elif value != ".":
+                after_table = False
+            continue
+
+        if kind == SQLTokenType.KEYWORD:
+            if statement_type is None and not parens and value in STATEMENT_TYPES:
+                statement_type = STATEMENT_TYPES[value]
+                create = value in ("CREATE", "ALTER")
+            if value in _COMPLEX_KEYWORDS or (
+                value in ("GROUP", "ORDER") and following[1] == "BY"
+            ):
+                complexity += 1
+            if value == "JOIN":
+                joins += 1
+            if value in _TABLE_KEYWORDS:
+                expect_table = True
+                in_from = value == "FROM" or (in_from and value == "JOIN")
+            elif value in _CLAUSE_KEYWORDS:
+                expect_table = in_from = False
+            if value != "AS":
+                after_table = False
+            continue
+
+        if kind != SQLTokenType.IDENTIFIER:
+            after_table = False
+            continue
+
+        # schema.table or table.column: the last name is the one used
+        if following == (SQLTokenType.PUNCTUATION, "."):
+            continue
+        if expect_table:
+            _add(tables, value)
+            expect_table = False
+            after_table = True
+        elif after_table or previous == (SQLTokenType.KEYWORD, "AS"):
+            aliases.add(value.lower())
+            after_table = False
+        elif following == (SQLTokenType.PUNCTUATION, "("):
+            pass  # a function
+        elif following == (SQLTokenType.KEYWORD, "AS") and (
+            i + 2 < count and tokens[i + 2] == (SQLTokenType.PUNCTUATION, "(")
+        ):
+            aliases.add(value.lower())  # WITH name AS (...)
+        elif create:
+            # Only the first name of a column definition is a column
+            if len(parens) <= 1 and previous[1] in ("(", ",", "ADD", "COLUMN"):
+                _add(columns, value)
+        else:
+            _add(columns, value)
+
+    table_names = {table.lower() for table in tables}
+    return SQLInfo(
+        statement_type,
+        tuple(table for table in tables if table.lower() not in aliases),
+        tuple(
+            col
+            for col in columns
+            if col.lower() not in aliases and col.lower() not in table_names
+        ),
+        joins,
+        nested_queries,
+        nesting_level,
+        complexity + nested_queries + len(sql) // 100,
+    )
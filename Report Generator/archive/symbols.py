@@ -0,0 +1,319 @@
+import bisect
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from lexer import TokenType
+
+NAME_PATTERN = re.compile(r"[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*")
+STRING_LITERAL_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+CLASS_KEYWORDS = {"class", "interface", "enum", "record"}
+MODIFIERS = {
+    "public",
+    "protected",
+    "private",
+    "static",
+    "final",
+    "abstract",
+    "strictfp",
+    "sealed",
+}
+
+
+def _is_declaration(previous, before_previous) -> bool:
+    # A "class" keyword opens a declaration only after a modifier, an
+    # annotation or the end of a previous statement or block
+    if previous is None:
+        return True
+    if previous.type == TokenType.SEMI or previous.type == TokenType.RPAREN:
+        return True
+    if previous.type == TokenType.OTHER:
+        return previous.value in ("{", "}", "@")
+    if previous.type == TokenType.IDENTIFIER:
+        if previous.value in MODIFIERS:
+            return True
+        return before_previous is not None and before_previous.value == "@"
+    return False
+
+
+def skip_comment(tokens, i: int) -> int:
+    """
+    Index of the token following the comment starting at tokens[i], or i
+    when no comment starts there.
+    """
+    length = len(tokens)
+    tok = tokens[i]
+    if tok.type != TokenType.OTHER or tok.value != "/" or i + 1 >= length:
+        return i
+    following = tokens[i + 1]
+    if following.type == TokenType.OTHER and following.value == "/":
+        # Line comment, skip the rest of the line
+        i += 2
+        while i < length and tokens[i].line == tok.line:
+            i += 1
+        return i
+    if following.type == TokenType.OTHER and following.value == "*":
+        # Block comment, skip until "*/"
+        i += 2
+        while i + 1 < length and not (
+            tokens[i].value == "*"
+            and tokens[i + 1].value == "/"
+            and tokens[i].type == TokenType.OTHER
+        ):
+            i += 1
+        return i + 2
+    return i
+
+
+def class_scopes(tokens) -> List[Tuple[int, str]]:
+    """
+    The enclosing class of every token, as a sorted list of
+    (token index, class path) giving the class path ("Outer.Inner", "" at
+    the top level) in effect from that token on.
+
+    Comments are skipped, so braces and the word "class" in them are
+    ignored.
+    """
+    scopes = [(0, "")]
+    stack = []  # (class path, brace depth of the class body)
+    depth = 0
+    pending = None  # name of a declared class waiting for its "{"
+    previous = before_previous = None
+    length = len(tokens)
+    i = 0
+    while i < length:
+        tok = tokens[i]
+        if tok.type == TokenType.OTHER and tok.value == "/":
+            end = skip_comment(tokens, i)
+            if end != i:
+                i = end
+                continue
+
+        if tok.type == TokenType.OTHER and tok.value == "{":
+            depth += 1
+            if pending is not None:
+                path = f"{stack[-1][0]}.{pending}" if stack else pending
+                stack.append((path, depth))
+                scopes.append((i, path))
+                pending = None
+        elif tok.type == TokenType.OTHER and tok.value == "}":
+            if stack and stack[-1][1] == depth:
+                stack.pop()
+                scopes.append((i + 1, stack[-1][0] if stack else ""))
+            depth -= 1
+        elif (
+            tok.type == TokenType.IDENTIFIER
+            and tok.value in CLASS_KEYWORDS
+            and i + 1 < length
+            and tokens[i + 1].type == TokenType.IDENTIFIER
+            and _is_declaration(previous, before_previous)
+        ):
+            pending = tokens[i + 1].value
+
+        before_previous = previous
+        previous = tok
+        i += 1
+    return scopes
+
+
+def scope_at(scopes: List[Tuple[int, str]], index: int) -> str:
+    position = bisect.bisect_right(scopes, index, key=lambda scope: scope[0]) - 1
+    return scopes[position][1]
+
+
+def read_name(tokens, i: int) -> Tuple[str, int]:
+    """
+    Read a dotted name (A.B.C) starting at the identifier tokens[i].
+    Returns the name and the index of the token following it.
+    """
+    parts = [tokens[i].value]
+    i += 1
+    length = len(tokens)
+    while (
+        i + 1 < length
+        and tokens[i].type == TokenType.DOT
+        and tokens[i + 1].type == TokenType.IDENTIFIER
+    ):
+        parts.append(tokens[i + 1].value)
+        i += 2
+    return ".".join(parts), i
+
+
+def read_package(tokens) -> str:
+    for i, tok in enumerate(tokens):
+        if tok.type == TokenType.IDENTIFIER and tok.value == "package":
+            if i + 1 < len(tokens) and tokens[i + 1].type == TokenType.IDENTIFIER:
+                return read_name(tokens, i + 1)[0]
+        elif tok.type == TokenType.IDENTIFIER and tok.value in CLASS_KEYWORDS:
+            break
+    return ""
+
+
+def extract_constant_definitions(
+    tokens, scopes=None
+) -> List[Tuple[str, str, List]]:
+    """
+    Find the constants of forms like:
+    static final String IDENT = "VALUE" + OTHER + Some.OTHER;
+
+    The right hand side is kept unresolved, as a list of ["s", text] string
+    parts and ["r", name] references to other constants.
+
+    Returns a list of (class path, constant name, parts).
+    """
+    if scopes is None:
+        scopes = class_scopes(tokens)
+    definitions = []
+    length = len(tokens)
+    i = 0
+    while i < length:
+        # Look for pattern: static final String <NAME> = ...
+        if (
+            tokens[i].type == TokenType.IDENTIFIER
+            and tokens[i].value == "static"
+            and i + 4 < length
+            and tokens[i + 1].type == TokenType.IDENTIFIER
+            and tokens[i + 1].value == "final"
+            and tokens[i + 2].type == TokenType.IDENTIFIER
+            and tokens[i + 2].value == "String"
+            and tokens[i + 3].type == TokenType.IDENTIFIER
+            and tokens[i + 4].type == TokenType.OTHER
+            and tokens[i + 4].value == "="
+        ):
+            name = tokens[i + 3].value
+            # Collect right hand side until SEMI
+            j = i + 5
+            parts = []
+            while (
+                j < length
+                and tokens[j].type != TokenType.SEMI
+                and tokens[j].type != TokenType.EOF
+            ):
+                if tokens[j].type == TokenType.STRING:
+                    parts.append(["s", tokens[j].value])
+                elif tokens[j].type == TokenType.IDENTIFIER:
+                    reference, j = read_name(tokens, j)
+                    parts.append(["r", reference])
+                    continue
+                # Ignore '+' and other tokens
+                j += 1
+            if j < length and tokens[j].type == TokenType.SEMI:
+                definitions.append((scope_at(scopes, i), name, parts))
+                i = j + 1
+                continue
+        i += 1
+    return definitions
+
+
+def _qualify(*names: str) -> str:
+    return ".".join(name for name in names if name)
+
+
+class SymbolTable:
+    """
+    The string constants of the whole project, indexed by their fully
+    qualified name (package.Class.Inner.NAME).
+
+    Values are resolved lazily on first use and memoized, and so is every
+    reference lookup, unresolved ones included. A constant depending on
+    itself resolves to "" instead of looping.
+    """
+
+    def __init__(self):
+        # qualified name -> ((file, package, class path), parts)
+        self.definitions: Dict[str, Tuple[Tuple[str, str, str], List]] = {}
+        self.by_name: Dict[str, List[str]] = defaultdict(list)
+        self._values: Dict[str, str] = {}
+        self._resolving = set()
+        self._references: Dict[Tuple, Optional[str]] = {}
+
+    def add_file(
+        self, file: str, package: str, definitions: List[Tuple[str, str, List]]
+    ) -> None:
+        for class_path, name, parts in definitions:
+            qualified = _qualify(package, class_path, name)
+            if qualified in self.definitions:
+                continue  # keep the first definition of duplicated classes
+            self.definitions[qualified] = ((file, package, class_path), parts)
+            self.by_name[name].append(qualified)
+
+    def __len__(self) -> int:
+        return len(self.definitions)
+
+    def lookup(self, context: Tuple[str, str, str], reference: str) -> Optional[str]:
+        """
+        Qualified name of the constant a reference (NAME, Class.NAME, ...)
+        written in the given (file, package, class path) points to.
+        """
+        key = (context, reference)
+        if key not in self._references:
+            self._references[key] = self._lookup(context, reference)
+        return self._references[key]
+
+    def _lookup(self, context: Tuple[str, str, str], reference: str) -> Optional[str]:
+        owner, _, name = reference.rpartition(".")
+        candidates = self.by_name.get(name)
+        if not candidates:
+            return None
+
+        if owner:
+            # Class.NAME, Outer.Inner.NAME or package.Class.NAME
+            for qualified in candidates:
+                class_name = qualified.rpartition(".")[0]
+                if class_name == owner or class_name.endswith("." + owner):
+                    return qualified
+            return None
+
+        # A bare NAME, from the class and its enclosing classes first
+        file, package, class_path = context
+        scope = class_path
+        while True:
+            qualified = _qualify(package, scope, name)
+            if qualified in self.definitions:
+                return qualified
+            if not scope:
+                break
+            scope = scope.rpartition(".")[0]
+        # Then from the other classes of the same file
+        for qualified in candidates:
+            if self.definitions[qualified][0][0] == file:
+                return qualified
+        # Finally from anywhere, as long as there is no ambiguity
+        if len({self.value(qualified) for qualified in candidates}) == 1:
+            return candidates[0]
+        return None
+
+    def value(self, qualified: str) -> str:
+        if qualified in self._values:
+            return self._values[qualified]
+        if qualified in self._resolving:
+            return ""  # cycle
+        self._resolving.add(qualified)
+        context, parts = self.definitions[qualified]
+        result = "".join(
+            text if kind == "s" else self.resolve(context, text) for kind, text in parts
+        )
+        self._resolving.discard(qualified)
+        self._values[qualified] = result
+        return result
+
+    def resolve(self, context: Tuple[str, str, str], reference: str) -> str:
+        qualified = self.lookup(context, reference)
+        return self.value(qualified) if qualified is not None else ""
+
+    def values_in(self, context: Tuple[str, str, str], code: str) -> Set[str]:
+        """
+        Values of the constants used in a piece of Java code, e.g.
+        {"keys"} for db.query(KeyDatabaseHelper.KEYS_TABLE, ...).
+        """
+        values = set()
+        code = STRING_LITERAL_PATTERN.sub('""', code)
+        for name in NAME_PATTERN.findall(code):
+            parts = name.split(".")
+            # Longest prefix naming a constant, for Class.NAME.length()
+            for end in range(len(parts), 0, -1):
+                qualified = self.lookup(context, ".".join(parts[:end]))
+                if qualified is not None:
+                    values.add(self.value(qualified))
+                    break
+        return values
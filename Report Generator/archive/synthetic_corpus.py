@@ -0,0 +1,228 @@
+import argparse
+import random
+from pathlib import Path
+
+PACKAGE = "com.example.synthetic"
+FILES_PER_PACKAGE = 50
+DB_METHODS = ["rawQuery", "query", "insert", "update", "delete", "execSQL"]
+
+
+def table_name(t: int) -> str:
+    return f"table_{t}"
+
+
+def column_names(t: int, columns_per_table: int):
+    return [f"col_{t}_{c}" for c in range(columns_per_table)]
+
+
+def _schema_class(tables: int, columns_per_table: int) -> str:
+    lines = [
+        f"package {PACKAGE};",
+        "",
+        "public final class Schema {",
+        "    private Schema() {",
+        "    }",
+        "",
+    ]
+    for t in range(tables):
+        lines.append(f'    public static final String TABLE_{t} = "{table_name(t)}";')
+        for c, column in enumerate(column_names(t, columns_per_table)):
+            lines.append(f'    public static final String COLUMN_{t}_{c} = "{column}";')
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def _helper_class(tables: int, columns_per_table: int) -> str:
+    lines = [
+        f"package {PACKAGE};",
+        "",
+        "import android.database.sqlite.SQLiteDatabase;",
+        "import android.database.sqlite.SQLiteOpenHelper;",
+        "",
+        "public class DatabaseHelper extends SQLiteOpenHelper {",
+        "",
+        "    @Override",
+        "    public void onCreate(SQLiteDatabase db) {",
+    ]
+    for t in range(tables):
+        columns = " + \", \" + ".join(
+            f'Schema.COLUMN_{t}_{c} + " TEXT"' for c in range(columns_per_table)
+        )
+        lines.append(
+            f'        db.execSQL("CREATE TABLE " + Schema.TABLE_{t} + " (_id INTEGER '
+            f'PRIMARY KEY, " + {columns} + ")");'
+        )
+    lines += ["    }", "}"]
+    return "\n".join(lines) + "\n"
+
+
+def _db_call(rng: random.Random, tables: int, columns_per_table: int) -> str:
+    t = rng.randrange(tables)
+    c = rng.randrange(columns_per_table)
+    method = rng.choice(DB_METHODS)
+    table = rng.choice([f"Schema.TABLE_{t}", f'"{table_name(t)}"'])
+    column = f"Schema.COLUMN_{t}_{c}"
+    if method == "rawQuery":
+        return (
+            f'Cursor cursor = db.rawQuery("SELECT " + {column} + " FROM " + {table} '
+            f'+ " WHERE _id = ?", new String[] {{ id }});'
+        )
+    if method == "query":
+        return (
+            f"Cursor cursor = db.query({table}, new String[] {{ {column} }}, "
+            f'{column} + " = ?", new String[] {{ id }}, null, null, null);'
+        )
+    if method == "insert":
+        return f"db.insert({table}, null, values);"
+    if method == "update":
+        return f'db.update({table}, values, {column} + " = ?", new String[] {{ id }});'
+    if method == "delete":
+        return f'db.delete({table}, "_id = ?", new String[] {{ id }});'
+    return f'db.execSQL("UPDATE " + {table} + " SET " + {column} + " = NULL");'
+
+
+def _java_class(
+    rng: random.Random,
+    package: str,
+    name: str,
+    tables: int,
+    columns_per_table: int,
+    constants: int,
+    db_calls: int,
+) -> str:
+    lines = [
+        f"package {package};",
+        "",
+        "import android.content.ContentValues;",
+        "import android.database.Cursor;",
+        "import android.database.sqlite.SQLiteDatabase;",
+        f"import {PACKAGE}.Schema;",
+        "",
+        "/**",
+        f" * Synthetic class {name}, used to benchmark the database usage analysis.",
+        " */",
+        f"public class {name} {{",
+        "",
+    ]
+    for k in range(constants):
+        if k > 0 and rng.random() < 0.3:
+            # Concatenation of a previous constant
+            lines.append(
+                f'    static final String KEY_{k} = KEY_{rng.randrange(k)} + "_{k}";'
+            )
+        else:
+            lines.append(f'    static final String KEY_{k} = "{name.lower()}_key_{k}";')
+    lines += [
+        "",
+        "    private final String id;",
+        "",
+        f"    public {name}(String id) {{",
+        "        this.id = id;",
+        "    }",
+        "",
+    ]
+
+    # Plain code around the database calls, the analysis has to skip it
+    for m in range(3):
+        lines += [
+            f"    // Helper number {m}",
+            f"    int helper{m}(int[] values) {{",
+            "        int total = 0;",
+            "        for (int i = 0; i < values.length; i++) {",
+            f"            total += values[i] * {m + 1};",
+            "        }",
+            "        return total;",
+            "    }",
+            "",
+        ]
+
+    for d in range(db_calls):
+        lines += [
+            f"    void access{d}(SQLiteDatabase db, ContentValues values) {{",
+            "        " + _db_call(rng, tables, columns_per_table),
+            "    }",
+            "",
+        ]
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(
+    output_dir: Path,
+    files: int = 1000,
+    constants: int = 5,
+    db_calls: int = 2,
+    tables: int = 20,
+    columns_per_table: int = 5,
+    seed: int = 1,
+) -> int:
+    """
+    Write an Android style Java source tree under output_dir.
+
+    Schema.java holds a constant for every table and column, and
+    DatabaseHelper.java creates the tables with db.execSQL. Each of the
+    other `files` classes defines `constants` string constants and makes
+    `db_calls` database calls to random tables. The same seed gives the same
+    tree. Returns the number of bytes written.
+    """
+    rng = random.Random(seed)
+    root = output_dir.joinpath(*PACKAGE.split("."))
+    root.mkdir(parents=True, exist_ok=True)
+    written = 0
+    written += (root / "Schema.java").write_text(
+        _schema_class(tables, columns_per_table), encoding="utf-8"
+    )
+    written += (root / "DatabaseHelper.java").write_text(
+        _helper_class(tables, columns_per_table), encoding="utf-8"
+    )
+    for i in range(files):
+        package_number = i // FILES_PER_PACKAGE
+        package_dir = root / f"module{package_number}"
+        if i % FILES_PER_PACKAGE == 0:
+            package_dir.mkdir(exist_ok=True)
+        name = f"Class{i}"
+        source = _java_class(
+            rng,
+            f"{PACKAGE}.module{package_number}",
+            name,
+            tables,
+            columns_per_table,
+            constants,
+            db_calls,
+        )
+        written += (package_dir / f"{name}.java").write_text(source, encoding="utf-8")
+    return written
+
+
+def add_corpus_arguments(arg_parser: argparse.ArgumentParser) -> None:
+    arg_parser.add_argument("--files", type=int, default=1000)
+    arg_parser.add_argument(
+        "--constants", type=int, default=5, help="constants per file"
+    )
+    arg_parser.add_argument(
+        "--db-calls", type=int, default=2, help="database calls per file"
+    )
+    arg_parser.add_argument("--tables", type=int, default=20)
+    arg_parser.add_argument("--columns", type=int, default=5, help="per table")
+    arg_parser.add_argument("--seed", type=int, default=1)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Synthetic Java corpus")
+    arg_parser.add_argument("output_dir", type=Path)
+    add_corpus_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    written = generate_corpus(
+        args.output_dir,
+        args.files,
+        args.constants,
+        args.db_calls,
+        args.tables,
+        args.columns,
+        args.seed,
+    )
+    print(f"Wrote {args.files + 2} files ({written} bytes) to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
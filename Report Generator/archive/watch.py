@@ -0,0 +1,297 @@
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from analysis import (
+    build_symbol_table,
+    collect_references,
+    find_create_table_statements,
+    find_unused_columns,
+    find_unused_tables,
+    iter_query_references,
+)
+from files_utils import find_java_files
+from git_operations import BlameService
+from paged_report import generate_paged_report, remove_table_pages
+from report_data import (
+    build_usage_data,
+    compute_query_statistics,
+    data_path,
+    write_usage_data,
+)
+from scan import FileScan, scan_file, scan_project
+
+
+def _stat(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ProjectState:
+    """
+    The analysis of a project kept in memory and updated as its Java files
+    change.
+
+    A changed file is scanned again on its own, and only its queries are
+    looked for again. The symbol table and the CREATE TABLE statements are
+    rebuilt from the scans when the package, the constants or the execSQL
+    calls of a file changed, in which case every file is looked at again
+    since the tables and the constant values may differ.
+    """
+
+    def __init__(self, root: Path, jobs: int = 1):
+        self.root = root
+        # Taken before the scan, a file edited meanwhile is seen by poll()
+        self.stats = {Path(p): _stat(Path(p)) for p in find_java_files(root)}
+        self.scans: Dict[Path, FileScan] = {
+            scan.path: scan for scan in scan_project(root, jobs)
+        }
+        # Results of iter_query_references, file by file
+        self.file_queries: Dict[Path, List] = {}
+        self._build_tables()
+        self._find_queries(list(self.scans.values()))
+        self._collect()
+
+    def _build_tables(self) -> None:
+        scans = list(self.scans.values())
+        self.symbols = build_symbol_table(scans)
+        self.create_table_statements, self.table_columns = (
+            find_create_table_statements(scans, self.symbols)
+        )
+
+    def _find_queries(self, scans: List[FileScan]) -> None:
+        for scan in scans:
+            self.file_queries[scan.path] = []
+        for query, used in iter_query_references(
+            scans, list(self.create_table_statements), self.symbols, self.table_columns
+        ):
+            self.file_queries[query["file"]].append((query, used))
+
+    def _collect(self) -> None:
+        self.table_references, self.column_references, self.queries = (
+            collect_references(
+                # In the order of the files, as a fresh analysis finds them
+                (
+                    pair
+                    for path in self.stats
+                    if path in self.scans
+                    for pair in self.file_queries[path]
+                ),
+                list(self.create_table_statements),
+            )
+        )
+
+    def poll(self) -> Tuple[List[Path], List[Path]]:
+        """
+        Java files added or modified, and the ones removed, since the last
+        poll.
+        """
+        current = {Path(p): _stat(Path(p)) for p in find_java_files(self.root)}
+        changed = [
+            path
+            for path, stat in current.items()
+            if stat is not None and self.stats.get(path) != stat
+        ]
+        removed = [path for path in self.stats if path not in current]
+        self.stats = current
+        return changed, removed
+
+    def _sections(self) -> Dict[str, Tuple]:
+        # Everything the pages of a table show
+        return {
+            table: (
+                self.create_table_statements.get(table),
+                self.table_columns.get(table),
+                self.table_references.get(table),
+                self.column_references.get(table),
+            )
+            for table in self.create_table_statements
+        }
+
+    def update(
+        self, changed: List[Path], removed: List[Path]
+    ) -> Tuple[Set[str], Set[str]]:
+        """
+        Apply the changes of the files to the analysis. Returns the tables
+        whose pages are no longer up to date, and the tables that no longer
+        have pages (removed, renamed or without references).
+        """
+        before = self._sections()
+        paged_before = set(self.table_references)
+
+        def declares(scan: Optional[FileScan]) -> bool:
+            # Constants and execSQL calls are all the other files see of it
+            return scan is not None and bool(scan.constants or scan.sql_calls)
+
+        rebuild = False
+        for path in removed:
+            rebuild = declares(self.scans.pop(path, None)) or rebuild
+            self.file_queries.pop(path, None)
+
+        rescanned = []
+        for path in changed:
+            _, scan = scan_file(path)
+            old = self.scans.get(path)
+            if scan is None:
+                # Cannot be decoded any more, same as removed
+                self.scans.pop(path, None)
+                self.file_queries.pop(path, None)
+                rebuild = declares(old) or rebuild
+            else:
+                rebuild = rebuild or (
+                    declares(scan)
+                    if old is None
+                    else old.package != scan.package
+                    or old.constants != scan.constants
+                    or old.sql_calls != scan.sql_calls
+                )
+                self.scans[path] = scan
+                rescanned.append(scan)
+
+        if rebuild:
+            self._build_tables()
+            self._find_queries(list(self.scans.values()))
+        else:
+            self._find_queries(rescanned)
+        self._collect()
+
+        after = self._sections()
+        stale = {
+            table
+            for table in set(before) | set(after)
+            if before.get(table) != after.get(table)
+        }
+        return stale, paged_before - set(self.table_references)
+
+
+def write_report(
+    state: ProjectState,
+    output_dir: Path,
+    repo_url: str,
+    blame: BlameService,
+    page_size: int = 100,
+    tables: Optional[Set[str]] = None,
+) -> None:
+    """
+    Write the paged report of the current state, only the pages of
+    `tables` and the index if given.
+    """
+    unused_tables = find_unused_tables(
+        state.create_table_statements, state.table_references
+    )
+    unused_columns = find_unused_columns(state.table_columns, state.column_references)
+    query_statistics = compute_query_statistics(state.queries, state.root, examples=0)
+    generate_paged_report(
+        state.create_table_statements,
+        state.table_references,
+        unused_tables,
+        state.table_columns,
+        state.column_references,
+        unused_columns,
+        state.queries,
+        output_dir,
+        repo_url,
+        state.root,
+        blame=blame,
+        page_size=page_size,
+        query_statistics=query_statistics,
+        tables=tables,
+    )
+    write_usage_data(
+        data_path(output_dir),
+        build_usage_data(
+            state.create_table_statements,
+            state.table_references,
+            state.table_columns,
+            unused_columns,
+            query_statistics,
+        ),
+    )
+
+
+def watch(
+    state: ProjectState,
+    output_dir: Path,
+    repo_url: str,
+    blame: BlameService,
+    interval: float = 0.5,
+    page_size: int = 100,
+) -> None:
+    while True:
+        time.sleep(interval)
+        changed, removed = state.poll()
+        if not changed and not removed:
+            continue
+        start = time.perf_counter()
+        # The lines of the edited files may have other dates now
+        blame.forget(changed + removed)
+        tables, dropped = state.update(changed, removed)
+        remove_table_pages(output_dir, dropped)
+        write_report(state, output_dir, repo_url, blame, page_size, tables)
+        elapsed = (time.perf_counter() - start) * 1000
+        names = ", ".join(sorted(tables)) or "no table"
+        print(
+            f"{len(changed)} changed, {len(removed)} removed: updated the index "
+            f"and {names} in {elapsed:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Keep the paged database usage report of a local checkout "
+        "up to date while its Java files are edited"
+    )
+    arg_parser.add_argument("path", type=Path, help="local checkout to watch")
+    arg_parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path(__file__).parent.resolve() / "database_usage_report",
+        help="directory of the paged report (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--repo-url", help="base of the links to the sources (default: the path)"
+    )
+    arg_parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.5,
+        help="seconds between two checks of the files (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes of the first scan (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--blame-cache",
+        type=Path,
+        help="directory where the blame results are kept between runs",
+    )
+    arg_parser.add_argument(
+        "--page-size",
+        type=int,
+        default=100,
+        help="references per page of a table (default: %(default)s)",
+    )
+    args = arg_parser.parse_args()
+
+    root = args.path.resolve()
+    start = time.perf_counter()
+    state = ProjectState(root, args.jobs)
+    blame = BlameService(root, args.blame_cache)
+    repo_url = args.repo_url or str(root)
+    write_report(state, args.output, repo_url, blame, args.page_size)
+    print(
+        f"Analyzed {len(state.scans)} files in "
+        f"{time.perf_counter() - start:.1f}s, report written to {args.output}"
+    )
+    print(f"Watching {root} (Ctrl+C to stop)")
+    try:
+        watch(state, args.output, repo_url, blame, args.interval, args.page_size)
+    except KeyboardInterrupt:
+        print("Stopped")
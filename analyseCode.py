@@ -1,137 +1,187 @@
+import argparse
+import mmap
 import os
 import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 
 db_call_pattern = re.compile(r'(\w+)\.(\w+)(\(.+\))')
-java_calls = {
-    "select": [],
-    "insert": [],
-    "delete": [],
-    "update": [],
-    "execSQL": [],
-    "rawQuery": [],
-    "createTable": [],
-    "alterTable": [],
-}
+# A call needs one of the database objects as receiver, "mdatabase." contains
+# "database.". Files and lines without any are skipped.
+receiver_bytes_pattern = re.compile(rb'(?i)(?:db|database)\.')
+receiver_pattern = re.compile(r'(?i)(?:db|database)\.')
 
-java_files_with_queries = []
+# Output files, in this order in all.txt
+categories = [
+    "select",
+    "insert",
+    "delete",
+    "update",
+    "execSQL",
+    "rawQuery",
+    "createTable",
+    "alterTable",
+]
 
-database_object_names = ["db", "database", "mdatabase"]
+database_object_names = {"db", "database", "mdatabase"}
+
+default_path = "osmeditor4android-20.1.4.0/src/main/java/de/blau/android/"
+default_out_dir = "./Home made analyzer"
 
 
 def get_java_files(directory):
     java_files = []
 
+    # Sorted, so that the output does not depend on the file system
     for root, dirs, files in os.walk(directory):
-        for file in files:
+        dirs.sort()
+        for file in sorted(files):
             if file.endswith(".java"):
                 java_files.append(os.path.join(root, file))
 
     return java_files
 
 
-if __name__ == '__main__':
-    path = "osmeditor4android-20.1.4.0/src/main/java/de/blau/android/"
-    out_dir = "./Home made analyzer"
+def classify(function_name, data):
+    lowered = data.lower()
+    if "create table" in lowered:
+        return "createTable"
+    if "alter table" in lowered or "alter_table" in lowered:
+        return "alterTable"
+    if "select" in lowered:
+        return "select"
+    if "insert" in lowered:
+        return "insert"
+    if "update" in lowered:
+        return "update"
+    if "delete" in lowered:
+        return "delete"
+    return function_name
+
+
+def read_candidate(file):
+    """
+    Text of a file, or None if it cannot contain a database call.
+    """
+    with open(file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if receiver_bytes_pattern.search(data) is None:
+                return None
+            content = data[:]
+    # Same lines as reading the file in text mode
+    text = content.decode('utf-8')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def scan_file(file):
+    """
+    Database calls of a file as (category, line number, call), in the order
+    of the file, and the error if it could not be read.
+    """
+    try:
+        text = read_candidate(file)
+    except (OSError, UnicodeDecodeError) as e:
+        return [], str(e)
+    if text is None:
+        return [], None
+
+    calls = []
+    for line_number, line in enumerate(text.split('\n'), start=1):
+        if receiver_pattern.search(line) is None:
+            continue
+        for match in db_call_pattern.finditer(line):
+            object_name = match.group(1)
+            function_name = match.group(2)
+            if object_name.lower() not in database_object_names:
+                continue
+            if function_name not in categories:
+                continue
+            category = classify(function_name, match.group(3))
+            calls.append((category, line_number, match.group(0)))
+    return calls, None
+
+
+def write_results(out_dir, java_files, results):
+    """
+    Write the calls while they arrive, each output file being opened once.
+    """
+    detailed = {}
+    simple = {}
+    try:
+        for category in categories:
+            detailed[category] = open(
+                os.path.join(out_dir, "detailed", category + ".txt"),
+                "w",
+                encoding="utf-8",
+            )
+            simple[category] = open(
+                os.path.join(out_dir, "simple", category + ".txt"),
+                "w",
+                encoding="utf-8",
+            )
+        with open(
+            os.path.join(out_dir, "javaFilesWithSqlQuery.txt"), "w", encoding="utf-8"
+        ) as files_with_queries:
+            for file, (calls, error) in zip(java_files, results):
+                if error is not None:
+                    print(f"Erreur lors de la lecture du fichier {file}: {error}")
+                    continue
+                if calls:
+                    files_with_queries.write(file + "\n")
+                for category, line_number, call in calls:
+                    detailed[category].write(
+                        file + "|" + str(line_number) + "|" + call + "\n"
+                    )
+                    simple[category].write(call + "\n")
+    finally:
+        for f in [*detailed.values(), *simple.values()]:
+            f.close()
+
+    # all.txt is every simple file, one category after the other
+    with open(os.path.join(out_dir, "all.txt"), "w", encoding="utf-8") as f_all:
+        for category in categories:
+            simple_path = os.path.join(out_dir, "simple", category + ".txt")
+            with open(simple_path, "r", encoding="utf-8") as f_simple:
+                shutil.copyfileobj(f_simple, f_all)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Home made analyzer of the database calls of Java files"
+    )
+    parser.add_argument("path", nargs="?", default=default_path)
+    parser.add_argument("--output", default=default_out_dir)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of processes reading the files (default: number of CPUs)",
+    )
+    args = parser.parse_args()
+    out_dir = args.output
+
     print("Start analyze code")
-    java_files = get_java_files(path)
+    java_files = get_java_files(args.path)
 
     if os.path.exists(out_dir):
-        os.rmdir(out_dir)
+        shutil.rmtree(out_dir)
 
     print("Create out directory " + out_dir)
     os.mkdir(out_dir)
     os.mkdir(out_dir + "/detailed")
     os.mkdir(out_dir + "/simple")
 
-    for file in java_files:
-        try:
-            with open(file, 'r', encoding='utf-8') as f:
-                for line_number, line in enumerate(f, start=1):
-                    matches = db_call_pattern.finditer(line)
-                    for match in matches:
-                        all_data = match.group(0)
-                        object_name = match.group(1)
-                        function_name = match.group(2)
-                        data = match.group(3)
-
-                        if object_name.lower() not in database_object_names:
-                            continue
-
-                        if function_name not in java_calls:
-                            continue
-
-                        java_files_with_queries.append(file)
-
-                        if "create table" in data.lower():
-                            java_calls["createTable"].append({
-                                'line': line_number,
-                                'file': file,
-                                'complete_call': all_data
-                            })
-                        elif "alter table" in data.lower() or "alter_table" in data.lower():
-                            java_calls["alterTable"].append({
-                                'line': line_number,
-                                'file': file,
-                                'complete_call': all_data
-                            })
-                        elif function_name == "query":
-                            java_calls["select"].append({
-                                'line': line_number,
-                                'file': file,
-                                'complete_call': all_data
-                            })
-                        elif "select" in data.lower():
-                            java_calls["select"].append({
-                                'line': line_number,
-                                'file': file,
-                                'complete_call': all_data
-                            })
-                        elif "insert" in data.lower():
-                            java_calls["insert"].append({
-                                'line': line_number,
-                                'file': file,
-                                'complete_call': all_data
-                            })
-                        elif "update" in data.lower():
-                            java_calls["update"].append({
-                                'line': line_number,
-                                'file': file,
-                                'complete_call': all_data
-                            })
-                        elif "delete" in data.lower():
-                            java_calls["delete"].append({
-                                'line': line_number,
-                                'file': file,
-                                'complete_call': all_data
-                            })
-                        else:
-                            java_calls[function_name].append({
-                                'line': line_number,
-                                'file': file,
-                                'complete_call': all_data
-                            })
-
-                        # print(file.replace(path, "").replace("\\", "/"), "#" + str(line_number), all_data, function_name)
-
-        except Exception as e:
-            print(f"Erreur lors de la lecture du fichier {file_path}: {e}")
-
-    for function_name in java_calls.keys():
-        calls = java_calls[function_name]
-        f = open(os.path.join(out_dir + "/detailed", function_name + ".txt"), "a")
-        f_simple = open(os.path.join(out_dir + "/simple", function_name + ".txt"), "a")
-        f_all = open(os.path.join(out_dir, "all.txt"), "a")
-
-        for call in calls:
-            f.write(call["file"] + "|" + str(call["line"]) + "|" + call["complete_call"] + "\n")
-            f_simple.write(call["complete_call"] + "\n")
-            f_all.write(call["complete_call"] + "\n")
-
-        f_simple.close()
-        f_all.close()
-
-    java_files = open(os.path.join(out_dir, "javaFilesWithSqlQuery.txt"), "a")
-    for java_file_with_queries in list(dict.fromkeys(java_files_with_queries)):
-        java_files.write(java_file_with_queries + "\n")
-
-    java_files.close()
+    if args.jobs <= 1:
+        write_results(out_dir, java_files, map(scan_file, java_files))
+    else:
+        chunksize = max(1, len(java_files) // (args.jobs * 8))
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            # map() yields the results in the order of the files
+            results = executor.map(scan_file, java_files, chunksize=chunksize)
+            write_results(out_dir, java_files, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+import importlib
+import os
+import sys
+
+# The modules of the Report Generator, which is not an installed package
+ARCHIVE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "Report Generator", "archive"
+)
+
+
+def import_archive_module(name):
+    """
+    Import a module of the Report Generator. Its directory is only on
+    sys.path while the module and the modules it imports are loaded, the
+    path of the importer is left as it was.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    sys.path.insert(0, ARCHIVE_DIR)
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.remove(ARCHIVE_DIR)
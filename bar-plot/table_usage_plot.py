@@ -1,40 +1,130 @@
-import matplotlib.pyplot as plt
+import argparse
+import json
+from pathlib import Path
+
+import matplotlib
 import pandas as pd
-from bs4 import BeautifulSoup
 
-with open("../Report Generator/database_usage_report.html", "r", encoding="utf-8") as file:
-    soup = BeautifulSoup(file, "html.parser")
+# Written by the report generator next to its report
+DEFAULT_DATA = "../Report Generator/archive/database_usage_report.usage.json"
+DATA_SUFFIX = "usage.json"
+
+
+def load_reference_counts(path):
+    """
+    Reference counts of a report, one row per table and one column per
+    type of reference. Like the "Reference Summary" of the report, the
+    tables and types without any reference are left out.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    df = pd.DataFrame(
+        data["reference_counts"],
+        index=pd.Index(data["tables"], name="name"),
+        columns=data["reference_types"],
+    )
+    df = df.loc[df.sum(axis=1) > 0]
+    return df.loc[:, df.sum(axis=0) > 0]
+
+
+def report_name(data_file, root):
+    # reports/osm/report.usage.json -> osm-report, paged/usage.json -> paged
+    name = data_file.name[: -len(DATA_SUFFIX)].rstrip(".")
+    parts = [*data_file.relative_to(root).parent.parts, name]
+    return "-".join(part for part in parts if part) or data_file.parent.name
+
 
-h4s = soup.find_all("h4")
-data = []
+def find_data_files(paths):
+    """
+    (name, path) of the sidecars given, directories being searched for
+    them (e.g. the output of batch.py).
+    """
+    found = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            for data_file in sorted(path.rglob("*" + DATA_SUFFIX)):
+                found.append((report_name(data_file, path), data_file))
+        else:
+            found.append((report_name(path, path.parent), path))
+    return found
 
-for h4s in h4s:
-    if h4s.get_text().strip() != "Reference Summary":
-        continue
 
-    ref_summary = h4s.find_next("table")
-    if not ref_summary:
-        continue
-        
-    h3 = h4s.find_previous("h3")
-    table_name = h3.get_text().strip()
+def plot_reference_counts(plt, df, title):
+    ax = df.plot(kind="bar", stacked=True, figsize=(15, 8))
+    ax.set_title(title)
+    ax.set_xlabel("Tables")
+    ax.set_ylabel("Nombre de requêtes")
+    ax.legend(title="Légende", bbox_to_anchor=(1.05, 1), loc="upper left")
+    plt.tight_layout()
+    return ax.get_figure()
 
-    rows = ref_summary.find_all("tr")[1:]  # Ignorer l'en-tête
-    summary = {row.find_all("td")[0].get_text(): int(row.find_all("td")[1].get_text()) for row in rows}
-    summary["name"] = table_name
-    data.append(summary)
 
-df = pd.DataFrame(data).fillna(0)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Stacked bar chart of the query types per table of usage "
+        "reports"
+    )
+    parser.add_argument(
+        "data",
+        nargs="*",
+        default=[DEFAULT_DATA],
+        help="*usage.json files written with the reports, or directories "
+        "containing them (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--output", default="stats.png", help="chart of a single report"
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=Path("charts"),
+        help="charts of several reports, one per report and overview.png",
+    )
+    parser.add_argument(
+        "--no-show", action="store_true", help="only save the chart to a file"
+    )
+    args = parser.parse_args()
 
-stack_columns = [col for col in df.columns if col != "name"]
+    data_files = find_data_files(args.data)
+    if not data_files:
+        parser.error("no *" + DATA_SUFFIX + " file found")
+    batch = len(data_files) > 1 or any(Path(p).is_dir() for p in args.data)
+    if batch or args.no_show:
+        # No window, the charts are only saved
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
 
-df.set_index("name")[stack_columns].plot(kind="bar", stacked=True, figsize=(15, 8))
-plt.title("Graphique empilé du type de requête par table")
-plt.xlabel("Tables")
-plt.ylabel("Nombre de requêtes")
-plt.legend(title="Légende", bbox_to_anchor=(1.05, 1), loc='upper left')
-plt.tight_layout()
+    if not batch:
+        df = load_reference_counts(data_files[0][1])
+        if df.empty:
+            print(f"{data_files[0][1]}: no references")
+        else:
+            title = "Graphique empilé du type de requête par table"
+            plot_reference_counts(plt, df, title)
+            plt.savefig(args.output)
+            if not args.no_show:
+                plt.show()
+    else:
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+        totals = {}
+        for name, path in data_files:
+            df = load_reference_counts(path)
+            if df.empty:
+                print(f"{path}: no references")
+                continue
+            totals[name] = df.sum()
+            fig = plot_reference_counts(plt, df, f"Type de requête par table ({name})")
+            fig.savefig(args.output_dir / f"{name}.png")
+            plt.close(fig)
+            print(f"{args.output_dir / (name + '.png')}: {len(df)} tables")
 
-# Sauvegarder ou afficher
-plt.savefig("stats.png")
-plt.show()
+        # Every report with references in one chart, a bar per report
+        if not totals:
+            print("no references in any report")
+        else:
+            overview = pd.DataFrame(totals).T.fillna(0)
+            fig = plot_reference_counts(plt, overview, "Type de requête par rapport")
+            fig.axes[0].set_xlabel("Rapports")
+            fig.savefig(args.output_dir / "overview.png")
+            plt.close(fig)
+            print(f"{args.output_dir / 'overview.png'}: {len(overview)} reports")
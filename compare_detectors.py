@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import analyseCode
+from archive_modules import import_archive_module
+from sqlinspect_store import SQLInspectStore
+
+analysis = import_archive_module("analysis")
+profiling = import_archive_module("profiling")
+scan = import_archive_module("scan")
+sql_tokenizer = import_archive_module("sql_tokenizer")
+
+DETECTORS = ["analyseCode", "report_generator", "sqlinspect"]
+
+# Output files of analyseCode.py -> query type
+HOME_MADE_TYPES = {
+    "select": "SELECT",
+    "rawQuery": "SELECT",
+    "insert": "INSERT",
+    "update": "UPDATE",
+    "delete": "DELETE",
+    "createTable": "CREATE",
+    "alterTable": "ALTER",
+    "execSQL": "UNKNOWN",
+}
+
+
+def normalize_path(path):
+    """
+    Same key for the paths of a Java file given by any detector: forward
+    slashes, starting at its "src/" directory (the exports of SQLInspect
+    were made on another machine).
+    """
+    path = str(path).replace("\\", "/")
+    if path.startswith("src/"):
+        return path
+    index = path.find("/src/")
+    return path[index + 1 :] if index >= 0 else path
+
+
+def run_home_made(path):
+    java_files = analyseCode.get_java_files(path)
+    queries = []
+    for file in java_files:
+        calls, _ = analyseCode.scan_file(file)
+        for category, line_number, _ in calls:
+            queries.append((file, line_number, HOME_MADE_TYPES[category]))
+    return queries, len(java_files)
+
+
+def run_report_generator(path):
+    scans = scan.scan_project(Path(path))
+    symbols = analysis.build_symbol_table(scans)
+    create_table_statements, table_columns = analysis.find_create_table_statements(
+        scans, symbols
+    )
+    queries = [
+        (str(query["file"]), query["line"], query["type"])
+        for query, _ in analysis.iter_query_references(
+            scans, list(create_table_statements), symbols, table_columns
+        )
+    ]
+    return queries, len(scans)
+
+
+def run_sqlinspect(export_dir):
+    # The results were exported before, they are only loaded
+    store = SQLInspectStore.load(export_dir, use_cache=False)
+    columns = store.tables["queries"].columns
+    queries = [
+        (file, line, sql_tokenizer.analyze_sql(value).type or "UNKNOWN")
+        for file, line, value in zip(columns["file"], columns["line"], columns["value"])
+    ]
+    return queries, len(set(columns["file"]))
+
+
+def _timed(name, source):
+    # Runs in a process of its own, its peak memory is the detector's
+    run = {
+        "analyseCode": run_home_made,
+        "report_generator": run_report_generator,
+        "sqlinspect": run_sqlinspect,
+    }[name]
+    start = time.perf_counter()
+    queries, files = run(source)
+    seconds = time.perf_counter() - start
+    return queries, files, seconds, profiling.peak_rss_kb()
+
+
+def run_detector(name, source):
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        queries, files, seconds, peak = executor.submit(_timed, name, source).result()
+    return {
+        "queries": queries,
+        "files": files,
+        "seconds": seconds,
+        "files_per_second": files / seconds if seconds else None,
+        "peak_rss_kb": peak,
+    }
+
+
+def index_locations(queries, prefix):
+    """
+    {(normalized path, line): type} of the queries of the files under
+    prefix, the first type found for a location being kept.
+    """
+    index = {}
+    for file, line, query_type in queries:
+        key = (normalize_path(file), int(line))
+        if key[0].startswith(prefix):
+            index.setdefault(key, query_type)
+    return index
+
+
+def match_locations(found, expected, tolerance=0):
+    """
+    {found location: expected location} of the locations found that are
+    expected, looked up in the hash index of the expected ones. With a
+    tolerance, the closest expected location of the same file at most
+    `tolerance` lines away is taken, each one matching once.
+    """
+    matches = {}
+    used = set()
+    for key in sorted(found):
+        path, line = key
+        for offset in range(tolerance + 1):
+            candidates = [(path, line - offset), (path, line + offset)]
+            match = next(
+                (c for c in candidates if c in expected and c not in used), None
+            )
+            if match is not None:
+                matches[key] = match
+                used.add(match)
+                break
+    return matches
+
+
+def score(found, expected, tolerance=0):
+    """
+    Precision and recall of the locations found against the expected ones,
+    for every query type and for all of them ("ALL", type ignored).
+    """
+    matches = match_locations(found, expected, tolerance)
+    found_types = Counter(found.values())
+    expected_types = Counter(expected.values())
+    matched_types = Counter(
+        query_type
+        for key, query_type in found.items()
+        if key in matches and expected[matches[key]] == query_type
+    )
+
+    def ratios(true_positives, found_count, expected_count):
+        return {
+            "found": found_count,
+            "expected": expected_count,
+            "matched": true_positives,
+            "precision": true_positives / found_count if found_count else None,
+            "recall": true_positives / expected_count if expected_count else None,
+        }
+
+    scores = {"ALL": ratios(len(matches), len(found), len(expected))}
+    for query_type in sorted(set(found_types) | set(expected_types)):
+        scores[query_type] = ratios(
+            matched_types[query_type],
+            found_types[query_type],
+            expected_types[query_type],
+        )
+    return scores
+
+
+def _percent(ratio):
+    return "-" if ratio is None else f"{ratio * 100:.1f}%"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compare the database calls found by analyseCode.py, the "
+        "Report Generator and SQLInspect"
+    )
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=analyseCode.default_path,
+        help="Java sources analyzed by the in-repo detectors "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--export-dir",
+        default="export SQLInspect",
+        help="SQLInspect exports of the same sources (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--reference",
+        choices=DETECTORS,
+        default="sqlinspect",
+        help="detector whose results are taken as the truth (default: "
+        "%(default)s)",
+    )
+    parser.add_argument(
+        "--line-tolerance",
+        type=int,
+        default=0,
+        metavar="N",
+        help="match calls at most N lines apart in the same file, when the "
+        "sources differ a little (default: %(default)s)",
+    )
+    parser.add_argument("--output", help="write the comparison to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for name in DETECTORS:
+        source = args.export_dir if name == "sqlinspect" else args.path
+        results[name] = run_detector(name, source)
+        result = results[name]
+        print(
+            f"{name}: {len(result['queries'])} queries in {result['files']} files, "
+            f"{result['seconds']:.2f}s ({result['files_per_second']:.0f} files/s), "
+            f"peak RSS {result['peak_rss_kb']} KiB"
+        )
+
+    # Only the files under the analyzed path are compared, all of them when
+    # it is above the sources
+    prefix = normalize_path(os.path.abspath(args.path)).rstrip("/")
+    if not prefix.startswith("src"):
+        prefix = ""
+    indexes = {
+        name: index_locations(result["queries"], prefix)
+        for name, result in results.items()
+    }
+    expected = indexes[args.reference]
+    comparison = {
+        "reference": args.reference,
+        "prefix": prefix,
+        "line_tolerance": args.line_tolerance,
+        "detectors": {},
+    }
+    for name in DETECTORS:
+        result = results[name]
+        comparison["detectors"][name] = {
+            "files": result["files"],
+            "seconds": result["seconds"],
+            "files_per_second": result["files_per_second"],
+            "peak_rss_kb": result["peak_rss_kb"],
+            "locations": len(indexes[name]),
+            "scores": score(indexes[name], expected, args.line_tolerance),
+        }
+
+    print(f"\nAgainst {args.reference}, {len(expected)} locations under {prefix}:")
+    for name in DETECTORS:
+        if name == args.reference:
+            continue
+        print(f"\n{name}:")
+        print(
+            f"  {'type':<10}{'found':>7}{'expected':>10}{'precision':>11}"
+            f"{'recall':>9}"
+        )
+        for query_type, s in comparison["detectors"][name]["scores"].items():
+            print(
+                f"  {query_type:<10}{s['found']:>7}{s['expected']:>10}"
+                f"{_percent(s['precision']):>11}{_percent(s['recall']):>9}"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(comparison, f, indent=2)
+        print(f"\nComparison written to {args.output}")
@@ -1,31 +1,152 @@
+import argparse
+import os
+import re
 import xml.etree.ElementTree as elementTree
-import sys
 
-if __name__ == '__main__':
-    args_count = len(sys.argv)
-    if args_count <= 1:
-        raise Exception("Invalid xml file path")
 
-    xml_path = sys.argv[1]
+class Bucket:
+    """
+    One output file of queries, opened on first use and kept open until
+    the end of the pass.
+    """
 
-    if not xml_path.endswith(".xml"):
-        raise Exception("Invalid file type (only .xml supported)")
+    def __init__(self, name, matches, output_dir):
+        self.name = name
+        self.matches = matches
+        self.path = os.path.join(output_dir, name + ".sql")
+        self.count = 0
+        self.file = None
 
-    search_filter = sys.argv[2] if args_count >= 3 else None
+    def open(self):
+        if self.file is None:
+            self.file = open(self.path, "w", encoding="utf-8")
 
-    tree = elementTree.parse(xml_path)
-    root = tree.getroot()
+    def add(self, text):
+        self.file.write(text + "\n")
+        self.count += 1
 
-    result = root.findall(".//*Value")
-    if len(result) == 0:
-        print("No matching")
-    else:
-        output_file = open(search_filter.lower() + ".sql", "w")
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def keyword_bucket(keyword, output_dir):
+    keyword = keyword.lower()
+    return Bucket(keyword, lambda text, lowered: keyword in lowered, output_dir)
+
+
+def regex_bucket(definition, output_dir):
+    name, sep, pattern = definition.partition("=")
+    if not sep or not name:
+        raise Exception("Invalid regex filter (NAME=PATTERN expected): " + definition)
+    regex = re.compile(pattern)
+    return Bucket(
+        name, lambda text, lowered: regex.search(text) is not None, output_dir
+    )
+
+
+def unique_bucket(name, output_dir):
+    seen = set()
+
+    def matches(text, lowered):
+        if text in seen:
+            return False
+        seen.add(text)
+        return True
+
+    return Bucket(name, matches, output_dir)
 
-        for value in result:
-            text = value.text
-            if search_filter is None or search_filter.lower() in text.lower():
-                print(value.text)
-                output_file.write(value.text + "\n")
 
-        output_file.close()
\ No newline at end of file
+def iter_values(xml_path):
+    """
+    Text of every Value element below the top level (same as findall of
+    ".//*Value" on the root), reading the file once. Elements are dropped
+    once read, so memory does not grow with the size of the file.
+    """
+    depth = 0
+    root = None
+    for event, elem in elementTree.iterparse(xml_path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if elem.tag == "Value" and depth >= 2:
+            yield elem.text or ""
+        if depth == 1:
+            # A top level element (a Query) is complete
+            root.clear()
+
+
+def bucket_queries(xml_path, buckets, echo=False):
+    """
+    Write every query to the buckets it matches, in a single pass. Returns
+    False if the file has no query at all, in which case nothing is written.
+    """
+    found = False
+    try:
+        for text in iter_values(xml_path):
+            if not found:
+                found = True
+                for bucket in buckets:
+                    bucket.open()
+            lowered = text.lower()
+            for bucket in buckets:
+                if bucket.matches(text, lowered):
+                    bucket.add(text)
+                    if echo:
+                        print(text)
+    finally:
+        for bucket in buckets:
+            bucket.close()
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Sort the queries of a SQLInspect export into .sql files"
+    )
+    parser.add_argument("xml_path", help="SQLInspect queries export (.xml)")
+    parser.add_argument(
+        "keywords",
+        nargs="*",
+        help="one <keyword>.sql file per keyword, with the queries containing "
+        "it (case insensitive)",
+    )
+    parser.add_argument(
+        "--regex",
+        action="append",
+        default=[],
+        metavar="NAME=PATTERN",
+        help="NAME.sql with the queries matching the regular expression",
+    )
+    parser.add_argument(
+        "--unique",
+        nargs="?",
+        const="distinct",
+        metavar="NAME",
+        help="NAME.sql (default: distinct.sql) with every query once",
+    )
+    parser.add_argument(
+        "--output-dir", default=".", help="where the .sql files are written"
+    )
+    args = parser.parse_args()
+
+    if not args.xml_path.endswith(".xml"):
+        raise Exception("Invalid file type (only .xml supported)")
+
+    buckets = [keyword_bucket(keyword, args.output_dir) for keyword in args.keywords]
+    buckets += [regex_bucket(regex, args.output_dir) for regex in args.regex]
+    if args.unique:
+        buckets.append(unique_bucket(args.unique, args.output_dir))
+    if not buckets:
+        buckets.append(Bucket("all", lambda text, lowered: True, args.output_dir))
+
+    # With a single keyword, the queries are also printed as they used to be
+    echo = len(buckets) == 1 and len(args.keywords) == 1
+    if not bucket_queries(args.xml_path, buckets, echo):
+        print("No matching")
+    elif not echo:
+        for bucket in buckets:
+            print(f"{bucket.path}: {bucket.count} queries")
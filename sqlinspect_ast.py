@@ -0,0 +1,296 @@
+import argparse
+import json
+import re
+import sys
+import time
+from collections import defaultdict
+
+from sqlinspect_store import ColumnTable
+
+NODE_FIELDS = ("id", "type", "name", "parent", "key", "start", "end", "attributes")
+
+# Node types of the schema, enough to look up tables, columns and their types
+SCHEMA_TYPES = {
+    "SQLRoot",
+    "Database",
+    "Schema",
+    "Table",
+    "View",
+    "Column",
+    "AnyType",
+    "StringType",
+    "NumericType",
+}
+
+STRING = rb'"([^"\\]*(?:\\.[^"\\]*)*)"'
+SCALAR = rb"(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)"
+# Commas are skipped, the nesting is enough to read the values in order. A
+# key comes with its colon, and with its value when it is not a container.
+TOKEN_PATTERN = re.compile(
+    rb"[\s,]*(?:([{}\[\]])|"
+    + STRING
+    + rb"(?:\s*:\s*(?:"
+    + STRING
+    + rb"|"
+    + SCALAR
+    + rb")|(\s*:))?|"
+    + SCALAR
+    + rb")"
+)
+LITERALS = {b"true": True, b"false": False, b"null": None}
+
+
+def _string(raw):
+    if b"\\" in raw:
+        return json.loads(b'"' + raw + b'"')
+    return raw.decode("utf-8")
+
+
+def _scalar(raw):
+    if raw in LITERALS:
+        return LITERALS[raw]
+    if raw.strip(b"-").isdigit():
+        return int(raw)
+    return float(raw)
+
+
+def _token(match, base):
+    # (kind, value, offset) of a match of TOKEN_PATTERN, see iter_tokens.
+    # The last group matched tells the kind of token.
+    group = match.lastindex
+    if group == 1:
+        return match.group(1).decode(), None, base + match.start(1)
+    if group == 6:
+        return "value", _scalar(match.group(6)), base + match.start(6)
+    key = sys.intern(_string(match.group(2)))
+    offset = base + match.start(2) - 1
+    if group == 3:
+        return "member", (key, _string(match.group(3))), offset
+    if group == 4:
+        return "member", (key, _scalar(match.group(4))), offset
+    if group == 5:
+        return "key", key, offset
+    return "value", key, offset
+
+
+def iter_tokens(f, chunk_size=1 << 16):
+    """
+    (kind, value, offset) of every JSON token of a binary file, read chunk
+    by chunk, offset being the position of the token in the file. kind is
+    "{", "}", "[" or "]" (value None), "key" for a key followed by a
+    container, "member" for a key with a string or scalar value (value is
+    (key, value)), or "value" for a string or scalar in an array.
+
+    Only the end of a chunk after its last complete token is kept for the
+    next one, whatever the layout of the file (e.g. a single line).
+    """
+    rest = b""
+    base = 0  # offset of rest in the file
+    while True:
+        chunk = f.read(chunk_size)
+        buffer = rest + chunk
+        # The last token matched may go on in the next chunk (a longer
+        # number, the value of a key...), it is only complete once another
+        # token follows it
+        pending = None
+        pos = 0
+        for match in TOKEN_PATTERN.finditer(buffer):
+            if match.start() != pos:
+                break
+            if pending is not None:
+                yield _token(pending, base)
+            pending = match
+            pos = match.end()
+        if not chunk:
+            if pending is not None:
+                yield _token(pending, base)
+            if buffer[pos:].strip(b" \t\r\n,"):
+                raise ValueError(f"Invalid JSON at offset {base + pos}")
+            return
+        cut = pending.start() if pending is not None else 0
+        rest = buffer[cut:]
+        base += cut
+
+
+def _first_wins(pairs):
+    # The dump repeats "type" in some objects ("Column", then the id of the
+    # column type), the first value is the type of the node
+    result = {}
+    for key, value in pairs:
+        result.setdefault(key, value)
+    return result
+
+
+class _Frame:
+    __slots__ = ("is_object", "start", "member", "key", "attributes", "pending")
+
+    def __init__(self, is_object, start, member):
+        self.is_object = is_object
+        self.start = start
+        self.member = member  # key of the closest object above
+        self.key = None  # member being read, in an object
+        self.attributes = {}  # scalar members, in an object
+        self.pending = []  # rows of the nodes below, waiting for their parent
+
+
+class ASTIndex:
+    """
+    Flat table of the nodes (objects with a "type" and an "id") of a
+    SQLInspect AST dump, with their scalar members, their parent and their
+    position in the file. The nested structure is never built: subtree()
+    reads one node again from the file when its full content is needed.
+    """
+
+    def __init__(self, path, nodes):
+        self.path = path
+        self.nodes = nodes
+        self.by_id = {}
+        self.by_type = defaultdict(list)
+        self.children_of = defaultdict(list)
+        columns = nodes.columns
+        for i in range(len(nodes)):
+            self.by_id[columns["id"][i]] = i
+            self.by_type[columns["type"][i]].append(i)
+            self.children_of[columns["parent"][i]].append(i)
+
+    @classmethod
+    def build(cls, path, types=None):
+        """
+        Index the nodes of the file, only the ones of the given types if
+        any. The parent of a node is then the closest indexed ancestor.
+        """
+        nodes = ColumnTable(NODE_FIELDS)
+        stack = [_Frame(False, 0, None)]
+        with open(path, "rb") as f:
+            for kind, value, offset in iter_tokens(f):
+                frame = stack[-1]
+                if kind in ("{", "["):
+                    member = frame.key if frame.is_object else frame.member
+                    stack.append(_Frame(kind == "{", offset, member))
+                elif kind in ("}", "]"):
+                    stack.pop()
+                    parent_frame = stack[-1]
+                    if (
+                        frame.is_object
+                        and isinstance(frame.attributes.get("id"), int)
+                        and isinstance(frame.attributes.get("type"), str)
+                        and (types is None or frame.attributes["type"] in types)
+                    ):
+                        row = len(nodes)
+                        attributes = frame.attributes
+                        nodes.append(
+                            attributes["id"],
+                            attributes["type"],
+                            attributes.get("name"),
+                            None,
+                            frame.member,
+                            frame.start,
+                            offset + 1,
+                            attributes,
+                        )
+                        for child in frame.pending:
+                            nodes.columns["parent"][child] = attributes["id"]
+                        parent_frame.pending.append(row)
+                    else:
+                        parent_frame.pending.extend(frame.pending)
+                    if parent_frame.is_object:
+                        parent_frame.key = None
+                elif kind == "key":
+                    frame.key = value
+                elif kind == "member":
+                    frame.attributes.setdefault(*value)
+        return cls(path, nodes)
+
+    def node(self, node_id):
+        return self.nodes.row(self.by_id[node_id])
+
+    def find(self, node_type, name=None):
+        """
+        Nodes of a type, only the ones with the name (case insensitive) if any.
+        """
+        rows = self.by_type.get(node_type, [])
+        if name is not None:
+            names = self.nodes.columns["name"]
+            rows = [i for i in rows if (names[i] or "").lower() == name.lower()]
+        return self.nodes.rows(rows)
+
+    def children(self, node_id, node_type=None):
+        rows = self.children_of.get(node_id, [])
+        if node_type is not None:
+            types = self.nodes.columns["type"]
+            rows = [i for i in rows if types[i] == node_type]
+        return self.nodes.rows(rows)
+
+    def parent(self, node_id):
+        parent_id = self.nodes.columns["parent"][self.by_id[node_id]]
+        return None if parent_id is None else self.node(parent_id)
+
+    def columns(self, table_name):
+        """
+        Column nodes of the tables with this name.
+        """
+        return [
+            column
+            for table in self.find("Table", table_name)
+            for column in self.children(table["id"], "Column")
+        ]
+
+    def column_type(self, column):
+        """
+        Type node of a column node: the "_type" member is either the type
+        itself, or the id of a type already written before.
+        """
+        type_id = column["attributes"].get("_type")
+        if type_id in self.by_id:
+            return self.node(type_id)
+        for child in self.children(column["id"]):
+            if child["key"] == "_type":
+                return child
+        return None
+
+    def subtree(self, node_id):
+        """
+        Full content of a node as nested dicts, read from the file.
+        """
+        row = self.by_id[node_id]
+        start = self.nodes.columns["start"][row]
+        end = self.nodes.columns["end"][row]
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return json.loads(f.read(end - start), object_pairs_hook=_first_wins)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Look up the nodes of a SQLInspect AST dump"
+    )
+    parser.add_argument("ast_path", help="AST dump of SQLInspect (AST-*.json)")
+    parser.add_argument(
+        "--schema-only",
+        action="store_true",
+        help="only index the schema (tables, columns and their types)",
+    )
+    parser.add_argument("--type", help="list the nodes of this type")
+    parser.add_argument("--columns", metavar="TABLE", help="columns of a table")
+    parser.add_argument(
+        "--show", type=int, metavar="ID", help="print the subtree of a node"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = ASTIndex.build(args.ast_path, SCHEMA_TYPES if args.schema_only else None)
+    print(
+        f"Indexed {len(index.nodes)} nodes of {len(index.by_type)} types in "
+        f"{(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+
+    if args.type:
+        for node in index.find(args.type):
+            print(f"  {node['id']} {node['name'] or ''} (parent {node['parent']})")
+    if args.columns:
+        for column in index.columns(args.columns):
+            column_type = index.column_type(column)
+            type_name = column_type["type"] if column_type else "?"
+            print(f"  {column['id']} {column['name']} {type_name}")
+    if args.show is not None:
+        print(json.dumps(index.subtree(args.show), indent=2))
@@ -0,0 +1,370 @@
+import argparse
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as elementTree
+from collections import defaultdict
+
+from archive_modules import import_archive_module
+
+# Queries are fingerprinted like the ones of the Report Generator
+sql_tokenizer = import_archive_module("sql_tokenizer")
+
+# Bump whenever the layout of the tables changes, older caches are dropped
+CACHE_VERSION = 1
+
+TABLE_FIELDS = {
+    "queries": (
+        "id",
+        "file",
+        "line",
+        "value",
+        "exec_string",
+        "exec_class",
+        "exec_package",
+        "hotspot_finder",
+    ),
+    "table_accesses": ("statement", "file", "line", "table"),
+    "column_accesses": ("statement", "file", "line", "table", "column"),
+    "metrics": ("statement", "file", "line", "name", "value"),
+    "smells": ("kind", "file", "line", "certainty", "message"),
+}
+
+# Export file of every table, after the application name prefix
+EXPORT_FILES = {
+    "queries": "-queries.xml",
+    "table_accesses": "-tableAccess.xml",
+    "column_accesses": "-tableAccess.xml",
+    "metrics": "-SQLMetrics.xml",
+    "smells": "-smells.xml",
+}
+
+
+class ColumnTable:
+    """
+    Rows stored column by column, one list per field. Row ids are the
+    positions in the lists.
+    """
+
+    def __init__(self, fields, columns=None):
+        self.fields = fields
+        self.columns = columns or {field: [] for field in fields}
+
+    def append(self, *values):
+        for field, value in zip(self.fields, values):
+            self.columns[field].append(value)
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]])
+
+    def row(self, i):
+        return {field: self.columns[field][i] for field in self.fields}
+
+    def rows(self, ids):
+        return [self.row(i) for i in ids]
+
+
+def _iter_elements(xml_path, tag):
+    # Every complete element with the tag, dropped once used
+    for _, elem in elementTree.iterparse(xml_path, events=("end",)):
+        if elem.tag == tag:
+            yield elem
+            elem.clear()
+
+
+def _int(text):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return text
+
+
+def _split_name(qualified):
+    # DB.SCH.table.column -> (table, column); DB.SCH.table -> (table, None)
+    parts = qualified.split(".")
+    if len(parts) >= 4:
+        return parts[-2], parts[-1]
+    return parts[-1], None
+
+
+def load_queries(path, table):
+    for query in _iter_elements(path, "Query"):
+        table.append(
+            _int(query.get("id")),
+            sys.intern(query.findtext("ExecFile", "")),
+            _int(query.findtext("ExecLine")),
+            query.findtext("Value", ""),
+            query.findtext("ExecString", ""),
+            sys.intern(query.findtext("ExecClass", "")),
+            sys.intern(query.findtext("ExecPackage", "")),
+            sys.intern(query.findtext("HotspotFinder", "")),
+        )
+
+
+def load_table_accesses(path, tables, columns):
+    for statement in _iter_elements(path, "Statement"):
+        statement_id = _int(statement.get("Id"))
+        file = sys.intern(statement.get("Path", ""))
+        line = _int(statement.get("Line"))
+        for table in statement.iter("Table"):
+            name = _split_name(table.get("name", ""))[0]
+            tables.append(statement_id, file, line, sys.intern(name))
+        for column in statement.iter("Column"):
+            name, column_name = _split_name(column.get("name", ""))
+            columns.append(
+                statement_id, file, line, sys.intern(name), sys.intern(column_name)
+            )
+
+
+def load_metrics(path, table):
+    for statement in _iter_elements(path, "Statement"):
+        statement_id = _int(statement.get("Id"))
+        file = sys.intern(statement.get("Path", ""))
+        line = _int(statement.get("Line"))
+        for metric in statement.iter("Metric"):
+            table.append(
+                statement_id,
+                file,
+                line,
+                sys.intern(metric.get("name", "")),
+                _int(metric.get("value")),
+            )
+
+
+def load_smells(path, table):
+    for smell in _iter_elements(path, "Smell"):
+        table.append(
+            sys.intern(smell.findtext("Kind", "")),
+            sys.intern(smell.findtext("File", "")),
+            _int(smell.findtext("Line")),
+            sys.intern(smell.findtext("Certainty", "")),
+            smell.findtext("Message", ""),
+        )
+
+
+def find_prefix(export_dir):
+    # Application name of the export, "Splash" for Splash-queries.xml
+    for name in sorted(os.listdir(export_dir)):
+        if name.endswith(EXPORT_FILES["queries"]):
+            return name[: -len(EXPORT_FILES["queries"])]
+    raise Exception("No *-queries.xml file in " + str(export_dir))
+
+
+class SQLInspectStore:
+    """
+    All the XML exports of SQLInspect for one application, joined by
+    (file, line) and indexed by (file, line), table and column.
+
+    load() parses each export once and keeps a JSON cache of the tables
+    next to them, used as long as the exports do not change.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self._build_indexes()
+
+    def _build_indexes(self):
+        self.by_location = {}
+        for name, table in self.tables.items():
+            index = defaultdict(list)
+            locations = zip(table.columns["file"], table.columns["line"])
+            for i, location in enumerate(locations):
+                index[location].append(i)
+            self.by_location[name] = index
+
+        self.by_table = {}
+        for name in ("table_accesses", "column_accesses"):
+            index = defaultdict(list)
+            for i, table_name in enumerate(self.tables[name].columns["table"]):
+                index[table_name.lower()].append(i)
+            self.by_table[name] = index
+
+        self.by_column = defaultdict(list)
+        columns = self.tables["column_accesses"].columns
+        for i, key in enumerate(zip(columns["table"], columns["column"])):
+            self.by_column[(key[0].lower(), key[1].lower())].append(i)
+
+    @classmethod
+    def parse(cls, export_dir, prefix):
+        tables = {name: ColumnTable(fields) for name, fields in TABLE_FIELDS.items()}
+        paths = {
+            name: os.path.join(export_dir, prefix + suffix)
+            for name, suffix in EXPORT_FILES.items()
+        }
+        # A missing export gives an empty table
+        if os.path.exists(paths["queries"]):
+            load_queries(paths["queries"], tables["queries"])
+        if os.path.exists(paths["table_accesses"]):
+            load_table_accesses(
+                paths["table_accesses"],
+                tables["table_accesses"],
+                tables["column_accesses"],
+            )
+        if os.path.exists(paths["metrics"]):
+            load_metrics(paths["metrics"], tables["metrics"])
+        if os.path.exists(paths["smells"]):
+            load_smells(paths["smells"], tables["smells"])
+        return cls(tables)
+
+    @classmethod
+    def load(cls, export_dir, prefix=None, cache_path=None, use_cache=True):
+        if prefix is None:
+            prefix = find_prefix(export_dir)
+        if cache_path is None:
+            cache_path = os.path.join(export_dir, "." + prefix + "-store.json")
+        sources = _source_stats(export_dir, prefix)
+
+        if use_cache and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = None  # a broken cache is the same as no cache
+            if (
+                data is not None
+                and data.get("version") == CACHE_VERSION
+                and data.get("sources") == sources
+            ):
+                return cls(
+                    {
+                        name: ColumnTable(TABLE_FIELDS[name], columns)
+                        for name, columns in data["tables"].items()
+                    }
+                )
+
+        store = cls.parse(export_dir, prefix)
+        if use_cache:
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "version": CACHE_VERSION,
+                        "sources": sources,
+                        "tables": {
+                            name: table.columns
+                            for name, table in store.tables.items()
+                        },
+                    },
+                    f,
+                )
+            os.replace(tmp_path, cache_path)
+        return store
+
+    def at(self, name, file, line):
+        """
+        Rows of a table about the statement at (file, line).
+        """
+        return self.tables[name].rows(self.by_location[name].get((file, line), []))
+
+    def statements_touching(self, table, column=None):
+        """
+        (file, line) of the statements using a table, or one of its columns.
+        """
+        if column is None:
+            name = "table_accesses"
+            ids = self.by_table[name].get(table.lower(), [])
+        else:
+            name = "column_accesses"
+            ids = self.by_column.get((table.lower(), column.lower()), [])
+        columns = self.tables[name].columns
+        return sorted({(columns["file"][i], columns["line"][i]) for i in ids})
+
+    def joined(self, name, table, column=None):
+        """
+        Rows of a table (smells, metrics, queries...) about the statements
+        using a table or one of its columns.
+        """
+        ids = []
+        index = self.by_location[name]
+        for location in self.statements_touching(table, column):
+            ids.extend(index.get(location, []))
+        return self.tables[name].rows(ids)
+
+    def query_groups(self):
+        """
+        The queries grouped by the fingerprint of their statement, most call
+        sites first: {"fingerprint", "statement", "count", "sites"}, sites
+        being the (file, line) of every query.
+        """
+        groups = {}
+        columns = self.tables["queries"].columns
+        for value, file, line in zip(
+            columns["value"], columns["file"], columns["line"]
+        ):
+            statement = sql_tokenizer.canonical_sql(value)
+            key = sql_tokenizer.fingerprint(statement)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    "fingerprint": key,
+                    "statement": statement,
+                    "count": 0,
+                    "sites": [],
+                }
+            group["count"] += 1
+            group["sites"].append((file, line))
+        return sorted(groups.values(), key=lambda group: -group["count"])
+
+
+def _source_stats(export_dir, prefix):
+    stats = {}
+    for suffix in sorted(set(EXPORT_FILES.values())):
+        path = os.path.join(export_dir, prefix + suffix)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stats[prefix + suffix] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Query the SQLInspect exports of an application"
+    )
+    parser.add_argument("export_dir", help="directory of the SQLInspect exports")
+    parser.add_argument(
+        "--table", help="show the rows about the statements using this table"
+    )
+    parser.add_argument("--column", help="restrict --table to one of its columns")
+    parser.add_argument(
+        "--show",
+        nargs="+",
+        default=["smells"],
+        choices=sorted(TABLE_FIELDS),
+        help="tables to show (default: smells)",
+    )
+    parser.add_argument(
+        "--hotspots",
+        type=int,
+        metavar="N",
+        help="show the N statements with the most queries",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="parse the exports again"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = SQLInspectStore.load(args.export_dir, use_cache=not args.no_cache)
+    counts = ", ".join(f"{len(table)} {name}" for name, table in store.tables.items())
+    print(f"Loaded in {(time.perf_counter() - start) * 1000:.1f} ms: {counts}")
+
+    if args.table:
+        start = time.perf_counter()
+        results = {
+            name: store.joined(name, args.table, args.column) for name in args.show
+        }
+        elapsed = (time.perf_counter() - start) * 1000
+        for name, rows in results.items():
+            print(f"\n{name} ({len(rows)}):")
+            for row in rows:
+                fields = [field for field in TABLE_FIELDS[name] if field != "file"]
+                print("  " + " | ".join(str(row[field]) for field in fields))
+        print(f"\nAnswered in {elapsed:.2f} ms")
+
+    if args.hotspots:
+        groups = store.query_groups()
+        print(f"\n{len(groups)} distinct statements:")
+        for group in groups[: args.hotspots]:
+            files = len({file for file, _ in group["sites"]})
+            print(f"  {group['count']:5} queries, {files} files: {group['statement']}")